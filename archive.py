@@ -0,0 +1,327 @@
+"""
+Append-only match archives.
+
+The league files only keep each player's last HISTORY_LIMIT matches;
+every match ever played also goes into an archive file of fixed-size
+binary records, so record `n` lives at byte `n * itemsize` and can be
+read without touching the rest of the file. An in-memory per-player
+index (record numbers, oldest first) is built from one numpy pass over
+the file when it is opened, so a /history page is a handful of seeks.
+
+Archives are attached to a LeagueStore with `add_archive()`, loaded with
+it, and see every op after it is journaled, including ops replayed from
+the journal on startup (those already archived are skipped by seq).
+"""
+import os
+import time
+from array import array
+from bisect import bisect_left
+from collections import deque
+
+import numpy as np
+
+from elo import HISTORY_LIMIT
+from perf import stage
+
+
+SINGLES_ARCHIVE = 'data.archive'
+DOUBLES_ARCHIVE = 'doubles_data.archive'
+
+SINGLES_RECORD = np.dtype([
+    ('seq',      '<u8'),   # store seq of the op that recorded it
+    ('time',     '<u4'),   # unix seconds
+    ('flags',    '<u2'),
+    ('winner',   '<u8'),
+    ('loser',    '<u8'),
+    ('score_w',  '<i4'),
+    ('score_l',  '<i4'),
+    ('w_before', '<i4'),
+    ('l_before', '<i4'),
+    ('w_after',  '<i4'),
+    ('l_after',  '<i4'),
+])
+
+DOUBLES_RECORD = np.dtype([
+    ('seq',      '<u8'),
+    ('time',     '<u4'),
+    ('flags',    '<u2'),
+    ('a1',       '<u8'),   # a1/a2 won
+    ('a2',       '<u8'),
+    ('b1',       '<u8'),
+    ('b2',       '<u8'),
+    ('score_w',  '<i4'),
+    ('score_l',  '<i4'),
+    ('a1_after', '<i4'),
+    ('a2_after', '<i4'),
+    ('b1_after', '<i4'),
+    ('b2_after', '<i4'),
+    ('delta_win',  '<i4'),
+    ('delta_loss', '<i4'),
+])
+
+LOGGED = 1   # flag: entered with /loghistory, no rating change was computed
+VOIDED = 2   # flag: removed with /voidmatch; kept in the file, dropped from the index
+EDITED = 4   # flag: corrected with /editmatch
+
+
+class MatchArchive:
+    """
+    Fixed-size records of `dtype` plus a {uid: array of record numbers}
+    index over the `players` fields. Subclasses say which store ops
+    become records (`from_op`) and how a record reads as history.
+    """
+
+    dtype = None
+    players = ()
+    hot = 0     # newest records per player also kept in memory (see `recent`)
+
+    def __init__(self, path):
+        self.path = path
+        self.size = self.dtype.itemsize
+        self.index = {}
+        self.count = 0
+        self.last_seq = 0
+        self.recent = {}
+        self.last_time = {}     # uid -> unix time of their latest archived match
+        self._f = None
+
+    def load(self):
+        """Open the file and index it; LeagueStore.load() calls this."""
+        if self._f is not None:
+            self._f.close()
+        self.index = {}
+        self.recent = {}
+        self.last_time = {}
+        self.count = 0
+        self.last_seq = 0
+        self._trim_torn_tail()
+        self._build()
+        self._f = open(self.path, 'a+b')
+
+    def _trim_torn_tail(self):
+        if os.path.exists(self.path):
+            size = os.path.getsize(self.path)
+            if size % self.size:
+                with open(self.path, 'r+b') as f:
+                    f.truncate(size - size % self.size)
+
+    def _build(self):
+        if not os.path.exists(self.path):
+            return
+        recs = np.fromfile(self.path, dtype=self.dtype)
+        self.count = len(recs)
+        if not self.count:
+            return
+        self.last_seq = int(recs['seq'][-1])
+
+        live = np.flatnonzero((recs['flags'] & VOIDED) == 0).astype(np.uint64)
+        uids = np.concatenate([recs[f][live] for f in self.players])
+        nums = np.tile(live, len(self.players))
+        order = np.lexsort((nums, uids))        # by player, then oldest first
+        uids, nums = uids[order], nums[order]
+        starts = np.flatnonzero(np.r_[True, uids[1:] != uids[:-1]])
+        ends = np.r_[starts[1:], len(uids)]
+        last = recs['time'][nums[ends - 1]].tolist()
+        for uid, s, e, t in zip(uids[starts].tolist(), starts.tolist(), ends.tolist(), last):
+            self.index[uid] = array('Q', nums[s:e].tobytes())
+            self.last_time[uid] = t
+            if self.hot:
+                self.recent[uid] = deque(recs[nums[max(s, e - self.hot):e]], maxlen=self.hot)
+
+    def from_op(self, op, args, result):
+        """Record fields for a store op, or None if the op isn't archived."""
+        return None
+
+    def record(self, seq, op, args, result, replay=False):
+        if replay and seq <= self.last_seq:
+            return
+        fields = self.from_op(op, args, result)
+        if fields is None:
+            return
+        rec = np.zeros(1, dtype=self.dtype)
+        for key, value in fields.items():
+            rec[key] = value
+        rec['seq'] = seq
+        rec['time'] = int(time.time())
+        self._f.write(rec.tobytes())
+        self._f.flush()
+
+        for f in self.players:
+            uid = int(rec[f][0])
+            self.index.setdefault(uid, array('Q')).append(self.count)
+            self.last_time[uid] = int(rec['time'][0])
+            if self.hot:
+                self.recent.setdefault(uid, deque(maxlen=self.hot)).append(rec[0])
+        self.count += 1
+        self.last_seq = seq
+
+    def matches(self, user_id):
+        """How many archived matches `user_id` has played."""
+        return len(self.index.get(int(user_id), ()))
+
+    def read(self, user_id, start=0, stop=None):
+        """
+        Records for the player's matches `start`..`stop` (0 = their first,
+        Python slice rules, negatives count from the latest), oldest first.
+        """
+        uid = int(user_id)
+        if self.hot and start < 0 and -start <= self.hot and stop is None:
+            # the latest few are already in memory
+            return np.array(list(self.recent.get(uid, ()))[start:], dtype=self.dtype)
+        nums = self.index.get(uid, array('Q'))[start:stop]
+        out = np.zeros(len(nums), dtype=self.dtype)
+        with stage('storage'):
+            fd = self._f.fileno()
+            self._f.flush()
+            for i, n in enumerate(nums):
+                out[i] = np.frombuffer(os.pread(fd, self.size, n * self.size), dtype=self.dtype)[0]
+        return out
+
+    def get(self, n):
+        """Record number `n`."""
+        self._f.flush()
+        return np.frombuffer(os.pread(self._f.fileno(), self.size, n * self.size), dtype=self.dtype)[0]
+
+    def find(self, seq):
+        """Record number of the record made by op `seq`, or None. Binary search; seqs only grow."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if int(self.get(mid)['seq']) < seq:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and int(self.get(lo)['seq']) == seq:
+            return lo
+        return None
+
+    def read_from(self, n):
+        """Every record from number `n` to the end, in file order."""
+        self._f.flush()
+        return np.fromfile(self.path, dtype=self.dtype, offset=n * self.size)
+
+    def rewrite(self, n, rec):
+        """
+        Overwrite record `n` in place (a correction), moving it between
+        players' indexes if its players changed or it was voided.
+        """
+        old = self.get(n).copy()
+        self._f.flush()
+        # a separate handle: writes through the O_APPEND one always land at the end
+        with open(self.path, 'r+b') as f:
+            f.seek(n * self.size)
+            f.write(np.asarray(rec, dtype=self.dtype).tobytes())
+
+        was = set() if old['flags'] & VOIDED else {int(old[f]) for f in self.players}
+        now = set() if rec['flags'] & VOIDED else {int(rec[f]) for f in self.players}
+        for uid in was - now:
+            nums = self.index[uid]
+            del nums[bisect_left(nums, n)]
+        for uid in now - was:
+            nums = self.index.setdefault(uid, array('Q'))
+            nums.insert(bisect_left(nums, n), n)
+        if self.hot:
+            for uid in was | now:
+                nums = self.index.get(uid, array('Q'))
+                self.recent[uid] = deque((self.get(i) for i in nums[-self.hot:]), maxlen=self.hot)
+
+    def sync(self):
+        """fsync; the store calls this before a snapshot lets the journal go."""
+        if self._f is not None:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
+
+
+class SinglesArchive(MatchArchive):
+    dtype = SINGLES_RECORD
+    players = ('winner', 'loser')
+
+    def __init__(self, path=SINGLES_ARCHIVE):
+        super().__init__(path)
+
+    def from_op(self, op, args, result):
+        if op == 'match':
+            return {
+                'winner': args['winner_id'], 'loser': args['loser_id'],
+                'score_w': args.get('score_w') or 0, 'score_l': args.get('score_l') or 0,
+                'w_before': result['winner_elo_before'], 'l_before': result['loser_elo_before'],
+                'w_after': result['winner_elo_after'], 'l_after': result['loser_elo_after'],
+            }
+        if op == 'log_history':
+            return {
+                'flags': LOGGED,
+                'winner': args['winner_id'], 'loser': args['loser_id'],
+                'score_w': args['score_w'], 'score_l': args['score_l'],
+                'w_after': args['winner_elo_after'], 'l_after': args['loser_elo_after'],
+            }
+        return None
+
+    def history(self, user_id, start=0, stop=None):
+        """
+        Like `read()` but as match_history-style dicts from the player's
+        side, newest first, so /history can render them the same way.
+        """
+        uid = int(user_id)
+        out = []
+        for rec in self.read(uid, start, stop)[::-1]:
+            won = int(rec['winner']) == uid
+            out.append({
+                "match_id":           int(rec['seq']),
+                "winner_id":          int(rec['winner']),
+                "opponent_id":        int(rec['loser'] if won else rec['winner']),
+                "result":             'W' if won else 'L',
+                "score_w":            int(rec['score_w']),
+                "score_l":            int(rec['score_l']),
+                "elo_after":          int(rec['w_after'] if won else rec['l_after']),
+                "opponent_elo_after": int(rec['l_after'] if won else rec['w_after']),
+            })
+        return out
+
+
+class DoublesArchive(MatchArchive):
+    """
+    Doubles matches. doubles_data.json keeps no history at all; the last
+    HISTORY_LIMIT matches per player are served from `recent` instead.
+    """
+
+    dtype = DOUBLES_RECORD
+    players = ('a1', 'a2', 'b1', 'b2')
+    hot = HISTORY_LIMIT
+
+    def __init__(self, path=DOUBLES_ARCHIVE):
+        super().__init__(path)
+
+    def from_op(self, op, args, result):
+        if op != 'dmatch':
+            return None
+        fields = {k: args[k] for k in self.players}
+        fields.update({f"{k}_after": result[f"{k}_after"] for k in self.players})
+        fields.update(score_w=args.get('score_w') or 0, score_l=args.get('score_l') or 0,
+                      delta_win=result['delta_win'], delta_loss=result['delta_loss'])
+        return fields
+
+    def history(self, user_id, start=0, stop=None):
+        """
+        The player's doubles matches as dicts (partner, opponents, result,
+        score, elo after), newest first.
+        """
+        uid = int(user_id)
+        out = []
+        for rec in self.read(uid, start, stop)[::-1]:
+            won = uid in (int(rec['a1']), int(rec['a2']))
+            us, them = (('a1', 'a2'), ('b1', 'b2')) if won else (('b1', 'b2'), ('a1', 'a2'))
+            me = next(k for k in us if int(rec[k]) == uid)
+            partner = us[1] if me == us[0] else us[0]
+            out.append({
+                "partner_id":    int(rec[partner]),
+                "opponent_ids":  [int(rec[k]) for k in them],
+                "result":        'W' if won else 'L',
+                "score_w":       int(rec['score_w']),
+                "score_l":       int(rec['score_l']),
+                "elo_after":     int(rec[f"{me}_after"]),
+                "delta":         int(rec['delta_win'] if won else -rec['delta_loss']),
+            })
+        return out
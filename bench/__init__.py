@@ -0,0 +1,12 @@
+"""
+Benchmarks for the bot's hot paths on synthetic leagues.
+
+    python -m bench.generate 10000 --out /tmp/league    # write a league to look at or load
+    python -m bench.run                                 # run the suite, write bench_results.json
+    python -m bench.run --sizes 1000,100000 --baseline old.json
+    python -m bench.stress                              # concurrent commits: nothing lost or stale
+
+Run from the repository root so the bot's modules import. Results are
+JSON (one row per benchmark and league size) so two commits can be
+compared with `--baseline`.
+"""
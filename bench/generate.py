@@ -0,0 +1,171 @@
+"""
+Synthetic singles and doubles leagues shaped like a real one.
+
+Players get Discord-sized ids, ratings spread around a typical club, and
+opponents mostly near their own level (a geometric number of places
+away on the table), with a few games per pairing won in proportion to
+`elo.expected_score`. Wins, losses and head-to-heads agree with each
+other, and every player who has played gets a full HISTORY_LIMIT
+history drawn from their own pairings.
+
+    python -m bench.generate 10000 --out /tmp/league [--seed 0]
+"""
+import argparse
+import os
+
+import numpy as np
+
+import elo
+import doubles_elo as dE
+from utils import write_json_atomic
+
+
+BASE_ID   = 100_000_000_000_000_000
+OPPONENTS = 12      # mean distinct singles opponents per player
+PARTNERS  = 4       # mean distinct doubles partners per player
+
+
+def _ids(n, rng):
+    # snowflake-like, unique, registered in no particular order
+    ids = BASE_ID + np.arange(n, dtype=np.int64) * 9973 + rng.integers(0, 9973, n)
+    return [str(i) for i in rng.permutation(ids)]
+
+
+def _ratings(n, rng):
+    return np.maximum(elo.ELO_FLOOR, np.rint(rng.normal(160, 60, n))).astype(np.int64)
+
+
+def _pairs(n, rng, per_player):
+    """Unique (a, b) index pairs, a < b, mostly close together in `order`."""
+    m = n * per_player // 2
+    a = rng.integers(0, n, m)
+    gap = rng.geometric(1 / max(2, per_player), m) * rng.choice((-1, 1), m)
+    b = np.clip(a + gap, 0, n - 1)
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    keys = np.unique((lo * n + hi)[lo != hi])
+    return keys // n, keys % n
+
+
+def singles_league(n, seed=0, opponents=OPPONENTS):
+    rng = np.random.default_rng(seed)
+    ids = _ids(n, rng)
+    elos = _ratings(n, rng)
+    order = np.argsort(-elos, kind='stable')        # table position -> player
+
+    pa, pb = _pairs(n, rng, opponents)
+    a, b = order[pa], order[pb]
+    games = 1 + rng.geometric(0.35, len(a))
+    p = elo.expected_score(elos[a].astype(float), elos[b].astype(float))
+    a_wins = rng.binomial(games, p)
+
+    data = dict.fromkeys(ids)      # keep registration order
+    pos = {uid: i for i, uid in enumerate(ids)}
+    h2h = [dict() for _ in range(n)]
+    wins = np.zeros(n, dtype=np.int64)
+    losses = np.zeros(n, dtype=np.int64)
+    for i, j, g, w in zip(a.tolist(), b.tolist(), games.tolist(), a_wins.tolist()):
+        h2h[i][ids[j]] = {'wins': w, 'losses': g - w}
+        h2h[j][ids[i]] = {'wins': g - w, 'losses': w}
+        wins[i] += w
+        losses[i] += g - w
+        wins[j] += g - w
+        losses[j] += w
+
+    for i, uid in enumerate(ids):
+        e = int(elos[i])
+        history = []
+        opps = list(h2h[i])
+        if opps:
+            picks = rng.integers(0, len(opps), elo.HISTORY_LIMIT)
+            won = rng.random(elo.HISTORY_LIMIT) < 0.5
+            drift = np.cumsum(rng.integers(-14, 15, elo.HISTORY_LIMIT))
+            for k in range(elo.HISTORY_LIMIT):
+                opp = opps[picks[k]]
+                mine = max(elo.ELO_FLOOR, e - int(drift[k]))
+                theirs = int(elos[pos[opp]]) + int(rng.integers(-30, 31))
+                history.append({
+                    "winner_id": int(uid) if won[k] else int(opp),
+                    "opponent_id": int(opp),
+                    "result": 'W' if won[k] else 'L',
+                    "score_w": 11,
+                    "score_l": int(rng.integers(0, 10)),
+                    "elo_after": mine,
+                    "opponent_elo_after": max(elo.ELO_FLOOR, theirs),
+                })
+        data[uid] = {
+            'elo':           e,
+            'wins':          int(wins[i]),
+            'losses':        int(losses[i]),
+            'first_5_bonus': int(min(5, wins[i])),
+            'streak':        int(rng.geometric(0.5) - 1),
+            'head_to_head':  h2h[i],
+            'medals':        [],
+            'all_time_gain': int(max(0, e - 100) + losses[i] * 11),
+            'all_time_loss': int(losses[i] * 11),
+            'match_history': history,
+            'peak_elo':      int(e + rng.integers(0, 40)),
+        }
+    return data
+
+
+def doubles_league(n, seed=0, partners=PARTNERS):
+    rng = np.random.default_rng(seed + 1)
+    ids = _ids(n, rng)
+    elos = _ratings(n, rng)
+    order = np.argsort(-elos, kind='stable')
+
+    pa, pb = _pairs(n, rng, partners)
+    a, b = order[pa], order[pb]
+    games = 1 + rng.geometric(0.3, len(a))
+    won = rng.binomial(games, 0.5)
+
+    data = dict.fromkeys(ids)
+    tallies = [({}, {}) for _ in range(n)]
+    for i, j, g, w in zip(a.tolist(), b.tolist(), games.tolist(), won.tolist()):
+        for x, y in ((i, j), (j, i)):
+            if w:
+                tallies[x][0][ids[y]] = w
+            if g - w:
+                tallies[x][1][ids[y]] = g - w
+
+    for i, uid in enumerate(ids):
+        e = int(elos[i])
+        w = sum(tallies[i][0].values())
+        l = sum(tallies[i][1].values())
+        data[uid] = {
+            'elo':             e,
+            'wins':            w,
+            'losses':          l,
+            'streak':          int(rng.geometric(0.5) - 1),
+            'medals':          [],
+            'all_time_gain':   int(max(0, e - 100) + l * 11),
+            'all_time_loss':   int(l * 11),
+            'peak_elo':        int(e + rng.integers(0, 40)),
+            'partners':        tallies[i][0],
+            'partners_losses': tallies[i][1],
+        }
+    return data
+
+
+def write(out, singles, doubles):
+    os.makedirs(out, exist_ok=True)
+    write_json_atomic(os.path.join(out, os.path.basename(elo.DATA_FILE)), singles)
+    write_json_atomic(os.path.join(out, os.path.basename(dE.DATA_FILE)), doubles)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('players', type=int)
+    parser.add_argument('--out', default='.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--opponents', type=int, default=OPPONENTS)
+    parser.add_argument('--partners', type=int, default=PARTNERS)
+    args = parser.parse_args()
+    write(args.out,
+          singles_league(args.players, args.seed, args.opponents),
+          doubles_league(args.players, args.seed, args.partners))
+    print(f"Wrote {args.players} players to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+"""
+Offline load test: drive bot.py's command handlers concurrently with
+stand-ins for the Discord objects they touch, on a synthetic league.
+
+The fakes (`FakeMember`, `FakeGuild`, `FakeInteraction`) carry just what
+the handlers use. Every response, defer, followup and `fetch_user` sleeps
+for a simulated REST round trip, and only `--cached` of the players are
+in the guild member cache, so name resolution falls back to fetches the
+way it does on a cold bot. Requests are drawn from `--mix` and run
+`--concurrency` at a time. The report covers commands per second,
+p50/p95/p99 latency per command, the perf.py stage breakdown, and
+integrity checks:
+- every /match and /dmatch shows up exactly once in the records,
+  head-to-heads, archive and store seq (no lost or doubled updates)
+- the flushed files load back to the same league
+
+    python -m bench.loadtest [--players 1000] [--requests 2000] [--concurrency 32]
+                             [--mix match:4,stats:3,leaderboard:2,rivals:1,dmatch:2,dstats:1,history:1]
+                             [--latency 60] [--cached 0.8] [--out loadtest_results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)      # the run chdirs into a scratch dir; chart workers need the repo too
+
+import perf
+from bench.generate import singles_league, doubles_league, write
+from bench.run import _commit
+from utils import json_default
+
+
+MIX         = 'match:4,stats:3,leaderboard:2,rivals:1,dmatch:2,dstats:1,history:1'
+PLAYERS     = 1000
+REQUESTS    = 2000
+CONCURRENCY = 32
+LATENCY     = 60        # ms per simulated REST call
+CACHED      = 0.8       # share of players the guild member cache knows
+OUT         = 'loadtest_results.json'
+
+
+class _Avatar:
+    def __init__(self, uid):
+        self.url = f"https://cdn.example/avatars/{uid}.png"
+
+
+class _Permissions:
+    administrator = True
+
+
+class FakeMember:
+    """What handlers read off a discord.Member (always an admin, so every command is allowed)."""
+
+    bot = False
+    roles = ()
+    guild_permissions = _Permissions()
+
+    def __init__(self, uid):
+        self.id = int(uid)
+        self.name = self.display_name = f"player{self.id % 100000}"
+        self.mention = f"<@{self.id}>"
+        self.display_avatar = _Avatar(self.id)
+
+
+class Rest:
+    """Simulated REST round trips: `latency` ms, +/- `jitter` of it."""
+
+    def __init__(self, latency, jitter=0.5, seed=0):
+        self.latency = latency / 1000
+        self.jitter = jitter
+        self.rng = np.random.default_rng(seed)
+        self.calls = 0
+
+    async def call(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency * (1 + self.jitter * (2 * self.rng.random() - 1)))
+
+
+class FakeGuild:
+    def __init__(self, members, cached, rng):
+        self.id = 1
+        self.emojis = []
+        keep = rng.random(len(members)) < cached
+        self._members = {m.id: m for m, k in zip(members, keep) if k}
+
+    def get_member(self, uid):
+        return self._members.get(int(uid))
+
+
+class FakeResponse:
+    def __init__(self, rest):
+        self.rest = rest
+        self.sent = []
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        await self.rest.call()
+        self._done = True
+        self.sent.append(content)
+
+    async def defer(self, **kwargs):
+        await self.rest.call()
+        self._done = True
+
+    async def edit_message(self, content=None, **kwargs):
+        await self.rest.call()
+        self._done = True
+
+
+class FakeFollowup:
+    def __init__(self, rest):
+        self.rest = rest
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        await self.rest.call()
+        self.sent.append(content)
+
+
+class FakeInteraction:
+    def __init__(self, user, guild, rest):
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id
+        self.response = FakeResponse(rest)
+        self.followup = FakeFollowup(rest)
+        self.extras = {}
+
+
+# the fakes' sends count towards the 'send' and 'ack' stages like discord's own
+perf.timed(FakeResponse, 'send_message', 'send', ack=True)
+perf.timed(FakeResponse, 'defer', 'send', ack=True)
+perf.timed(FakeFollowup, 'send', 'send')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition(':')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def plan(mix, members, count, rng):
+    """[(command, kwargs), ...]; member arguments are FakeMembers."""
+    names = list(mix)
+    weights = np.array([mix[n] for n in names], dtype=float)
+    picks = rng.choice(len(names), count, p=weights / weights.sum())
+    out = []
+    for i in picks.tolist():
+        name = names[i]
+        who = [members[j] for j in rng.choice(len(members), 4, replace=False)]
+        score_l = int(rng.integers(0, 10))
+        if name == 'match':
+            kwargs = {'winner': who[0], 'loser': who[1], 'score_w': 11, 'score_l': score_l}
+        elif name == 'dmatch':
+            kwargs = {'a1': who[0], 'a2': who[1], 'b1': who[2], 'b2': who[3], 'score_w': 11, 'score_l': score_l}
+        elif name in ('stats', 'dstats', 'history', 'dhistory'):
+            kwargs = {'user': who[0]}
+        elif name == 'h2h':
+            kwargs = {'player1': who[0], 'player2': who[1]}
+        else:
+            kwargs = {}
+        out.append((name, kwargs))
+    return out
+
+
+def _snapshot(bot):
+    """The counters the integrity checks compare before and after."""
+    singles, doubles = bot.singles.data, bot.doubles.data
+    return {
+        'wins':     {u: e['wins'] for u, e in singles.items()},
+        'losses':   {u: e['losses'] for u, e in singles.items()},
+        'h2h':      {(u, o): r['wins'] for u, e in singles.items() for o, r in e['head_to_head'].items()},
+        'archived': {u: bot.singles_archive.matches(u) for u in singles},
+        'dwins':    {u: e['wins'] for u, e in doubles.items()},
+        'dlosses':  {u: e['losses'] for u, e in doubles.items()},
+        'seq':      (bot.singles.seq, bot.doubles.seq),
+    }
+
+
+def check(bot, before, done):
+    """
+    Compare what the league gained with the /match and /dmatch calls that
+    completed. Each entry in the result counts mismatching players (or
+    pairs); all zeros means no update was lost or applied twice.
+    """
+    expect = {k: {} for k in ('wins', 'losses', 'h2h', 'archived', 'dwins', 'dlosses')}
+
+    def bump(table, key):
+        expect[table][key] = expect[table].get(key, 0) + 1
+
+    matches = dmatches = 0
+    for name, kwargs in done:
+        if name == 'match':
+            w, l = str(kwargs['winner'].id), str(kwargs['loser'].id)
+            bump('wins', w)
+            bump('losses', l)
+            bump('h2h', (w, l))
+            bump('archived', w)
+            bump('archived', l)
+            matches += 1
+        elif name == 'dmatch':
+            for k in ('a1', 'a2'):
+                bump('dwins', str(kwargs[k].id))
+            for k in ('b1', 'b2'):
+                bump('dlosses', str(kwargs[k].id))
+            dmatches += 1
+
+    after = _snapshot(bot)
+    out = {}
+    for table, expected in expect.items():
+        keys = set(after[table]) | set(before[table])
+        out[table] = sum(
+            after[table].get(k, 0) - before[table].get(k, 0) != expected.get(k, 0) for k in keys
+        )
+    out['singles_seq'] = after['seq'][0] - before['seq'][0] - matches
+    out['doubles_seq'] = after['seq'][1] - before['seq'][1] - dmatches
+
+    # durability: what was flushed must load back to the league in memory
+    bot.storage_io.shutdown(wait=True)
+    bot.singles.flush()
+    bot.doubles.flush()
+    for store, backend in ((bot.singles, bot.sE), (bot.doubles, bot.dE)):
+        disk = json.loads(json.dumps(backend.load_data(), default=json_default))
+        live = json.loads(json.dumps(store.data, default=json_default))
+        out[f"{backend.LEAGUE}_reload"] = sum(disk.get(u) != e for u, e in live.items()) + len(set(disk) - set(live))
+    return out
+
+
+def _percentiles(values):
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    return {'p50_ms': p50 * 1000, 'p95_ms': p95 * 1000, 'p99_ms': p99 * 1000}
+
+
+async def drive(bot, requests, concurrency, guild, admin, rest):
+    queue = asyncio.Queue()
+    for i, req in enumerate(requests):
+        queue.put_nowait((i, req))
+    latencies, errors, done = {}, [], []
+
+    async def worker():
+        while not queue.empty():
+            i, (name, kwargs) = queue.get_nowait()
+            callback = bot.tree.get_command(name).callback
+            interaction = FakeInteraction(admin, guild, rest)
+            call = perf.recorder.begin(name)
+            start = time.perf_counter()
+            try:
+                await callback(interaction, **kwargs)
+            except Exception:
+                errors.append({'command': name, 'error': traceback.format_exc(limit=3)})
+                perf.recorder.end(call, failed=True)
+                continue
+            latencies.setdefault(name, []).append(time.perf_counter() - start)
+            perf.recorder.end(call)
+            done.append((name, kwargs))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, errors, done
+
+
+def run(players=PLAYERS, requests=REQUESTS, concurrency=CONCURRENCY, mix=MIX,
+        latency=LATENCY, cached=CACHED, seed=0):
+    rng = np.random.default_rng(seed)
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        write(workdir, singles_league(players, seed), doubles_league(players, seed))
+        import bot
+        bot.singles.load()
+        bot.doubles.load()
+        for warm in bot.charts.prewarm():
+            warm.result()       # start-up cost isn't what's being measured
+
+        rest = Rest(latency, seed=seed)
+
+        async def fetch_user(uid):
+            await rest.call()
+            return FakeMember(uid)
+
+        bot.client.fetch_user = fetch_user
+        uids = sorted(set(bot.singles.data) | set(bot.doubles.data))
+        members = [FakeMember(u) for u in uids]
+        guild = FakeGuild(members, cached, rng)
+        admin = members[0]
+        reqs = plan(parse_mix(mix), members, requests, rng)
+
+        before = _snapshot(bot)
+        elapsed, latencies, errors, done = asyncio.run(drive(bot, reqs, concurrency, guild, admin, rest))
+        integrity = check(bot, before, done)
+        bot.charts.shutdown()
+        bot.predictor.shutdown()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    commands = {}
+    for name, values in sorted(latencies.items()):
+        commands[name] = {'count': len(values), **_percentiles(values),
+                          'stages_ms': {s: round(p[1] * 1000, 2) for s, p in perf.recorder.percentiles(name).items()}}
+    every = [v for values in latencies.values() for v in values]
+    return {
+        'meta': {
+            'at':          datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit':      _commit(),
+            'players':     players,
+            'requests':    requests,
+            'concurrency': concurrency,
+            'mix':         mix,
+            'latency_ms':  latency,
+            'cached':      cached,
+            'seed':        seed,
+        },
+        'elapsed_s':       elapsed,
+        'commands_per_s':  len(every) / elapsed,
+        'overall':         _percentiles(every) if every else {},
+        'commands':        commands,
+        'rest_calls':      rest.calls,
+        'errors':          len(errors),
+        'error_samples':   errors[:5],
+        'integrity':       integrity,
+        'integrity_ok':    not any(integrity.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the command handlers offline under concurrency")
+    parser.add_argument('--players', type=int, default=PLAYERS)
+    parser.add_argument('--requests', type=int, default=REQUESTS)
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--mix', default=MIX, help="command:weight,... (commands registered on bot.tree)")
+    parser.add_argument('--latency', type=float, default=LATENCY, help="simulated REST latency, ms")
+    parser.add_argument('--cached', type=float, default=CACHED, help="share of players in the member cache")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=OUT)
+    args = parser.parse_args()
+
+    report = run(args.players, args.requests, args.concurrency, args.mix, args.latency, args.cached, args.seed)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{report['commands_per_s']:.1f} commands/s over {report['elapsed_s']:.1f}s, "
+          f"{report['errors']} errors, integrity {'ok' if report['integrity_ok'] else 'FAILED'}")
+    for name, c in report['commands'].items():
+        print(f"  /{name:<12} {c['count']:>6}  p50 {c['p50_ms']:8.1f}  p95 {c['p95_ms']:8.1f}  p99 {c['p99_ms']:8.1f} ms")
+    if not report['integrity_ok']:
+        print(f"  integrity: {report['integrity']}")
+    for e in report['error_samples']:
+        print(f"  /{e['command']} failed:\n{e['error']}")
+    print(f"Wrote {args.out}")
+
+
+if __name__ == '__main__':
+    main()
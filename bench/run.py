@@ -0,0 +1,238 @@
+"""
+Repeatable benchmarks over synthetic leagues (see bench/generate.py).
+
+Every benchmark is timed `--repeat` times per league size and reported
+per operation (best, median, mean seconds). The memory rows are the
+bytes per player a league holds once parsed, as plain dicts (json.load)
+and as the store keeps it (slotted records, records.py, with singles
+head-to-heads held once per pair, pairs.py, and the doubles
+partnership index, duos.py). The whole run goes to one JSON file with
+the commit and interpreter it ran on; `--baseline` prints how each
+median moved against an earlier file.
+
+    python -m bench.run [--sizes 100,1000,10000] [--repeat 5] [--out bench_results.json]
+                        [--baseline old.json] [--only rivals,process_match]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+import elo
+import doubles_elo as dE
+from charts import render_trend
+from ranking import TopBoard, rivalries
+from utils import json_default
+
+from bench.generate import singles_league, doubles_league
+
+
+SIZES   = (100, 1000, 10000)
+REPEAT  = 5
+BATCH   = 1000          # ops per timed batch for the per-match benchmarks
+OUT     = 'bench_results.json'
+
+
+def measure(fn, repeat, number=1, setup=None):
+    """Time `fn(state)` `repeat` times; `state` comes fresh from `setup()` each time."""
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        fn(state)
+        times.append((time.perf_counter() - start) / number)
+    return {
+        'best':   min(times),
+        'median': statistics.median(times),
+        'mean':   statistics.fmean(times),
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+def _matches(data, rng, count):
+    ids = list(data)
+    picks = rng.integers(0, len(ids), (count, 2))
+    return [(ids[a], ids[b]) for a, b in picks.tolist() if a != b]
+
+
+def _doubles_matches(data, rng, count):
+    ids = list(data)
+    return [tuple(ids[i] for i in rng.choice(len(ids), 4, replace=False)) for _ in range(count)]
+
+
+def duos_scan(data, k=10):
+    """What /duos did before the index: every player's partner map, sorted."""
+    pair_wins = {}
+    for uid, entry in data.items():
+        for partner, wins in entry.get('partners', {}).items():
+            if int(uid) < int(partner):
+                pair_wins[(int(uid), int(partner))] = wins
+    return sorted(pair_wins.items(), key=lambda kv: kv[1], reverse=True)[:k]
+
+
+def league_benchmarks(n, seed, repeat, tmp):
+    """{name: measure(...)} for one league size."""
+    rng = np.random.default_rng(seed)
+    raw = singles_league(n, seed)
+    singles = elo.league(raw)        # what load_data gives the store
+    raw_doubles = doubles_league(n, seed)
+    doubles = dE.league(raw_doubles)
+    out = {}
+
+    # storage: the files are written to `tmp`, as the bot would write its own
+    elo.DATA_FILE = os.path.join(tmp, 'data.json')
+    dE.DATA_FILE = os.path.join(tmp, 'doubles_data.json')
+    out['save_data'] = measure(lambda _: elo.save_data(singles), repeat)
+    out['load_data'] = measure(lambda _: elo.load_data(), repeat)
+    out['doubles_save_data'] = measure(lambda _: dE.save_data(doubles), repeat)
+    out['doubles_load_data'] = measure(lambda _: dE.load_data(), repeat)
+
+    # ratings: batches of random pairings played into the league, as they would be live
+    pairs = _matches(singles, rng, BATCH)
+    out['process_match'] = measure(
+        lambda _: [elo.process_match(singles, w, l, 11, 7) for w, l in pairs], repeat, len(pairs))
+    fours = _doubles_matches(doubles, rng, BATCH)
+    out['process_doubles_match'] = measure(
+        lambda _: [dE.process_doubles_match(doubles, *m) for m in fours], repeat, len(fours))
+
+    # leaderboards: the full sort /leaderboard used to do, and the rank index that replaced it
+    out['leaderboard_sort'] = measure(
+        lambda _: sorted(singles.items(), key=lambda kv: kv[1]['elo'], reverse=True)[:10], repeat)
+    out['rank_index_build'] = measure(lambda _: TopBoard('elo').build(singles), repeat)
+    board = TopBoard('elo')
+    board.build(singles)
+    moves = [(uid, {'elo': int(v)}) for uid, v in zip(list(singles)[:BATCH], rng.integers(5, 400, BATCH))]
+    out['rank_index_update'] = measure(lambda _: [board.update(uid, e) for uid, e in moves], repeat, len(moves))
+    out['rank_index_rank'] = measure(lambda _: [board.rank(uid) for uid, _ in moves], repeat, len(moves))
+
+    out['rivals_scan'] = measure(lambda _: rivalries(raw), repeat)
+    out['rivals_most_played'] = measure(lambda _: rivalries(singles), repeat)
+    out['duos_scan'] = measure(lambda _: duos_scan(raw_doubles), repeat)
+    out['duos_index'] = measure(lambda _: doubles.duos.most_wins(), repeat)
+    return out
+
+
+def _retained(build):
+    """Bytes still allocated for what `build()` returns (its temporaries are freed)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        kept = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del kept
+    return size
+
+
+def memory_benchmarks(n, seed):
+    """{name: bytes per player} for each league parsed into dicts and into records."""
+    out = {}
+    for prefix, league, convert in (
+            ('', singles_league(n, seed), elo.league),
+            ('doubles_', doubles_league(n, seed), dE.league)):
+        text = json.dumps(league, default=json_default)
+        out[f'{prefix}memory_dicts'] = _retained(lambda: json.loads(text)) / n
+        out[f'{prefix}memory_records'] = _retained(lambda: convert(json.loads(text))) / n
+    return out
+
+
+def chart_benchmarks(seed, repeat):
+    rng = np.random.default_rng(seed)
+    elos = (100 + np.cumsum(rng.integers(-20, 21, elo.HISTORY_LIMIT))).tolist()
+    render_trend(elos, "warm-up")     # first render pays for the matplotlib import
+    return {'history_chart_render': measure(lambda _: render_trend(elos, "ELO over last 10 matches"), repeat)}
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=SIZES, repeat=REPEAT, seed=0, only=None):
+    results = []
+
+    def keep(name, players, stats, unit='s/op'):
+        if only is None or name in only:
+            results.append({'name': name, 'players': players, 'unit': unit, **stats})
+            value = f"{stats['median'] * 1e6:12.1f} us/op" if unit == 's/op' else f"{stats['median']:12.1f} {unit}"
+            print(f"{name:<24} {players if players is not None else '-':>7}  median {value}")
+
+    tmp = tempfile.mkdtemp(prefix='bench-')
+    files = elo.DATA_FILE, dE.DATA_FILE
+    try:
+        for n in sizes:
+            for name, stats in league_benchmarks(n, seed, repeat, tmp).items():
+                keep(name, n, stats)
+            for name, size in memory_benchmarks(n, seed).items():
+                keep(name, n, {'best': size, 'median': size, 'mean': size, 'repeat': 1, 'number': 1}, 'B/player')
+    finally:
+        elo.DATA_FILE, dE.DATA_FILE = files
+        shutil.rmtree(tmp, ignore_errors=True)
+    if only is None or 'history_chart_render' in only:
+        for name, stats in chart_benchmarks(seed, repeat).items():
+            keep(name, None, stats)
+
+    return {
+        'meta': {
+            'at':       datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit':   _commit(),
+            'python':   sys.version.split()[0],
+            'numpy':    np.__version__,
+            'platform': platform.platform(),
+            'seed':     seed,
+            'sizes':    list(sizes),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline):
+    """Print each benchmark's median against the same (name, players) in `baseline`."""
+    old = {(r['name'], r['players']): r for r in baseline['results']}
+    print(f"\nagainst {baseline['meta'].get('commit')} ({baseline['meta'].get('at')}):")
+    for r in current['results']:
+        before = old.get((r['name'], r['players']))
+        if before is None:
+            continue
+        change = r['median'] / before['median'] - 1
+        print(f"{r['name']:<24} {r['players'] if r['players'] is not None else '-':>7}  {change:+8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's hot paths on synthetic leagues")
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help="comma-separated player counts")
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', help="comma-separated benchmark names")
+    parser.add_argument('--out', default=OUT)
+    parser.add_argument('--baseline', help="an earlier results file to compare against")
+    args = parser.parse_args()
+
+    only = set(args.only.split(',')) if args.only else None
+    report = run([int(s) for s in args.sizes.split(',')], args.repeat, args.seed, only)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
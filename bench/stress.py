@@ -0,0 +1,201 @@
+"""
+Stress test for LeagueStore's per-player locks and transactional commits.
+
+`--matches` singles matches are committed at once, each from its own
+task, with `--hot` of them drawn from a handful of players so that many
+transactions want the same locks. Every task reads its two players
+inside `store.transaction()`, commits the match and checks the result
+against what it read. The run fails unless:
+- the store seq, the journal and the archive each gained one event per
+  match, and every player's wins, losses and head-to-heads moved by
+  exactly the matches they played (no lost or doubled updates)
+- no transaction saw its players change under it
+- transactions on different players overlapped (no global serialisation)
+- a batch with a failing op left the league untouched
+- the flushed files load back to the league in memory
+
+For contrast, `--legacy` replays the same matches the way the bot used
+to (load the file, rate, save it back, with the awaits in between) and
+reports how many of them that loses.
+
+    python -m bench.stress [--players 200] [--matches 2000] [--hot 0.3] [--legacy]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import elo
+from archive import SinglesArchive
+from bench.generate import singles_league
+from store import LeagueStore
+from utils import json_default, write_json_atomic
+
+
+PLAYERS = 200
+MATCHES = 2000
+HOT     = 0.3       # share of matches among the HOT_PLAYERS
+HOT_PLAYERS = 6
+
+
+def plan(uids, matches, hot, rng):
+    pairs = []
+    for _ in range(matches):
+        pool = uids[:HOT_PLAYERS] if rng.random() < hot else uids
+        w, l = rng.choice(len(pool), 2, replace=False)
+        pairs.append((pool[w], pool[l], 11, int(rng.integers(0, 10))))
+    return pairs
+
+
+def _counts(data):
+    return {uid: (e['wins'], e['losses'], {o: (r['wins'], r['losses']) for o, r in e['head_to_head'].items()})
+            for uid, e in data.items()}
+
+
+async def play(store, pairs):
+    """Commit every match concurrently; (violations, peak overlap of transactions)."""
+    inside, peak, violations = 0, 0, []
+
+    async def one(w, l, sw, sl):
+        nonlocal inside, peak
+        async with store.transaction(w, l):
+            inside += 1
+            peak = max(peak, inside)
+            mine = {u: (store.data[u]['elo'], store.data[u]['wins'], store.data[u]['losses']) for u in (w, l)}
+            await asyncio.sleep(0)      # let everything else that's runnable have a go
+            if any((store.data[u]['elo'], store.data[u]['wins'], store.data[u]['losses']) != mine[u] for u in (w, l)):
+                violations.append((w, l, 'changed while held'))
+            result = await store.commit('match', winner_id=int(w), loser_id=int(l), score_w=sw, score_l=sl)
+            if (result['winner_elo_before'], result['loser_elo_before']) != (mine[w][0], mine[l][0]):
+                violations.append((w, l, 'rated from stale elo'))
+            if (store.data[w]['wins'], store.data[l]['losses']) != (mine[w][1] + 1, mine[l][2] + 1):
+                violations.append((w, l, 'record not updated once'))
+            inside -= 1
+
+    await asyncio.gather(*(one(*p) for p in pairs))
+    return violations, peak
+
+
+def check_rollback(store, uids):
+    """A batch whose last op fails must leave its players and seq as they were."""
+    w, l = uids[-2], uids[-1]
+    before = json.dumps({u: store.data[u] for u in (w, l)}, sort_keys=True, default=json_default)
+    seq = store.seq
+    try:
+        store.apply_many([('match', {'winner_id': int(w), 'loser_id': int(l), 'score_w': 11, 'score_l': 3}),
+                          ('set_peak', {'user_id': int(w)})])       # missing peak_elo
+    except TypeError:
+        pass
+    else:
+        return False
+    after = json.dumps({u: store.data[u] for u in (w, l)}, sort_keys=True, default=json_default)
+    return before == after and store.seq == seq
+
+
+def expected(before, pairs):
+    want = {uid: [w, l, dict(h)] for uid, (w, l, h) in before.items()}
+    for w, l, _, _ in pairs:
+        want[w][0] += 1
+        want[l][1] += 1
+        hw, hl = want[w][2].get(l, (0, 0)), want[l][2].get(w, (0, 0))
+        want[w][2][l] = (hw[0] + 1, hw[1])
+        want[l][2][w] = (hl[0], hl[1] + 1)
+    return {uid: tuple(v) for uid, v in want.items()}
+
+
+async def legacy(pairs):
+    """The old read-modify-write per command; returns how many matches survive."""
+    async def one(w, l, sw, sl):
+        data = elo.load_data()
+        await asyncio.sleep(0)          # the await between load and save every handler had
+        elo.process_match(data, int(w), int(l), sw, sl)
+        await asyncio.sleep(0)
+        elo.save_data(data)
+
+    start = sum(e['wins'] for e in elo.load_data().values())
+    await asyncio.gather(*(one(*p) for p in pairs))
+    return sum(e['wins'] for e in elo.load_data().values()) - start
+
+
+def run(players=PLAYERS, matches=MATCHES, hot=HOT, seed=0, with_legacy=False):
+    rng = np.random.default_rng(seed)
+    workdir = tempfile.mkdtemp(prefix='stress-')
+    cwd, data_file = os.getcwd(), elo.DATA_FILE
+    os.chdir(workdir)
+    try:
+        league = singles_league(players, seed)
+        write_json_atomic(elo.DATA_FILE, league)
+        uids = list(league)
+        pairs = plan(uids, matches, hot, rng)
+
+        store = LeagueStore(elo, event_log=True, compact_events=matches + 1)   # keep the whole run in the journal
+        archive = store.add_archive(SinglesArchive())
+        store.load()
+        before, seq, archived = _counts(store.data), store.seq, archive.count
+
+        start = time.perf_counter()
+        violations, peak = asyncio.run(play(store, pairs))
+        elapsed = time.perf_counter() - start
+
+        store.io.shutdown(wait=True)
+        out = {
+            'matches':       matches,
+            'elapsed_s':     elapsed,
+            'matches_per_s': matches / elapsed,
+            'peak_overlap':  peak,
+            'violations':    len(violations),
+            'seq_gained':    store.seq - seq,
+            'journaled':     len(store.journal.read()),
+            'archived':      archive.count - archived,
+            'bad_players':   sum(_counts(store.data)[u] != v for u, v in expected(before, pairs).items()),
+            'rollback_ok':   check_rollback(store, uids),
+        }
+        store.flush()
+        disk = json.loads(json.dumps(elo.load_data(), default=json_default))
+        live = json.loads(json.dumps(store.data, default=json_default))
+        out['reload_ok'] = disk == live
+
+        out['ok'] = (not violations and out['bad_players'] == 0 and out['rollback_ok'] and out['reload_ok']
+                     and out['seq_gained'] == out['journaled'] == out['archived'] == matches
+                     and peak > 1)
+        if with_legacy:
+            write_json_atomic(elo.DATA_FILE, league)
+            out['legacy_kept'] = asyncio.run(legacy(pairs))
+        return out, violations
+    finally:
+        elo.DATA_FILE = data_file
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress concurrent match commits against LeagueStore")
+    parser.add_argument('--players', type=int, default=PLAYERS)
+    parser.add_argument('--matches', type=int, default=MATCHES)
+    parser.add_argument('--hot', type=float, default=HOT, help="share of matches among a few players")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--legacy', action='store_true', help="also run the old load/save path for comparison")
+    args = parser.parse_args()
+
+    out, violations = run(args.players, args.matches, args.hot, args.seed, args.legacy)
+    print(f"{out['matches']} concurrent matches in {out['elapsed_s']:.2f}s ({out['matches_per_s']:.0f}/s), "
+          f"up to {out['peak_overlap']} transactions at once")
+    print(f"  seq +{out['seq_gained']}, journal +{out['journaled']}, archive +{out['archived']}, "
+          f"players off: {out['bad_players']}, isolation violations: {out['violations']}")
+    print(f"  rollback {'ok' if out['rollback_ok'] else 'FAILED'}, reload {'ok' if out['reload_ok'] else 'FAILED'}")
+    for v in violations[:5]:
+        print(f"  {v}")
+    if 'legacy_kept' in out:
+        print(f"  old load/save path kept {out['legacy_kept']} of {out['matches']} matches")
+    print("ok" if out['ok'] else "FAILED")
+    sys.exit(0 if out['ok'] else 1)
+
+
+if __name__ == '__main__':
+    main()
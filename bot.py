@@ -4,21 +4,45 @@
 # Originally designed for Ping Pong Masters Tour
 # a local table tennis league in Novi, MI
 
+if __name__ == "__main__":
+    # run through run.py, so the spawned chart and /predict workers don't re-run this file
+    import os, runpy
+    runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run.py'), run_name='__main__')
+    raise SystemExit
+
+import startup
 import os
 import discord
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from discord import app_commands
 from dotenv import load_dotenv
 import io
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mticker
+import re
 
 from elo import *
 from utils import is_admin, has_role, format_stats
 
 from typing import Literal, Optional
 
+import elo as sE
 import doubles_elo as dE
+from store import LeagueStore
+from ranking import TopBoard, rivalries
+from archive import SinglesArchive, DoublesArchive
+from names import NameResolver
+from charts import ChartRenderer
+from decay import DecayJob, DECAY_ENABLED
+import season as seasons
+from season import standings as season_standings
+from match_import import MatchSheetError, parse_matches, events, pages
+from predict import Predictor, MAX_PLAYERS as PREDICT_MAX_PLAYERS
+from matchmake import pair_singles, make_doubles, partner_counts
+from corrections import CorrectionError, correct, latest_match
+import perf
+
+startup.stop_tracking()
+startup.mark('imports')
 
 load_dotenv()
 
@@ -26,13 +50,58 @@ botToken = os.getenv("DISCORD_TOKEN")
 ALLOWED_ROLE_IDS = os.getenv("ROLE_ID")
 DEV_GUILD_ID = os.getenv("SERVER_ID")
 ELO_RANKS = os.getenv("RANKS", "0") == "1"
+PREWARM = os.getenv("PREWARM", "1") == "1"   # start chart workers right after on_ready
+MAX_SHEET_BYTES = 1024 * 1024   # /importmatches upload limit
+MAX_HISTORY_RANGE = 25          # matches per /history start/end request
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
 client = discord.Client(intents=intents)
-tree = app_commands.CommandTree(client)
+
+
+class TimedTree(app_commands.CommandTree):
+    """Times every slash command call from here to completion (see perf.py)."""
+
+    async def interaction_check(self, interaction):
+        if interaction.type is discord.InteractionType.application_command:
+            command = interaction.command
+            interaction.extras['perf'] = perf.recorder.begin(command.qualified_name if command else 'unknown')
+        return True
+
+    async def on_error(self, interaction, error):
+        call = interaction.extras.pop('perf', None)
+        if call is not None:
+            perf.recorder.end(call, failed=True)
+        await super().on_error(interaction, error)
+
+
+tree = TimedTree(client)
+# the 'send' stage; the first response or defer of a call is also its 'ack'
+perf.timed(discord.InteractionResponse, 'send_message', 'send', ack=True)
+perf.timed(discord.InteractionResponse, 'defer', 'send', ack=True)
+perf.timed(discord.Webhook, 'send', 'send')
+resolver = NameResolver(client)
+charts = ChartRenderer()
+predictor = Predictor()
+
+# league files are parsed once at launch; commands read these and flush is debounced.
+# Both leagues share one I/O thread, so every journal, archive and snapshot write
+# happens in the order the commands that caused it ran.
+storage_io = ThreadPoolExecutor(1, thread_name_prefix='storage-io')
+singles = LeagueStore(sE, event_log=True, io=storage_io)   # the event log is what /voidmatch and /editmatch replay
+doubles = LeagueStore(dE, io=storage_io)
+# rank indexes double as the cached top-10 boards
+singles_ranks = singles.add_index(TopBoard('elo'))
+doubles_ranks = doubles.add_index(TopBoard('elo'))
+alltime_board = singles.add_index(TopBoard('all_time_gain'))
+losers_board  = singles.add_index(TopBoard('all_time_loss'))
+# every match ever played; /history and /dhistory pages read from here
+singles_archive = singles.add_archive(SinglesArchive())
+doubles_archive = doubles.add_archive(DoublesArchive())
+# nightly inactivity decay, scheduled from on_ready
+decay_job = DecayJob([('singles', singles, singles_archive), ('doubles', doubles, doubles_archive)])
 
 
 @client.event
@@ -49,27 +118,48 @@ async def on_message(message: discord.Message):
 
 from discord.utils import get
 
+async def season_stats(interaction: discord.Interaction, user: discord.Member, n: int):
+    table = seasons.table(n, 'singles')
+    if table is None:
+        return await interaction.response.send_message(f"There is no finished season {n}.", ephemeral=True)
+    st = table.stats(user.id)
+    if st is None:
+        return await interaction.response.send_message(f"{user.display_name} didn't play in season {n}.")
+
+    embed = discord.Embed(title=f"{user.display_name} — Season {n} #{st['rank']}")
+    embed.add_field(name="Final ELO", value=str(st['elo']), inline=True)
+    embed.add_field(name="Peak", value=str(st['peak_elo']), inline=True)
+    embed.add_field(name="Record", value=f"{st['wins']}W - {st['losses']}L", inline=True)
+
+    above, below = table.neighbours(user.id)
+    names = await resolver.names(interaction.guild, [nb[0] for nb in (above, below) if nb is not None])
+    lines = []
+    if above is not None:
+        lines.append(f"{st['rank'] - 1}. {names[int(above[0])]} — {above[1]}")
+    lines.append(f"**{st['rank']}. {user.display_name} — {st['elo']}**")
+    if below is not None:
+        lines.append(f"{st['rank'] + 1}. {names[int(below[0])]} — {below[1]}")
+    embed.add_field(name="Final Standings", value="\n".join(lines), inline=False)
+    embed.set_thumbnail(url=user.display_avatar.url)
+    await interaction.response.send_message(embed=embed)
+
 @tree.command(name="stats", description="View your or another player's stats")
-@app_commands.describe(user="The user to look up (optional)")
-async def stats(interaction: discord.Interaction, user: discord.Member = None):
+@app_commands.describe(user="The user to look up (optional)", season="A finished season's number (optional)")
+async def stats(interaction: discord.Interaction, user: discord.Member = None, season: Optional[int] = None):
     user = user or interaction.user
-    data = load_data()
-    register_user(data, user.id)
-    user_stats = get_stats(data, user.id)
+    if season is not None and season != seasons.current_season():
+        return await season_stats(interaction, user, season)
+    data = singles.data
+    user_stats = singles.get_player(user.id)
 
     def custom(name: str) -> str:
         emoji = get(interaction.guild.emojis, name=name)
         return str(emoji) if emoji else ""
 
-    ranked = sorted(data.items(), key=lambda x: x[1]['elo'], reverse=True)
-    idx = next((i for i, (uid, _) in enumerate(ranked) if int(uid) == user.id), None)
-    if idx is None:
-        return await interaction.response.send_message("Could not find your ranking.")
-    rank_number = idx + 1
+    rank_number, above_id, below_id = singles_ranks.place(str(user.id), user_stats['elo'])
 
-    user_stats.setdefault('peak_elo', user_stats['elo'])
     elo = user_stats['elo']
-    peak = user_stats['peak_elo']
+    peak = user_stats.get('peak_elo', elo)
 
     title = f"{user.display_name} — #{rank_number}"
     embed = discord.Embed(title=title)
@@ -82,16 +172,13 @@ async def stats(interaction: discord.Interaction, user: discord.Member = None):
     embed.add_field(name="All-time Gain", value=str(user_stats.get('all_time_gain', 0)), inline=True)
     embed.add_field(name="All-time Lost", value=str(user_stats.get('all_time_loss', 0)), inline=True)
 
+    names = await resolver.names(interaction.guild, [u for u in (above_id, below_id) if u is not None])
     neighbor_lines = []
-    if idx > 0:
-        above_id, above_stats = ranked[idx - 1]
-        above_user = await interaction.client.fetch_user(int(above_id))
-        neighbor_lines.append(f"{idx}. {above_user.display_name} — {above_stats['elo']}")
+    if above_id is not None:
+        neighbor_lines.append(f"{rank_number - 1}. {names[int(above_id)]} — {data[above_id]['elo']}")
     neighbor_lines.append(f"**{rank_number}. {user.display_name} — {elo}**")
-    if idx < len(ranked) - 1:
-        below_id, below_stats = ranked[idx + 1]
-        below_user = await interaction.client.fetch_user(int(below_id))
-        neighbor_lines.append(f"{idx + 2}. {below_user.display_name} — {below_stats['elo']}")
+    if below_id is not None:
+        neighbor_lines.append(f"{rank_number + 1}. {names[int(below_id)]} — {data[below_id]['elo']}")
 
     embed.add_field(
         name="Leaderboard",
@@ -115,13 +202,29 @@ async def stats(interaction: discord.Interaction, user: discord.Member = None):
 
 
 @tree.command(name="leaderboard", description="View the current top 10 ELO leaderboard")
-async def leaderboard(interaction: discord.Interaction):
-    data = load_data()
-    ranked = sorted(data.items(), key=lambda x: x[1]['elo'], reverse=True)
-    msg = "**Leaderboard**\n"
-    for i, (uid, stats) in enumerate(ranked[:10], start=1):
-        user = await client.fetch_user(int(uid))
-        msg += f"{i}. {user.display_name} — {stats['elo']} ELO\n"
+@app_commands.describe(season="A finished season's number to see its final top 10 (optional)")
+async def leaderboard(interaction: discord.Interaction, season: Optional[int] = None):
+    if season is not None and season != seasons.current_season():
+        table = seasons.table(season, 'singles')
+        if table is None:
+            return await interaction.response.send_message(f"There is no finished season {season}.", ephemeral=True)
+        top = table.top()
+        names = await resolver.names(interaction.guild, [uid for uid, _ in top])
+        title = seasons.meta(season).get('title') or f"Season {season}"
+        msg = f"**{title} — Final Leaderboard**\n"
+        for i, (uid, elo) in enumerate(top, start=1):
+            msg += f"{i}. {names[int(uid)]} — {elo} ELO\n"
+        return await interaction.response.send_message(msg)
+
+    version = singles_ranks.version
+    msg = singles_ranks.cached(interaction.guild_id)
+    if msg is None:
+        top = singles_ranks.top()
+        names = await resolver.names(interaction.guild, [uid for uid, _ in top])
+        msg = "**Leaderboard**\n"
+        for i, (uid, elo) in enumerate(top, start=1):
+            msg += f"{i}. {names[int(uid)]} — {elo} ELO\n"
+        singles_ranks.remember(version, msg, interaction.guild_id)
     await interaction.response.send_message(msg)
 
 @tree.command(name="match", description="Log a match result (admin only)")
@@ -137,12 +240,8 @@ async def match(interaction, winner: discord.Member, loser: discord.Member, scor
     if not (is_admin(interaction.user) or has_role(interaction.user, ALLOWED_ROLE_IDS)):
         return await interaction.response.send_message("No permission", ephemeral=True)
 
-    data = load_data()
-    register_user(data, winner.id)
-    register_user(data, loser.id)
-
-    result = process_match(data, winner.id, loser.id,score_w=score_w,score_l=score_l)
-    save_data(data)
+    data = singles.data
+    result = await singles.commit('match', winner_id=winner.id, loser_id=loser.id, score_w=score_w, score_l=score_l)
 
     w_stats = get_stats(data, winner.id)
     l_stats = get_stats(data, loser.id)
@@ -171,12 +270,12 @@ async def match(interaction, winner: discord.Member, loser: discord.Member, scor
         msg += "\n".join(set_lines) + "\n"
     msg += f"{winner_line}\n{loser_line}"
 
-    rec = w_stats.get('head_to_head', {}).get(str(loser.id), {'wins': 0, 'losses': 0})
+    h2h_w, h2h_l = sE.head_to_head(data, winner.id, loser.id)
     w_new = w_stats['elo']
     l_new = l_stats['elo']
     msg += (
         f"\n> H2H: {winner.mention} (**{w_new}**) "
-        f"{rec['wins']}-{rec['losses']} "
+        f"{h2h_w}-{h2h_l} "
         f"{loser.mention} (**{l_new}**)"
     )
     if result['new_streak'] >= 3:
@@ -185,6 +284,51 @@ async def match(interaction, winner: discord.Member, loser: discord.Member, scor
     await interaction.response.send_message(msg)
 
 
+@tree.command(name="importmatches", description="Import a CSV/JSON sheet of match results (admin only)")
+@app_commands.describe(
+    sheet="CSV or JSON file: winner,loser[,score_w,score_l] or a1,a2,b1,b2[,score_w,score_l]",
+    league="singles or doubles (detected from the columns if omitted)"
+)
+async def importmatches(interaction: discord.Interaction, sheet: discord.Attachment,
+                        league: Optional[Literal['singles', 'doubles']] = None):
+    if not (is_admin(interaction.user) or has_role(interaction.user, ALLOWED_ROLE_IDS)):
+        return await interaction.response.send_message("No permission", ephemeral=True)
+    if sheet.size > MAX_SHEET_BYTES:
+        return await interaction.response.send_message("That file is too large to import.", ephemeral=True)
+
+    await interaction.response.defer()
+    try:
+        league, matches = parse_matches(sheet.filename, await sheet.read(), league)
+    except MatchSheetError as e:
+        lines = [f"**Import failed, nothing was recorded** ({len(e.errors)} problem(s))"] + e.errors
+        for page in pages(lines):
+            await interaction.followup.send(page)
+        return
+
+    # one batch: every match applied in order, one journal fsync
+    store = doubles if league == 'doubles' else singles
+    results = await store.commit_many(events(league, matches))
+
+    ids = {uid for m in matches for k, uid in m.items() if not k.startswith('score')}
+    names = await resolver.names(interaction.guild, ids)
+
+    lines = [f"**Imported {len(matches)} {league} match(es)**"]
+    for i, (m, r) in enumerate(zip(matches, results), start=1):
+        score = f" {m['score_w']}-{m['score_l']}" if m['score_w'] is not None and m['score_l'] is not None else ""
+        if league == 'doubles':
+            lines.append(
+                f"{i}. {names[m['a1']]} & {names[m['a2']]}{score} {names[m['b1']]} & {names[m['b2']]}"
+                f" (+{r['delta_win']} / -{r['delta_loss']})"
+            )
+        else:
+            lines.append(
+                f"{i}. {names[m['winner']]} ({r['winner_elo_after']}){score} "
+                f"{names[m['loser']]} ({r['loser_elo_after']}) (+{r['total_gain']} / -{r['elo_loss']})"
+            )
+    for page in pages(lines):
+        await interaction.followup.send(page)
+
+
 @tree.command(name="medal", description="Grant a tournament medal to a player (admin)")
 @app_commands.describe(user="The player to grant the medal to", medal="Medal type: gold, silver, or third", title="Title of the tournament")
 async def medal(interaction: discord.Interaction, user: discord.Member, medal: str, title: str):
@@ -192,59 +336,46 @@ async def medal(interaction: discord.Interaction, user: discord.Member, medal: s
     medal = medal.lower()
     if medal not in ["gold","silver","third"]: return await interaction.response.send_message("Medal must be gold, silver, or third.", ephemeral=True)
     emoji_map={'gold':'🥇','silver':'🥈','third':'🥉'}; medal_emoji=emoji_map[medal]
-    data=load_data(); register_user(data, user.id)
-    data[str(user.id)].setdefault('medals',[]).append({"medal":medal,"title":title}); save_data(data)
+    await singles.commit('medal', user_id=user.id, medal=medal, title=title)
     await interaction.response.send_message(f"{medal_emoji} **{user.display_name}** awarded **{medal.upper()}** for *{title}*")
 
 @tree.command(name="h2h", description="View head-to-head record between two players")
 @app_commands.describe(player1="First player (mention)", player2="Second player (mention)")
 async def h2h(interaction: discord.Interaction, player1: discord.Member, player2: discord.Member):
     if player1.id==player2.id: return await interaction.response.send_message("You must specify two different players.",ephemeral=True)
-    data=load_data(); register_user(data, player1.id); register_user(data, player2.id)
-    s1=get_stats(data,player1.id); s2=get_stats(data,player2.id)
+    s1=singles.get_player(player1.id); s2=singles.get_player(player2.id)
     e1,e2=s1['elo'],s2['elo']
-    ranked=sorted(data.items(),key=lambda x:x[1]['elo'],reverse=True)
-    find_rank=lambda uid: next((i+1 for i,(u,_) in enumerate(ranked) if int(u)==uid), '-')
-    r1,r2=find_rank(player1.id),find_rank(player2.id)
-    rec=s1.get('head_to_head',{}).get(str(player2.id),{'wins':0,'losses':0})
-    total=rec['wins']+rec['losses']
+    r1=singles_ranks.place(str(player1.id),e1)[0]; r2=singles_ranks.place(str(player2.id),e2)[0]
+    wins,losses=sE.head_to_head(singles.data,player1.id,player2.id)
     msg=(f"**Head to Head**\n{r1}. {player1.display_name} ({e1}) vs. {r2}. {player2.display_name} ({e2})\n\n"
-         f"Games: {total}\n{player2.display_name} {rec['losses']}W - {rec['wins']}W {player1.display_name}")
+         f"Games: {wins+losses}\n{player2.display_name} {losses}W - {wins}W {player1.display_name}")
     await interaction.response.send_message(msg)
     
 @tree.command(name="setlosses", description="Set a player's loss count (admin only)")
 async def setlosses(interaction: discord.Interaction, user: discord.Member, value: int):
     if not is_admin(interaction.user):
         return await interaction.response.send_message("No permission", ephemeral=True)
-    data = load_data()
-    register_user(data, user.id)
-    set_stat(data, user.id, 'losses', value)
-    save_data(data)
+    await singles.commit('set_stat', user_id=user.id, stat='losses', value=value)
     await interaction.response.send_message(f"{user.display_name}'s losses set to {value}.")
     
 @tree.command(name="setwins", description="Set a player's win count (admin only)")
 async def setwins(interaction: discord.Interaction, user: discord.Member, value: int):
     if not is_admin(interaction.user):
         return await interaction.response.send_message("No permission", ephemeral=True)
-    data = load_data()
-    register_user(data, user.id)
-    set_stat(data, user.id, 'wins', value)
-    save_data(data)
+    await singles.commit('set_stat', user_id=user.id, stat='wins', value=value)
     await interaction.response.send_message(f"{user.display_name}'s wins set to {value}.")
     
 @tree.command(name="alltime", description="View the top 10 all-time Elo gainers")
 async def alltime(interaction: discord.Interaction):
-    data = load_data()
-    ranked = sorted(
-        data.items(),
-        key=lambda x: x[1].get('all_time_gain', 0),
-        reverse=True
-    )
-    msg = "**Top ELO Gainers (All Time)**\n"
-    for i, (uid, stats) in enumerate(ranked[:10], start=1):
-        user = await client.fetch_user(int(uid))
-        gain = stats.get('all_time_gain', 0)
-        msg += f"{i}. {user.display_name} — {gain}\n"
+    version = alltime_board.version
+    msg = alltime_board.cached(interaction.guild_id)
+    if msg is None:
+        top = alltime_board.top()
+        names = await resolver.names(interaction.guild, [uid for uid, _ in top])
+        msg = "**Top ELO Gainers (All Time)**\n"
+        for i, (uid, gain) in enumerate(top, start=1):
+            msg += f"{i}. {names[int(uid)]} — {gain}\n"
+        alltime_board.remember(version, msg, interaction.guild_id)
     await interaction.response.send_message(msg)
     
 @tree.command(
@@ -260,12 +391,8 @@ async def simulate(
     player1: discord.Member,
     player2: discord.Member
 ):
-    data = load_data()
-    register_user(data, player1.id)
-    register_user(data, player2.id)
-
-    p1 = data[str(player1.id)]
-    p2 = data[str(player2.id)]
+    p1 = singles.get_player(player1.id)
+    p2 = singles.get_player(player2.id)
     w_before = p1['elo']
     l_before = p2['elo']
     wins_before = p1['wins']
@@ -303,6 +430,106 @@ async def simulate(
         "*This was just a simulation—no real Elo was changed.*"
     )
     
+@tree.command(name="predict", description="Forecast a tournament by simulating it thousands of times")
+@app_commands.describe(
+    players="Mention every entrant, in seed order (top seed first)",
+    format="bracket (single elimination) or roundrobin",
+    advance="Round robin: how many players advance (default: top half)",
+    trials="Number of simulated tournaments (default 20000)"
+)
+async def predict(
+    interaction: discord.Interaction,
+    players: str,
+    format: Literal['bracket', 'roundrobin'] = 'bracket',
+    advance: Optional[int] = None,
+    trials: Optional[int] = None
+):
+    ids = list(dict.fromkeys(int(m) for m in re.findall(r'<@!?(\d+)>', players)))
+    if not 2 <= len(ids) <= PREDICT_MAX_PLAYERS:
+        return await interaction.response.send_message(
+            f"Mention between 2 and {PREDICT_MAX_PLAYERS} different players.", ephemeral=True)
+    trials = max(1000, min(trials or 20000, 200000))
+
+    await interaction.response.defer()
+    stats = [singles.get_player(uid) for uid in ids]
+    res = await predictor.run(format, [s['elo'] for s in stats], [s['wins'] for s in stats], trials)
+    n, done = len(ids), res['trials']
+    place = res['place'] / done
+
+    names = await resolver.names(interaction.guild, ids)
+    lines = [f"**Tournament Forecast** ({format}, {n} players, {done:,} simulations)"]
+    if format == 'bracket':
+        reach = res['reach'] / done
+        rounds = len(reach) - 1
+        columns = [("Title", place[:, 0]), ("Final", reach[rounds - 1])]
+        if rounds >= 2:
+            columns.append(("Semis", reach[rounds - 2]))
+        columns.append(("Podium", place[:, :3].sum(axis=1)))
+    else:
+        advance = max(1, min(advance or n // 2, n))
+        columns = [("Title", place[:, 0]), ("Podium", place[:, :3].sum(axis=1)),
+                   (f"Top {advance}", place[:, :advance].sum(axis=1))]
+
+    order = sorted(range(n), key=lambda i: (-columns[0][1][i], -columns[-1][1][i]))
+    for rank, i in enumerate(order, start=1):
+        cells = " · ".join(f"{label} {col[i] * 100:.1f}%" for label, col in columns)
+        lines.append(f"{rank}. {names[ids[i]]} ({stats[i]['elo']}) — {cells}")
+    if done < trials:
+        lines.append(f"*Stopped at {done:,} of {trials:,} simulations to answer in time.*")
+
+    for page in pages(lines):
+        await interaction.followup.send(page)
+
+
+@tree.command(name="matchmake", description="Pair up the players present into balanced matches")
+@app_commands.describe(
+    players="Mention everyone who is here to play",
+    mode="singles pairings or doubles teams",
+    avoid_repeats="Doubles: prefer partners who haven't teamed up much before"
+)
+async def matchmake(
+    interaction: discord.Interaction,
+    players: str,
+    mode: Literal['singles', 'doubles'] = 'singles',
+    avoid_repeats: bool = False
+):
+    ids = list(dict.fromkeys(int(m) for m in re.findall(r'<@!?(\d+)>', players)))
+    needed = 4 if mode == 'doubles' else 2
+    if len(ids) < needed:
+        return await interaction.response.send_message(
+            f"Mention at least {needed} different players for {mode}.", ephemeral=True)
+
+    store = doubles if mode == 'doubles' else singles
+    ratings = {uid: store.get_player(uid)['elo'] for uid in ids}
+    names = await resolver.names(interaction.guild, ids)
+    tag = lambda uid: f"{names[uid]} ({ratings[uid]})"
+
+    lines = [f"**{mode.capitalize()} Matchmaking** ({len(ids)} players)"]
+    if mode == 'doubles':
+        together = partner_counts(doubles.data) if avoid_repeats else None
+        matches, sitting = make_doubles(ratings, together)
+        for i, (t1, t2) in enumerate(matches, start=1):
+            avg1 = (ratings[t1[0]] + ratings[t1[1]]) / 2
+            avg2 = (ratings[t2[0]] + ratings[t2[1]]) / 2
+            lines.append(
+                f"{i}. {tag(t1[0])} & {tag(t1[1])} vs {tag(t2[0])} & {tag(t2[1])}"
+                f" — avg {avg1:g} vs {avg2:g}"
+            )
+    else:
+        pairs, bye = pair_singles(ratings)
+        sitting = [bye] if bye is not None else []
+        for i, (a, b) in enumerate(pairs, start=1):
+            lines.append(f"{i}. {tag(a)} vs {tag(b)} — gap {abs(ratings[a] - ratings[b])}")
+    if sitting:
+        lines.append("Sitting out: " + ", ".join(names[uid] for uid in sitting))
+
+    for i, page in enumerate(pages(lines)):
+        if i == 0:
+            await interaction.response.send_message(page)
+        else:
+            await interaction.followup.send(page)
+
+
 @tree.command(
     name="modifyh2h",
     description="Admin: adjust head-to-head record between two players"
@@ -325,28 +552,14 @@ async def modifyh2h(
     if not is_admin(interaction.user):
         return await interaction.response.send_message("No permission", ephemeral=True)
 
-    data = load_data()
-    register_user(data, player1.id)
-    register_user(data, player2.id)
-
-    k1, k2 = str(player1.id), str(player2.id)
-    h2h1 = data[k1].setdefault('head_to_head', {}).setdefault(k2, {'wins': 0, 'losses': 0})
-    h2h2 = data[k2].setdefault('head_to_head', {}).setdefault(k1, {'wins': 0, 'losses': 0})
-
-    old = h2h1[field]
-    if operation == 'add':
-        new = old + amount
-    elif operation == 'subtract':
-        new = old - amount
-    else:
-        new = amount
-    new = max(0, new)
-
-    h2h1[field] = new
-    inv = 'losses' if field == 'wins' else 'wins'
-    h2h2[inv] = new
-
-    save_data(data)
+    h2h1 = await singles.commit(
+        'modify_h2h',
+        user_id=player1.id,
+        opponent_id=player2.id,
+        field=field,
+        operation=operation,
+        amount=amount
+    )
     await interaction.response.send_message(
         f"H2H updated: {player1.display_name} now has {h2h1['wins']}–{h2h1['losses']} vs {player2.display_name}.",
         ephemeral=True
@@ -372,10 +585,6 @@ async def modifyelo(
     if not is_admin(interaction.user):
         return await interaction.response.send_message("No permission", ephemeral=True)
 
-    data = load_data()
-    register_user(data, user.id)
-    entry = data[str(user.id)]
-
     if field == 'current':
         key = 'elo'
         pretty = 'Current ELO'
@@ -386,27 +595,7 @@ async def modifyelo(
         key = 'all_time_loss'
         pretty = 'Total ELO Lost'
 
-    old = entry.get(key, 0)
-
-    if operation == 'add':
-        new = old + amount
-    elif operation == 'subtract':
-        new = old - amount
-    else:
-        new = amount
-
-    if key == 'elo':
-        new = max(ELO_FLOOR, new)
-    else:
-        new = max(0, new)
-
-    entry[key] = new
-    
-    entry.setdefault('peak_elo', entry['elo'])
-    if entry['elo'] > entry['peak_elo']:
-        entry['peak_elo'] = entry['elo']
-
-    save_data(data)
+    old, new = await singles.commit('modify_stat', user_id=user.id, key=key, operation=operation, amount=amount)
 
     await interaction.response.send_message(
         f"{user.display_name}'s **{pretty}** has been {operation}ed by {amount}.\n"
@@ -415,70 +604,87 @@ async def modifyelo(
     
 @tree.command(name="losers", description="View the top 10 all-time Elo losers")
 async def losers(interaction: discord.Interaction):
-    data = load_data()
-    ranked = sorted(data.items(), key=lambda x: x[1].get('all_time_loss',0), reverse=True)
-    msg = "**Top ELO Losers (All Time)**\n"
-    for i,(uid,stats) in enumerate(ranked[:10], start=1):
-        loss = stats.get('all_time_loss',0)
-        user = await client.fetch_user(int(uid))
-        msg += f"{i}. {user.display_name} — {loss}\n"
+    version = losers_board.version
+    msg = losers_board.cached(interaction.guild_id)
+    if msg is None:
+        top = losers_board.top()
+        names = await resolver.names(interaction.guild, [uid for uid, _ in top])
+        msg = "**Top ELO Losers (All Time)**\n"
+        for i,(uid,loss) in enumerate(top, start=1):
+            msg += f"{i}. {names[int(uid)]} — {loss}\n"
+        losers_board.remember(version, msg, interaction.guild_id)
     await interaction.response.send_message(msg)
     
 @tree.command(name="rivals", description="Show the top 10 rivalries by most games played")
 async def rivals(interaction: discord.Interaction):
     await interaction.response.defer()
 
-    data = load_data()
-    seen = set()
-    records = []
-
-    for uid, entry in data.items():
-        for opp_id, rec in entry.get('head_to_head', {}).items():
-            a, b = sorted((int(uid), int(opp_id)))
-            if (a, b) in seen:
-                continue
-            seen.add((a, b))
-
-            wins_a = data[str(a)]['head_to_head'].get(str(b), {}).get('wins', 0)
-            wins_b = data[str(b)]['head_to_head'].get(str(a), {}).get('wins', 0)
-            total  = wins_a + wins_b
-
-            records.append(((a, b), wins_a, wins_b, total))
-
-    top = sorted(records, key=lambda x: (x[3], max(x[1], x[2])), reverse=True)[:10]
+    data = singles.data
+    top = rivalries(data)
 
+    names = await resolver.names(interaction.guild, [uid for (pair, *_) in top for uid in pair])
     lines = ["**Top Rivalries**"]
     for i, ((a, b), wins_a, wins_b, _) in enumerate(top, start=1):
-        user_a = await client.fetch_user(a)
-        user_b = await client.fetch_user(b)
+        name_a = names[a]
+        name_b = names[b]
         elo_a  = data[str(a)]['elo']
         elo_b  = data[str(b)]['elo']
 
         if wins_a >= wins_b:
             lines.append(
-                f"{i}. {user_a.display_name} ({elo_a}) {wins_a}W - {wins_b}W {user_b.display_name} ({elo_b})"
+                f"{i}. {name_a} ({elo_a}) {wins_a}W - {wins_b}W {name_b} ({elo_b})"
             )
         else:
             lines.append(
-                f"{i}. {user_b.display_name} ({elo_b}) {wins_b}W - {wins_a}W {user_a.display_name} ({elo_a})"
+                f"{i}. {name_b} ({elo_b}) {wins_b}W - {wins_a}W {name_a} ({elo_a})"
             )
 
     await interaction.followup.send("\n".join(lines))
     
     
-@tree.command(name="history", description="Show last 10 matches and Elo trend for a player")
+def archive_slice(archive, user, page, start, end):
+    """
+    (first, last, heading) for a /history-style page or start/end range,
+    1-based and inclusive, or an error message to send instead.
+    """
+    total = archive.matches(user.id)
+    if start is not None:
+        end = min(end or start + HISTORY_LIMIT - 1, start + MAX_HISTORY_RANGE - 1, total)
+        if start < 1 or start > end:
+            return f"{user.display_name} has {total} archived matches; pick a range within 1-{total}."
+        return start, end, f"Matches {start}-{end} of {total} for {user.display_name}"
+    page = page or 1
+    page_count = max(1, -(-total // HISTORY_LIMIT))
+    if not 1 <= page <= page_count:
+        return f"Page must be between 1 and {page_count}."
+    last = total - (page - 1) * HISTORY_LIMIT
+    first = max(1, last - HISTORY_LIMIT + 1)
+    return first, last, f"Matches {first}-{last} of {total} for {user.display_name} (page {page}/{page_count})"
+
+
+@tree.command(name="history", description="Show a player's matches and Elo trend (last 10 by default)")
 @app_commands.describe(
-    user="Player to inspect (defaults to you)"
+    user="Player to inspect (defaults to you)",
+    page="Page of 10 from the full match archive, 1 = most recent",
+    start="First match to show, counting from the player's first archived match",
+    end="Last match to show (with start, at most 25 matches)"
 )
-async def history(interaction: discord.Interaction, user: discord.Member = None):
-    import io
-    import matplotlib.pyplot as plt
-
+async def history(interaction: discord.Interaction, user: discord.Member = None,
+                  page: Optional[int] = None, start: Optional[int] = None, end: Optional[int] = None):
     user = user or interaction.user
-    data = load_data()
-    register_user(data, user.id)
-    entry = data[str(user.id)]
-    history_list = entry.get("match_history", [])
+
+    if page is None and start is None:
+        history_list = singles.get_player(user.id).get("match_history", [])
+        heading = f"Last {len(history_list)} Matches for {user.display_name}"
+        chart_title = f"ELO over last {len(history_list)} matches"
+    else:
+        # on the I/O thread, so the archive already holds every match recorded before this
+        picked = await singles.run_io(archive_slice, singles_archive, user, page, start, end)
+        if isinstance(picked, str):
+            return await interaction.response.send_message(picked, ephemeral=True)
+        first, last, heading = picked
+        history_list = await singles.run_io(singles_archive.history, user.id, first - 1, last)
+        chart_title = f"ELO over matches {first}-{last}"
 
     if not history_list:
         return await interaction.response.send_message(
@@ -496,15 +702,12 @@ async def history(interaction: discord.Interaction, user: discord.Member = None)
     chronological = list(reversed(history_list))
     elos_after = [h['elo_after'] for h in chronological]
 
-    lines = [f"**Last {len(history_list)} Matches for {user.display_name}**"]
+    names = await resolver.names(interaction.guild, [h['opponent_id'] for h in history_list if h['opponent_id']])
+    lines = [f"**{heading}**"]
     for h in history_list:
         you_won = (h['result'] == 'W')
         opp_id = h['opponent_id']
-        try:
-            opp_user = await interaction.client.fetch_user(int(opp_id)) if opp_id else None
-        except:
-            opp_user = None
-        opp_name = opp_user.display_name if opp_user else f"ID:{opp_id}"
+        opp_name = names[int(opp_id)] if opp_id else f"ID:{opp_id}"
 
         score_w = h.get('score_w')
         score_l = h.get('score_l')
@@ -521,29 +724,20 @@ async def history(interaction: discord.Interaction, user: discord.Member = None)
             loser_name         = user.display_name
             loser_elo_after    = h['elo_after']
         outcome_symbol = "🟩" if you_won else "🟥"
+        match_id = f"`#{h['match_id']}` " if 'match_id' in h else ""
         lines.append(
-            f"{outcome_symbol} {winner_name} ({winner_elo_after}) {score_str} {loser_name} ({loser_elo_after})"
+            f"{outcome_symbol} {match_id}{winner_name} ({winner_elo_after}) {score_str} {loser_name} ({loser_elo_after})"
         )
 
-    x_values = list(range(1, len(elos_after) + 1))
-    plt.figure()
-    plt.plot(x_values, elos_after, marker='o')
-    plt.title(f"ELO over last {len(elos_after)} matches")
-    plt.xlabel("Match # (oldest → newest)")
-    plt.ylabel("ELO")
-    plt.grid(True, alpha=0.3)
-    
-    ax = plt.gca()
-    ax.set_xticks(x_values)
-    ax.xaxis.set_major_locator(mticker.FixedLocator(x_values))
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    plt.close()
-    buf.seek(0)
+    # rendering happens in the chart pool; defer so a cold pool can't miss the 3s window
+    await interaction.response.defer()
+    png = await charts.trend_png(elos_after, chart_title)
 
-    file = discord.File(buf, filename="history.png")
-    await interaction.response.send_message("\n".join(lines), file=file)
+    file = discord.File(io.BytesIO(png), filename="history.png")
+    first_page, *rest = pages(lines)
+    await interaction.followup.send(first_page, file=file)
+    for more in rest:
+        await interaction.followup.send(more)
     
 @tree.command(name="loghistory", description="Admin: retroactively add a match history entry (no Elo change)")
 @app_commands.describe(
@@ -560,12 +754,8 @@ async def loghistory(interaction, winner: discord.Member, loser: discord.Member,
     if not is_admin(interaction.user):
         return await interaction.response.send_message("No permission", ephemeral=True)
 
-    data = load_data()
-    register_user(data, winner.id)
-    register_user(data, loser.id)
-
-    append_match_history(
-        data,
+    await singles.commit(
+        'log_history',
         winner_id=winner.id,
         loser_id=loser.id,
         score_w=score_w,
@@ -573,7 +763,6 @@ async def loghistory(interaction, winner: discord.Member, loser: discord.Member,
         winner_elo_after=winner_elo_after,
         loser_elo_after=loser_elo_after
     )
-    save_data(data)
 
     await interaction.response.send_message(
         f"Logged historical match: {winner.display_name} {score_w}-{score_l} {loser.display_name} "
@@ -581,6 +770,59 @@ async def loghistory(interaction, winner: discord.Member, loser: discord.Member,
     )
     
 
+async def send_correction(interaction, seq, args=None):
+    # a correction can re-derive any player: hold every one. Its log and archive work
+    # runs on the I/O thread, after the writes queued before it; the restore is committed here.
+    # `seq` None means the latest match, which is only known once they have landed
+    async with singles.transaction(*singles.data):
+        if seq is None:
+            seq = await singles.run_io(latest_match, singles)
+            if seq is None:
+                return await interaction.response.send_message("No match can be voided yet.", ephemeral=True)
+        try:
+            summary = await singles.run_io(correct, singles, singles_archive, seq, args)
+        except CorrectionError as e:
+            return await interaction.response.send_message(str(e), ephemeral=True)
+        await singles.commit('restore', entries=summary['entries'])
+
+    old = summary['event']['args']
+    names = await resolver.names(interaction.guild, [old['winner_id'], old['loser_id']])
+    was = f"{names[int(old['winner_id'])]} {old.get('score_w', '?')}-{old.get('score_l', '?')} {names[int(old['loser_id'])]}"
+    action = "Voided" if args is None else "Edited"
+    lines = [f"{action} match `#{seq}` ({was})."]
+    if args is not None:
+        new_names = await resolver.names(interaction.guild, [args['winner_id'], args['loser_id']])
+        lines.append(f"Now: {new_names[args['winner_id']]} {args['score_w']}-{args['score_l']} {new_names[args['loser_id']]}")
+    lines.append(f"Re-derived {len(summary['players'])} player(s) in {summary['elapsed'] * 1000:.0f} ms.")
+    await interaction.response.send_message("\n".join(lines))
+
+
+@tree.command(name="voidmatch", description="Admin: remove a logged singles match and recompute the ratings it affected")
+@app_commands.describe(match_id="Match number from /history pages (defaults to the latest match)")
+async def voidmatch(interaction: discord.Interaction, match_id: Optional[int] = None):
+    if not is_admin(interaction.user):
+        return await interaction.response.send_message("No permission.", ephemeral=True)
+    await send_correction(interaction, match_id)
+
+
+@tree.command(name="editmatch", description="Admin: correct a logged singles match and recompute the ratings it affected")
+@app_commands.describe(
+    match_id="Match number from /history pages",
+    winner="Actual winner",
+    loser="Actual loser",
+    score_w="Winner's score",
+    score_l="Loser's score"
+)
+async def editmatch(interaction: discord.Interaction, match_id: int, winner: discord.Member, loser: discord.Member,
+                    score_w: int, score_l: int):
+    if not is_admin(interaction.user):
+        return await interaction.response.send_message("No permission.", ephemeral=True)
+    if winner.id == loser.id:
+        return await interaction.response.send_message("Winner and loser must be different players.", ephemeral=True)
+    await send_correction(interaction, match_id,
+                          {'winner_id': winner.id, 'loser_id': loser.id, 'score_w': score_w, 'score_l': score_l})
+
+
 @tree.command(name="setpeak", description="Admin: set a player's peak ELO manually")
 @app_commands.describe(
     user="The player whose peak ELO you want to set",
@@ -595,18 +837,9 @@ async def setpeak(interaction: discord.Interaction,
     if peak_elo < 0:
         return await interaction.response.send_message("Peak ELO must be non-negative.", ephemeral=True)
 
-    data = load_data()
-    register_user(data, user.id)
-    entry = data[str(user.id)]
-
-    current_elo = entry.get('elo', 100)
-
-    if 'peak_elo' not in entry:
-        entry['peak_elo'] = current_elo
-
-    old_peak = entry['peak_elo']
-    entry['peak_elo'] = peak_elo
-    save_data(data)
+    async with singles.transaction(user.id):
+        current_elo = singles.get_player(user.id).get('elo', 100)
+        old_peak = await singles.commit('set_peak', user_id=user.id, peak_elo=peak_elo)
 
     await interaction.response.send_message(
         f"Peak Updated: {peak_elo}. "
@@ -622,13 +855,8 @@ async def dstats(
     user: Optional[discord.Member] = None
 ):
     user = user or interaction.user
-    data = dE.load_data()
-    dE.register_user(data, user.id)
-    stats = dE.get_stats(data, user.id)
-
-    ranked = sorted(data.items(), key=lambda kv: kv[1]["elo"], reverse=True)
-    pos = next((i for i,(uid,_) in enumerate(ranked) if int(uid)==user.id), None)
-    rank = pos+1 if pos is not None else "–"
+    stats = doubles.get_player(user.id)
+    rank = doubles_ranks.place(str(user.id), stats['elo'])[0]
 
     msg = (
         f"**{user.display_name} | Doubles #{rank}**\n"
@@ -673,23 +901,11 @@ async def dmatch(
     if not is_admin(interaction.user):
         return await interaction.response.send_message("No permission", ephemeral=True)
 
-    data = dE.load_data()
-    for p in (a1, a2, b1, b2):
-        dE.register_user(data, p.id)
-
-    before = {
-        a1.id: data[str(a1.id)]['elo'],
-        a2.id: data[str(a2.id)]['elo'],
-        b1.id: data[str(b1.id)]['elo'],
-        b2.id: data[str(b2.id)]['elo'],
-    }
-
-    result = dE.process_doubles_match(
-        data,
-        a1.id, a2.id,
-        b1.id, b2.id
-    )
-    dE.save_data(data)
+    data = doubles.data
+    # nothing else may rate these four between reading `before` and committing
+    async with doubles.transaction(a1.id, a2.id, b1.id, b2.id):
+        before = {p.id: doubles.get_player(p.id)['elo'] for p in (a1, a2, b1, b2)}
+        result = await doubles.commit('dmatch', a1=a1.id, a2=a2.id, b1=b1.id, b2=b2.id, score_w=score_w, score_l=score_l)
 
     after = {
         a1.id: data[str(a1.id)]['elo'],
@@ -698,13 +914,8 @@ async def dmatch(
         b2.id: data[str(b2.id)]['elo'],
     }
 
-    def paired_stats(p, q):
-        wins = data[str(p)]['partners'].get(str(q), 0)
-        losses = data[str(p)].get('partner_losses', {}).get(str(q), 0)
-        return wins, losses
-
-    w_wins, w_losses = paired_stats(a1.id, a2.id)
-    l_wins, l_losses = paired_stats(b1.id, b2.id)
+    w_wins, w_losses = dE.partnership(data, a1.id, a2.id)
+    l_wins, l_losses = dE.partnership(data, b1.id, b2.id)
 
     set_lines = []
     if set_count and winner_sets and loser_sets:
@@ -739,39 +950,108 @@ async def dmatch(
 
     await interaction.response.send_message(msg)
 
+@tree.command(name="dhistory", description="Show a player's recent doubles matches and DELO trend")
+@app_commands.describe(
+    user="Player to inspect (defaults to you)",
+    page="Page of 10, 1 = most recent",
+    start="First match to show, counting from the player's first doubles match",
+    end="Last match to show (with start, at most 25 matches)"
+)
+async def dhistory(interaction: discord.Interaction, user: discord.Member = None,
+                   page: Optional[int] = None, start: Optional[int] = None, end: Optional[int] = None):
+    user = user or interaction.user
+    if page is None and start is None:
+        # the latest matches are the archive's in-memory ring, so no need to queue behind disk writes
+        history_list = doubles_archive.history(user.id, -HISTORY_LIMIT)
+        heading = f"Last {len(history_list)} Doubles Matches for {user.display_name}"
+        chart_title = f"DELO over last {len(history_list)} matches"
+    else:
+        picked = await doubles.run_io(archive_slice, doubles_archive, user, page, start, end)
+        if isinstance(picked, str):
+            return await interaction.response.send_message(picked, ephemeral=True)
+        first, last, heading = picked
+        heading = heading.replace("Matches", "Doubles Matches", 1)
+        history_list = await doubles.run_io(doubles_archive.history, user.id, first - 1, last)
+        chart_title = f"DELO over matches {first}-{last}"
+
+    if not history_list:
+        return await interaction.response.send_message(
+            f"No doubles history for {user.display_name} yet."
+        )
+
+    ids = {h['partner_id'] for h in history_list} | {o for h in history_list for o in h['opponent_ids']}
+    names = await resolver.names(interaction.guild, ids)
+    lines = [f"**{heading}**"]
+    for h in history_list:
+        o1, o2 = (names[o] for o in h['opponent_ids'])
+        us = f"{user.display_name} & {names[h['partner_id']]}"
+        them = f"{o1} & {o2}"
+        score_str = f"{h['score_w']}-{h['score_l']}" if h['score_w'] or h['score_l'] else "?"
+        if h['result'] == 'W':
+            lines.append(f"🟩 {us} {score_str} {them} ({h['delta']:+d} → {h['elo_after']})")
+        else:
+            lines.append(f"🟥 {them} {score_str} {us} ({h['delta']:+d} → {h['elo_after']})")
+
+    await interaction.response.defer()
+    png = await charts.trend_png([h['elo_after'] for h in reversed(history_list)], chart_title)
+
+    file = discord.File(io.BytesIO(png), filename="dhistory.png")
+    first_page, *rest = pages(lines)
+    await interaction.followup.send(first_page, file=file)
+    for more in rest:
+        await interaction.followup.send(more)
+
 @tree.command(name="duos", description="Top 10 Best Doubles")
-async def duos(interaction: discord.Interaction):
-    data = dE.load_data()
-
-    pair_wins: dict[tuple[int,int], int] = {}
-    for pid_str, entry in data.items():
-        me = int(pid_str)
-        for partner_str, wins in entry.get("partners", {}).items():
-            partner = int(partner_str)
-            if me < partner:
-                pair = (me, partner)
-                pair_wins[pair] = wins
-
-    top10 = sorted(pair_wins.items(), key=lambda kv: kv[1], reverse=True)[:10]
-
-    lines = ["**Top Duos**"]
-    for i, ((p1, p2), wins) in enumerate(top10, start=1):
-        m1 = await interaction.client.fetch_user(p1)
-        m2 = await interaction.client.fetch_user(p2)
-        lines.append(f"{i}. {m1.display_name} & {m2.display_name} — {wins}W")
+@app_commands.describe(rank_by="Most wins together (default), best win rate, or most games together")
+async def duos(interaction: discord.Interaction,
+               rank_by: Literal['wins', 'win rate', 'games'] = 'wins'):
+    index = doubles.data.duos
+    if rank_by == 'win rate':
+        top = index.best_rate()
+        title = f"**Top Duos by Win Rate** (at least {index.min_games} games)"
+    elif rank_by == 'games':
+        top = index.most_games()
+        title = "**Most Played Duos**"
+    else:
+        top = index.most_wins()
+        title = "**Top Duos**"
+
+    names = await resolver.names(interaction.guild, [uid for pair, *_ in top for uid in pair])
+    lines = [title]
+    for i, ((p1, p2), wins, losses, games) in enumerate(top, start=1):
+        lines.append(f"{i}. {names[p1]} & {names[p2]} — {wins}W-{losses}L ({wins / games:.0%})")
+
+    await interaction.response.send_message("\n".join(lines))
+
+@tree.command(name="partners", description="Show who a player teams up with most in doubles")
+@app_commands.describe(user="Player to look up (defaults to you)")
+async def partners(interaction: discord.Interaction, user: discord.Member = None):
+    user = user or interaction.user
+    top = dE.partners_of(doubles.data, user.id)
+    if not top:
+        return await interaction.response.send_message(f"{user.display_name} hasn't played doubles yet.")
+
+    names = await resolver.names(interaction.guild, [uid for uid, *_ in top])
+    lines = [f"**{user.display_name}'s Partners**"]
+    for i, (uid, wins, losses, games) in enumerate(top, start=1):
+        lines.append(f"{i}. {names[uid]} — {wins}W-{losses}L ({wins / games:.0%})")
 
     await interaction.response.send_message("\n".join(lines))
 
 @tree.command(name="dleaderboard", description="Top 10 doubles ELO")
 async def dleaderboard(interaction: discord.Interaction):
-    data = dE.load_data()
-    top10 = sorted(data.items(), key=lambda kv: kv[1]["elo"], reverse=True)[:10]
-    lines = ["**Doubles ELO Leaderboard**"]
-    for i, (uid, stats) in enumerate(top10, start=1):
-        user = await interaction.client.fetch_user(int(uid))
-        lines.append(f"{i}. {user.display_name} — {stats['elo']}")
+    version = doubles_ranks.version
+    msg = doubles_ranks.cached(interaction.guild_id)
+    if msg is None:
+        top = doubles_ranks.top()
+        names = await resolver.names(interaction.guild, [uid for uid, _ in top])
+        lines = ["**Doubles ELO Leaderboard**"]
+        for i, (uid, elo) in enumerate(top, start=1):
+            lines.append(f"{i}. {names[int(uid)]} — {elo}")
+        msg = "\n".join(lines)
+        doubles_ranks.remember(version, msg, interaction.guild_id)
 
-    await interaction.response.send_message("\n".join(lines))
+    await interaction.response.send_message(msg)
 
 @tree.command(
     name="dmodify",
@@ -791,23 +1071,129 @@ async def dmodify(
     if not is_admin(interaction.user):
         return await interaction.response.send_message("No permission", ephemeral=True)
 
-    data = dE.load_data()
-    dE.register_user(data, user.id)
-    entry = data[str(user.id)]
-
-    entry[field] = value
-    dE.save_data(data)
+    await doubles.commit('set_stat', user_id=user.id, stat=field, value=value)
 
     await interaction.response.send_message(
         f"{user.display_name}'s **{field}** set to {value}."
     )
 
+# SEASONS
+
+season_group = app_commands.Group(name="season", description="Season archives")
+
+@season_group.command(name="end", description="Admin: archive this season's standings and reset all ratings")
+@app_commands.describe(confirm="Must be true; this resets every singles and doubles rating", title="Name for the season (optional)")
+async def season_end(interaction: discord.Interaction, confirm: bool, title: Optional[str] = None):
+    if not is_admin(interaction.user):
+        return await interaction.response.send_message("No permission", ephemeral=True)
+    if not confirm:
+        return await interaction.response.send_message("Nothing changed; pass confirm:true to end the season.", ephemeral=True)
+
+    await interaction.response.defer()
+    n = seasons.current_season()
+    top = singles_ranks.top()[:3]
+    # both leagues are held whole (new players too) from copying the standings to the reset,
+    # so no match falls between; the reset is only committed once the standings are on disk,
+    # and if either reset fails, neither stays and the archived season is removed again
+    async with singles.exclusive(), doubles.exclusive():
+        standings = {'singles': season_standings(singles.data), 'doubles': season_standings(doubles.data)}
+        try:
+            await singles.run_io(seasons.freeze, n, standings, title)
+        except OSError as e:
+            return await interaction.followup.send(f"Couldn't archive season {n} ({e}); nothing was reset.")
+        before, reset = seasons.reset_fields(singles.data), []
+        try:
+            for store in (singles, doubles):
+                await store.commit('new_season')
+                reset.append(store)
+        except Exception as e:
+            # the failed commit put its own league back; put back the one before it
+            if reset:
+                await singles.commit('undo_season', entries=seasons.unreset(singles.data, before))
+            await singles.run_io(seasons.unfreeze, n)
+            return await interaction.followup.send(f"Couldn't reset the ratings ({e}); season {n} goes on, nothing was reset.")
+
+    names = await resolver.names(interaction.guild, [uid for uid, _ in top])
+    medals = ['🥇', '🥈', '🥉']
+    lines = [f"**{title or f'Season {n}'} is over!**"]
+    lines += [f"{medals[i]} {names[int(uid)]} — {elo}" for i, (uid, elo) in enumerate(top)]
+    lines.append(f"Final standings are saved (`/leaderboard season:{n}`). Season {n + 1} starts now; every rating is back to 100.")
+    await interaction.followup.send("\n".join(lines))
+
+@season_group.command(name="list", description="List finished seasons")
+async def season_list(interaction: discord.Interaction):
+    done = seasons.list_seasons()
+    if not done:
+        return await interaction.response.send_message("No finished seasons yet; this is season 1.")
+    lines = ["**Seasons**"]
+    for n in done:
+        m = seasons.meta(n)
+        ended = f"<t:{m['ended_at']}:D>"
+        lines.append(f"{n}. {m.get('title') or f'Season {n}'} — ended {ended}, {m['players'].get('singles', 0)} players")
+    lines.append(f"Current: season {seasons.current_season()}")
+    await interaction.response.send_message("\n".join(lines))
+
+tree.add_command(season_group)
+
+# DIAGNOSTICS
+
+def _ms(p):
+    return " / ".join(f"{v * 1000:.0f}" for v in p[:3])
+
+@tree.command(name="perf", description="Admin: command latency percentiles and slow calls")
+@app_commands.describe(command="Break one command down by stage, e.g. history or season end (optional)")
+async def perf_report(interaction: discord.Interaction, command: Optional[str] = None):
+    if not is_admin(interaction.user):
+        return await interaction.response.send_message("No permission", ephemeral=True)
+
+    rec = perf.recorder
+    if command is not None:
+        command = command.strip().lstrip('/')
+        stats = rec.percentiles(command)
+        if not stats:
+            return await interaction.response.send_message(f"No calls of /{command} recorded yet.", ephemeral=True)
+        lines = [f"**/{command}** — {rec.calls[command]} calls, {rec.failures.get(command, 0)} failed (p50 / p95 / p99 ms)"]
+        for stage, p in stats.items():
+            budget = perf.BUDGETS.get(stage)
+            over = " ⚠️" if budget is not None and p[2] > budget else ""
+            lines.append(f"`{stage:<8}` {_ms(p)} over {p[3]} calls{over}")
+    else:
+        lines = [f"**Command latency** (last {perf.WINDOW} calls each; total and ack p50 / p95 / p99 ms)"]
+        for name in rec.commands():
+            stats = rec.percentiles(name)
+            ack = f", ack {_ms(stats['ack'])}" if 'ack' in stats else ""
+            lines.append(f"/{name} — {rec.calls[name]} calls: {_ms(stats['total'])}{ack}")
+        if len(lines) == 1:
+            lines.append("No commands recorded since startup.")
+
+    c = resolver.counters
+    lines.append(f"Names: {c['member']} member, {c['user']} user, {c['cache']} cached, {c['fetch']} fetched, {c['failed']} failed")
+    lines.append(f"Charts: {charts.hits} cache hits, {charts.misses} renders")
+    if rec.slow:
+        lines.append("**Recent slow calls**")
+        for entry in list(rec.slow)[-5:]:
+            over = ", ".join(f"{k} {entry['stages'][k] * 1000:.0f}ms" for k in entry['over'])
+            lines.append(f"{entry['at']} /{entry['command']}: {over}")
+    for page in pages(lines):
+        if not interaction.response.is_done():
+            await interaction.response.send_message(page, ephemeral=True)
+        else:
+            await interaction.followup.send(page, ephemeral=True)
+
 # LAUNCH COMMANDS
 
 @client.event
 async def on_ready():
     print(f"Logged in as {client.user}")
     await client.wait_until_ready()
+    if 'ready' not in startup.phases:
+        startup.mark('ready')
+        if PREWARM:
+            asyncio.create_task(_prewarm())
+        else:
+            startup.write_report()
+        if DECAY_ENABLED:
+            asyncio.create_task(decay_job.run_forever())
     try:
         synced_guild=await tree.sync(guild=discord.Object(id=DEV_GUILD_ID))
         print(f"Synced {len(synced_guild)} commands to guild {DEV_GUILD_ID}")
@@ -815,6 +1201,23 @@ async def on_ready():
         print(f"Guild sync failed: {e}")
     asyncio.create_task(_global_sync())
 
+async def _prewarm():
+    """Start the chart and /predict workers now; the startup report waits for their RSS."""
+    for name, futures in (('charts', charts.prewarm()), ('predict', predictor.prewarm())):
+        try:
+            warm = await asyncio.gather(*map(asyncio.wrap_future, futures))
+        except Exception as e:
+            print(f"Prewarming {name} workers failed: {e}")
+            continue
+        startup.workers[name] = dict(warm)
+    startup.write_report()
+
+@client.event
+async def on_app_command_completion(interaction, command):
+    call = interaction.extras.pop('perf', None)
+    if call is not None:
+        perf.recorder.end(call)
+
 async def _global_sync():
     await client.wait_until_ready()
     try:
@@ -822,5 +1225,18 @@ async def _global_sync():
         print(f"Globally synced {len(synced_global)} commands")
     except Exception as e:
         print(f"Global sync failed: {e}")
-        
-client.run(botToken)
+
+
+def main():
+    singles.load()
+    doubles.load()
+    startup.mark('loaded')
+
+    client.run(botToken)
+
+    # finish the writes already queued, then anything still waiting on the debounce timer
+    storage_io.shutdown(wait=True)
+    singles.flush()
+    doubles.flush()
+    charts.shutdown()
+    predictor.shutdown()
@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from perf import stage
+
+
+POOL_WORKERS = 2
+CACHE_SIZE   = 256   # rendered PNGs kept in memory
+
+
+def render_trend(elos, title):
+    """
+    Draw an ELO trend line and return it as PNG bytes.
+
+    Runs inside a worker process and uses the object-oriented Figure/Agg
+    API, never pyplot, so no global figure state is shared.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import matplotlib.ticker as mticker
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    x_values = list(range(1, len(elos) + 1))
+    ax.plot(x_values, elos, marker='o')
+    ax.set_title(title)
+    ax.set_xlabel("Match # (oldest → newest)")
+    ax.set_ylabel("ELO")
+    ax.grid(True, alpha=0.3)
+    ax.set_xticks(x_values)
+    ax.xaxis.set_major_locator(mticker.FixedLocator(x_values))
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight')
+    return buf.getvalue()
+
+
+def _warm():
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from startup import rss_mb
+    return os.getpid(), rss_mb()
+
+
+class ChartRenderer:
+    """
+    Renders charts in a process pool so the event loop (and the gateway
+    heartbeat) never waits on matplotlib. Finished PNGs go into a bounded
+    LRU cache keyed by a hash of what was drawn, so a repeat /history for
+    a player whose match_history has not changed is served instantly.
+    Identical renders already in flight are shared rather than repeated.
+    """
+
+    def __init__(self, workers=POOL_WORKERS, cache_size=CACHE_SIZE):
+        self.workers = workers
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._pool = None
+        self._cache = OrderedDict()   # key -> png bytes
+        self._pending = {}            # key -> Future
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn, not fork: the bot process has a running event loop and threads
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def prewarm(self):
+        """
+        Start the workers and import matplotlib in them now, in the
+        background, instead of on the first /history.
+        """
+        pool = self._executor()
+        return [pool.submit(_warm) for _ in range(self.workers)]
+
+    @staticmethod
+    def key(elos, title):
+        return hashlib.sha1(json.dumps([title, list(elos)]).encode()).hexdigest()
+
+    async def trend_png(self, elos, title):
+        with stage('chart'):
+            return await self._trend_png(elos, title)
+
+    async def _trend_png(self, elos, title):
+        key = self.key(elos, title)
+        png = self._cache.get(key)
+        if png is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return png
+
+        self.misses += 1
+        pending = self._pending.get(key)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = loop.run_in_executor(self._executor(), render_trend, list(elos), title)
+            self._pending[key] = pending
+            try:
+                png = await pending
+            finally:
+                del self._pending[key]
+            self._cache[key] = png
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return png
+        return await asyncio.shield(pending)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,161 @@
+"""
+/voidmatch and /editmatch: fix a past singles match after the fact.
+
+The match's event is rewritten in the league's EventLog, then only what
+it could have changed is worked out again. Those are the players linked
+to it through the events logged since the checkpoint before it (anyone
+who played, or played someone who played, ... one of its players).
+They are read from that checkpoint, every logged event that touches them
+is replayed into a scratch league, and the resulting entries replace the
+live ones in one journaled 'restore' op. The replayed matches' archive
+records and any later checkpoints are patched to agree, so /history and
+the next correction see the corrected past.
+
+`latest_match` and `correct` only read and write the log and archive, and
+run on the store's I/O thread (`await store.run_io(correct, ...)`); the
+caller commits the 'restore' op from the event loop.
+"""
+import json
+import time
+
+from archive import VOIDED, EDITED
+from store import PLAYER_ARGS
+from utils import json_default
+
+
+class CorrectionError(ValueError):
+    """The match can't be corrected; the message says why."""
+
+
+def _players(event):
+    return [str(event['args'][k]) for k in PLAYER_ARGS if k in event['args']]
+
+
+def _linked(events, seeds):
+    """Players connected to `seeds` by sharing an event (union-find)."""
+    parent = {}
+
+    def find(u):
+        parent.setdefault(u, u)
+        while parent[u] != u:
+            parent[u] = parent[parent[u]]
+            u = parent[u]
+        return u
+
+    for event in events:
+        ids = _players(event)
+        if ids:
+            root = find(ids[0])
+            for uid in ids[1:]:
+                parent[find(uid)] = root
+    roots = {find(u) for u in seeds}
+    return {u for u in parent if find(u) in roots}
+
+
+def _frozen(scratch, players):
+    # a copy of the players' entries as they are now; replay keeps mutating scratch
+    return json.loads(json.dumps({u: scratch[u] for u in players if u in scratch}, default=json_default))
+
+
+def latest_match(store):
+    """Seq of the newest match that can still be corrected, or None."""
+    if store.log is None or not store.log.checkpoints:
+        return None
+    store.sync_log()
+    for event in reversed(store.log.read_since(store.log.checkpoints[0])):
+        if event['op'] == 'match' and not event.get('void'):
+            return event['seq']
+    return None
+
+
+def correct(store, archive, seq, args=None):
+    """
+    Void match `seq` (args None) or replace its arguments with `args`
+    (winner_id, loser_id, score_w, score_l) in the log and archive.
+    Returns a summary dict with the original event, the re-derived
+    players, their `entries` for the 'restore' op and the time it took.
+    """
+    started = time.perf_counter()
+    log = store.log
+    if log is None:
+        raise CorrectionError("Match corrections need the JSON journal (STORAGE=json).")
+    store.sync_log()    # the log must hold every event up to now
+
+    c = log.checkpoint_before(seq)
+    if c is None:
+        raise CorrectionError(f"Match #{seq} is older than the event log.")
+    events = log.read_since(c)
+    old = next((e for e in events if e['seq'] == seq), None)
+    if old is None or old['op'] != 'match' or old.get('void'):
+        raise CorrectionError(f"There is no match #{seq} to correct.")
+    # a season end whose reset was taken back is followed straight away by its undo_season
+    undone = {e['seq'] - 1 for e in events if e['op'] == 'undo_season'}
+    if any(e['op'] == 'new_season' and e['seq'] > seq and e['seq'] not in undone for e in events):
+        raise CorrectionError(f"Match #{seq} belongs to a finished season.")
+
+    new = dict(old, void=True) if args is None else dict(old, args=args, edited=True)
+    # earlier corrections' restores are skipped: the rewritten log replays to the same state
+    live = [new if e['seq'] == seq else e for e in events
+            if e['op'] != 'restore' and not e.get('void')]
+    if args is None:
+        live = [e for e in live if e['seq'] != seq]
+    players = _linked(live, set(_players(old)) | set(_players(new)))
+
+    scratch = log.load_players(c, players)
+    later = [k for k in log.checkpoints if k >= seq]
+    patches = {}
+    results = {}
+    for event in live:
+        while later and later[0] < event['seq']:
+            patches[later.pop(0)] = _frozen(scratch, players)
+        ids = _players(event)
+        if ids and ids[0] not in players:
+            continue
+        result = store.backend.OPS[event['op']](scratch, **event['args'])
+        if event['op'] == 'match' and event['seq'] >= seq:
+            results[event['seq']] = result
+    for k in later:
+        patches[k] = _frozen(scratch, players)
+
+    entries = {}
+    for uid in players:
+        if uid not in scratch:
+            # only ever played in the voided match
+            store.backend.register_user(scratch, uid)
+        entries[uid] = scratch[uid]
+
+    log.rewrite(new)
+    for k, patch in patches.items():
+        log.patch(k, patch)
+    _fix_archive(archive, seq, new, results)
+
+    return {
+        'event':   old,
+        'players': sorted(players, key=int),
+        'entries': entries,
+        'elapsed': time.perf_counter() - started,
+    }
+
+
+def _fix_archive(archive, seq, new, results):
+    first = archive.find(seq)
+    if first is None:
+        return
+    for i, rec in enumerate(archive.read_from(first)):
+        s = int(rec['seq'])
+        if s not in results and s != seq:
+            continue
+        was, rec = rec, rec.copy()
+        if s == seq and new.get('void'):
+            rec['flags'] |= VOIDED
+        else:
+            if s == seq:
+                args = new['args']
+                rec['flags'] |= EDITED
+                rec['winner'], rec['loser'] = args['winner_id'], args['loser_id']
+                rec['score_w'], rec['score_l'] = args.get('score_w') or 0, args.get('score_l') or 0
+            r = results[s]
+            rec['w_before'], rec['l_before'] = r['winner_elo_before'], r['loser_elo_before']
+            rec['w_after'], rec['l_after'] = r['winner_elo_after'], r['loser_elo_after']
+        if rec.tobytes() != was.tobytes():
+            archive.rewrite(first + i, rec)
@@ -0,0 +1,130 @@
+"""
+Nightly rating period: inactivity decay for singles and doubles.
+
+Once a day (DECAY_HOUR, UTC) every player whose last archived match is
+older than the grace period loses DECAY_RATE of whatever they hold above
+DECAY_TARGET. The amounts for a whole league are worked out in one numpy
+pass and applied as `decay` ops through `LeagueStore.commit_many`, so they
+are journaled like any other mutation and each leaderboard index is
+touched once per player. The batch is applied in slices with a yield to
+the event loop in between, so commands keep being answered meanwhile;
+each slice is planned again under its players' locks, so a match played
+since the first pass is decayed from (or spared by) its new rating.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from utils import write_json_atomic
+
+
+DECAY_ENABLED = os.getenv("DECAY", "0") == "1"       # off unless opted in
+DECAY_HOUR    = int(os.getenv("DECAY_HOUR", "4"))           # UTC
+GRACE_DAYS    = float(os.getenv("DECAY_GRACE_DAYS", "28"))  # idle days before decay starts
+DECAY_RATE    = float(os.getenv("DECAY_RATE", "0.02"))      # share of the gap to DECAY_TARGET lost per night
+DECAY_TARGET  = int(os.getenv("DECAY_TARGET", "100"))       # ratings never decay below this
+STATE_FILE    = 'decay_state.json'
+SLICE         = 500     # ops applied between yields to the event loop
+
+
+def plan(uids, elos, last_played, now, since):
+    """
+    [(uid, amount), ...] for one league. `last_played` holds unix times,
+    NaN for players with no archived match; they count as last seen at
+    `since` (when decay was first switched on).
+    """
+    if not uids:
+        return []
+    elos = np.asarray(elos, dtype=np.int64)
+    last = np.asarray(last_played, dtype=float)
+    last = np.where(np.isnan(last), since, last)
+
+    idle_days = (now - last) / 86400
+    gap = elos - DECAY_TARGET
+    due = (idle_days > GRACE_DAYS) & (gap > 0)
+    amount = np.where(due, np.minimum(np.ceil(gap * DECAY_RATE), gap), 0).astype(np.int64)
+    hit = np.flatnonzero(amount)
+    return list(zip([uids[i] for i in hit], amount[hit].tolist()))
+
+
+def _load_state():
+    try:
+        with open(STATE_FILE, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def seconds_until(hour, now=None):
+    now = now or datetime.now(timezone.utc)
+    run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if run <= now:
+        run += timedelta(days=1)
+    return (run - now).total_seconds()
+
+
+class DecayJob:
+    """
+    `leagues` is [(name, LeagueStore, MatchArchive), ...]; the archive
+    supplies each player's last match time.
+    """
+
+    def __init__(self, leagues):
+        self.leagues = leagues
+        self.state = {}
+
+    async def run_io(self, fn, *args):
+        # the state file goes through the stores' I/O thread like every other write
+        return await self.leagues[0][1].run_io(fn, *args)
+
+    async def run_once(self, now=None):
+        """Decay every league once; returns {league name: players decayed}."""
+        now = now or time.time()
+        self.state = await self.run_io(_load_state)
+        since = self.state.setdefault('since', now)
+
+        summary = {}
+        for name, store, archive in self.leagues:
+            def columns(uids):
+                uids = [u for u in uids if u in store.data]
+                elos = [store.data[u]['elo'] for u in uids]
+                last = [archive.last_time.get(int(u), np.nan) for u in uids]
+                return uids, elos, last
+
+            due = [uid for uid, _ in plan(*columns(list(store.data)), now, since)]
+            done = 0
+            for i in range(0, len(due), SLICE):
+                async with store.transaction(*due[i:i + SLICE]):
+                    # the first pass may be stale by now; these players can't change until we commit
+                    changes = plan(*columns(due[i:i + SLICE]), now, since)
+                    if changes:
+                        await store.commit_many([('decay', {'user_id': int(uid), 'amount': amount})
+                                                 for uid, amount in changes])
+                done += len(changes)
+            summary[name] = done
+
+        self.state['last_run'] = now
+        await self.run_io(write_json_atomic, STATE_FILE, self.state)
+        return summary
+
+    async def run_forever(self):
+        while True:
+            since_last = time.time() - (await self.run_io(_load_state)).get('last_run', 0)
+            if since_last > 26 * 3600:
+                # a scheduled run was missed (bot was down) or first start: catch up now
+                delay = 0
+            else:
+                delay = seconds_until(DECAY_HOUR)
+                if since_last + delay < 20 * 3600:
+                    delay += 86400      # just caught up; skip to tomorrow's slot
+            await asyncio.sleep(delay)
+            try:
+                summary = await self.run_once()
+                print(f"Decay: {', '.join(f'{k} {v}' for k, v in summary.items())} players adjusted")
+            except Exception as e:
+                print(f"Decay failed: {e}")
+                await asyncio.sleep(3600)
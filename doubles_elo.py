@@ -1,7 +1,12 @@
+import copy
 import json
 import math
-from elo import expected_score
+from elo import expected_score, STORAGE
+from duos import DuoIndex
+from records import DoublesLeague, DoublesRecord
+from utils import write_json_atomic
 
+LEAGUE        = 'doubles'
 DATA_FILE     = 'doubles_data.json'
 K             = 24
 ELO_FLOOR     = 5
@@ -15,45 +20,102 @@ def get_stats(data, user_id):
     return data.get(str(user_id), None)
 
 def load_data():
-    try:
-        with open(DATA_FILE, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-
-def save_data(data):
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    if STORAGE == 'sqlite':
+        import sqlite_store
+        raw = sqlite_store.load_data(LEAGUE)
+    else:
+        try:
+            with open(DATA_FILE, 'r') as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            raw = {}
+    return league(raw)
+
+def league(raw):
+    """
+    A DoublesLeague of DoublesRecords from {uid: entry} in the file schema,
+    with every partnership held once in its DuoIndex (see duos.py).
+    """
+    data = DoublesLeague()
+    data.duos = DuoIndex()
+    for uid, entry in raw.items():
+        data[uid] = DoublesRecord.from_dict(entry, data.duos, uid)
+    if data.duos.conflicts:
+        print(f"{data.duos.conflicts} doubles partnership(s) disagreed between the two players' records; "
+              f"kept the side loaded first")
+    return data
+
+def save_data(data, user_ids=None):
+    if STORAGE == 'sqlite':
+        import sqlite_store
+        sqlite_store.save_data(LEAGUE, data, user_ids)
+        return
+    write_json_atomic(DATA_FILE, data)
 
 def register_user(data, user_id):
     key = str(user_id)
-    if key not in data:
-        data[key] = {
-            'elo':           100,
-            'wins':          0,
-            'losses':        0,
-            'streak':        0,
-            'medals':        [],
-            'all_time_gain': 0,
-            'all_time_loss': 0,
-            'peak_elo':      100,
-            'partners':      {},   # track wins WITH each teammate
-            'partners_losses':{}  # losses with each partner
-        }
-    else:
-        entry = data[key]
-        entry.setdefault('elo',           100)
-        entry.setdefault('wins',          0)
-        entry.setdefault('losses',        0)
-        entry.setdefault('streak',        0)
-        entry.setdefault('medals',        [])
-        entry.setdefault('all_time_gain', 0)
-        entry.setdefault('all_time_loss', 0)
-        entry.setdefault('peak_elo',      entry.get('elo', 100))
-        entry.setdefault('partners',      {})
-        entry.setdefault('partners_losses', {})
-
-def process_doubles_match(data, a1, a2, b1, b2):
+    entry = data.get(key)
+    duos = getattr(data, 'duos', None)
+    if entry is None:
+        # partners: wins WITH each teammate, partners_losses: losses with them
+        entry = data[key] = DoublesRecord.new()
+        if duos is not None:
+            entry.partners, entry.partners_losses = duos.view(key, 0), duos.view(key, 1)
+    elif type(entry) is not DoublesRecord:
+        data[key] = DoublesRecord.from_dict(entry, duos, key)
+
+def partners_of(data, user_id, k=10):
+    """[(partner, wins, losses, games), ...] for the `k` teammates `user_id` played with most."""
+    duos = getattr(data, 'duos', None)
+    if duos is not None:
+        return duos.partners_of(user_id, k)
+    entry = data.get(str(user_id))
+    if entry is None:
+        return []
+    wins, losses = entry.get('partners', {}), entry.get('partners_losses', {})
+    out = [(int(p), wins.get(p, 0), losses.get(p, 0), wins.get(p, 0) + losses.get(p, 0))
+           for p in wins.keys() | losses.keys()]
+    out.sort(key=lambda p: (-p[3], -p[1], p[0]))
+    return out[:k]
+
+def partnership(data, a, b):
+    """(wins, losses) of `a` and `b` as teammates."""
+    duos = getattr(data, 'duos', None)
+    if duos is not None:
+        return duos.record(a, b) or (0, 0)
+    entry = data.get(str(a), {})
+    return entry.get('partners', {}).get(str(b), 0), entry.get('partners_losses', {}).get(str(b), 0)
+
+def restore_players(data, entries):
+    """Replace whole player entries with {uid: entry}; an entry of None removes the player."""
+    duos = getattr(data, 'duos', None)
+    for uid, entry in entries.items():
+        if entry is None:
+            data.pop(str(uid), None)
+            if duos is not None:
+                duos.drop(uid)
+        else:
+            data[str(uid)] = DoublesRecord.from_dict(copy.deepcopy(entry), duos, uid, replace=True)
+
+def set_stat(data, user_id, stat, value):
+    register_user(data, user_id)
+    data[str(user_id)][stat] = value
+
+def apply_decay(data, user_id, amount):
+    """Take `amount` off an inactive player's rating (see decay.py). Returns the new rating."""
+    register_user(data, user_id)
+    entry = data[str(user_id)]
+    entry['elo'] = max(ELO_FLOOR, entry['elo'] - amount)
+    entry['decayed'] = entry.get('decayed', 0) + amount
+    return entry['elo']
+
+def reset_season(data):
+    """Start a new season: ratings and records reset, partner tallies and all-time totals stay."""
+    for entry in data.values():
+        entry.update(elo=100, peak_elo=100, wins=0, losses=0, streak=0)
+
+def process_doubles_match(data, a1, a2, b1, b2, score_w=None, score_l=None):
+    # scores don't affect ratings; they're taken so the match archive can record them
     for pid in (a1,a2,b1,b2):
         register_user(data, pid)
 
@@ -77,6 +139,8 @@ def process_doubles_match(data, a1, a2, b1, b2):
     delta_win  = math.ceil(base_delta * win_scale)
     delta_loss = math.ceil(base_delta * loss_scale)
 
+    duos = getattr(data, 'duos', None)
+
     for pid in (a1,a2):
         e = data[str(pid)]
         e['elo']            = max(ELO_FLOOR, e['elo'] + delta_win)
@@ -84,8 +148,9 @@ def process_doubles_match(data, a1, a2, b1, b2):
         e['streak']        += 1
         e['all_time_gain'] += delta_win
         e['peak_elo']       = max(e['peak_elo'], e['elo'])
-        other = a2 if pid==a1 else a1
-        e['partners'][str(other)] = e['partners'].get(str(other),0) + 1
+        if duos is None:
+            other = a2 if pid==a1 else a1
+            e['partners'][str(other)] = e['partners'].get(str(other),0) + 1
 
     for pid in (b1,b2):
         e = data[str(pid)]
@@ -93,10 +158,14 @@ def process_doubles_match(data, a1, a2, b1, b2):
         e['losses']         += 1
         e['streak']          = 0
         e['all_time_loss']  += delta_loss
-        other = b2 if pid==b1 else b1
-        e['partners_losses'][str(other)] = e['partners_losses'].get(str(other),0) + 1
+        if duos is None:
+            other = b2 if pid==b1 else b1
+            e['partners_losses'][str(other)] = e['partners_losses'].get(str(other),0) + 1
 
-    save_data(data)
+    if duos is not None:
+        # one write per team; both players' tallies read it
+        duos.add(a1, a2, True)
+        duos.add(b1, b2, False)
 
     a1_after = data[str(a1)]['elo']
     a2_after = data[str(a2)]['elo']
@@ -115,3 +184,11 @@ def process_doubles_match(data, a1, a2, b1, b2):
         'b1_after':     b1_after,
         'b2_after':     b2_after
     }
+
+# journalled mutations, by event name (see journal.py / store.py)
+OPS = {
+    'dmatch':     process_doubles_match,
+    'set_stat':   set_stat,
+    'decay':      apply_decay,
+    'new_season': reset_season,
+}
@@ -0,0 +1,238 @@
+"""
+Doubles partnerships, stored once per pair.
+
+The league file keeps two tallies on each doubles player, `partners`
+(wins with each teammate) and `partners_losses` (losses with them), so
+every pair is written down twice and anything league-wide (/duos) had
+to walk every player's maps. In memory a DuoIndex holds each pair once,
+as a (wins, losses) tuple shared by both players' entries in the
+adjacency map `teammates[uid][partner]` (string ids, like the file).
+Each DoublesRecord's `partners` and `partners_losses` are Tally views
+onto it that read and write like the old {partner: count} dicts and
+serialise to exactly that, so the files don't change.
+
+The /duos boards are bounded: each of
+
+    by wins          (-wins, -games, low_id, high_id)
+    by games         (-games, -wins, low_id, high_id)
+    by win rate      (-rate, -games, low_id, high_id), pairs with at least `min_games` only
+
+keeps only its best TOP_K keys (see Leaders). Matches only ever raise a
+pair's wins and games, so those two boards stay exact as they go; a
+pair on the win-rate board that loses (or any pair a correction takes
+back) can leave a gap that is filled by one pass over the pairs the
+next time that board is read.
+"""
+import heapq
+from collections.abc import MutableMapping
+
+from sortedcontainers import SortedList
+
+
+MIN_GAMES = 5       # games together before a pair is ranked by win rate
+TOP_K     = 25      # keys each board keeps; longer boards are worked out on request
+
+
+class Leaders:
+    """
+    The `size` smallest of a changing set of keys, given every change as
+    (old key, new key) with None for absent. `stale` is set when a held
+    key drops out and what should replace it is not known; the owner
+    then rebuilds from every key.
+    """
+
+    def __init__(self, size=TOP_K):
+        self.size = size
+        self.count = 0      # keys in the whole set, held or not
+        self.keys = SortedList()
+        self.stale = False
+
+    def update(self, old, new):
+        if old == new:
+            return
+        self.count += (new is not None) - (old is not None)
+        if self.stale:
+            return
+        boundary = self.keys[-1] if len(self.keys) >= self.size else None   # None: every key is held
+        held = old is not None and old in self.keys
+        if held:
+            self.keys.remove(old)
+        if new is not None and (boundary is None or new < boundary):
+            self.keys.add(new)
+            if len(self.keys) > self.size:
+                self.keys.pop()
+        elif held and self.count > len(self.keys):
+            self.stale = True
+
+    def rebuild(self, keys):
+        self.keys = SortedList(heapq.nsmallest(self.size, keys))
+        self.stale = False
+
+
+class DuoIndex:
+
+    def __init__(self, min_games=MIN_GAMES):
+        self.min_games = min_games
+        self.teammates = {}     # uid -> {partner: (wins, losses)}, str ids
+        self.conflicts = 0      # pairs the two players' maps disagreed on when loaded
+        self._by_wins = Leaders()
+        self._by_games = Leaders()
+        self._by_rate = Leaders()
+
+    def __len__(self):
+        return self._by_wins.count
+
+    def _keys(self, a, b, record):
+        """The pair's keys on the wins, games and win-rate boards (None where it isn't on one)."""
+        if record is None:
+            return None, None, None
+        low, high = sorted((int(a), int(b)))
+        wins, losses = record
+        games = wins + losses
+        rate = (-wins / games, -games, low, high) if games >= self.min_games else None
+        return (-wins, -games, low, high), (-games, -wins, low, high), rate
+
+    def record(self, a, b):
+        """(wins, losses) of `a` and `b` as partners, or None if they never teamed up."""
+        return self.teammates.get(str(a), {}).get(str(b))
+
+    def set(self, a, b, wins, losses):
+        a, b = str(a), str(b)
+        old = self.record(a, b)
+        new = (wins, losses) if wins or losses else None
+        if new is None:
+            if old is None:
+                return
+            del self.teammates[a][b]
+            del self.teammates[b][a]
+        else:
+            self.teammates.setdefault(a, {})[b] = new
+            self.teammates.setdefault(b, {})[a] = new
+        for board, was, now in zip((self._by_wins, self._by_games, self._by_rate),
+                                   self._keys(a, b, old), self._keys(a, b, new)):
+            board.update(was, now)
+
+    def add(self, a, b, won):
+        wins, losses = self.record(a, b) or (0, 0)
+        self.set(a, b, wins + won, losses + (not won))
+
+    def drop(self, uid):
+        """Forget every pair `uid` is in."""
+        for partner in list(self.teammates.get(str(uid), ())):
+            self.set(uid, partner, 0, 0)
+
+    def load(self, uid, wins, losses, replace=False):
+        """
+        Add `uid`'s side of its partnerships from {partner: count} win and
+        loss tallies. A pair the partner's tallies already put in keeps
+        that value unless `replace`; if the two disagree it is counted in
+        `conflicts`.
+        """
+        for partner in wins.keys() | losses.keys():
+            record = wins.get(partner, 0), losses.get(partner, 0)
+            if not replace:
+                known = self.record(uid, partner)
+                if known is not None:
+                    self.conflicts += known != record
+                    continue
+            self.set(uid, partner, *record)
+
+    def pairs(self):
+        """Every partnership once, as ((low_id, high_id), wins, losses)."""
+        for a, mine in self.teammates.items():
+            for b, (wins, losses) in mine.items():
+                if int(a) < int(b):
+                    yield (int(a), int(b)), wins, losses
+
+    def _top(self, board, which, k):
+        if board.stale or k > board.size:
+            keys = (self._keys(a, b, (wins, losses))[which] for (a, b), wins, losses in self.pairs())
+            keys = [key for key in keys if key is not None]
+            if board.stale:
+                board.rebuild(keys)
+            if k > board.size:
+                return self._entries(heapq.nsmallest(k, keys))
+        return self._entries(board.keys.islice(0, k))
+
+    def _entries(self, keys):
+        out = []
+        for key in keys:
+            pair = key[2:]
+            wins, losses = self.record(*pair)
+            out.append((pair, wins, losses, wins + losses))
+        return out
+
+    def most_wins(self, k=10):
+        """[((low_id, high_id), wins, losses, games), ...] for the `k` pairs with the most wins together."""
+        return self._top(self._by_wins, 0, k)
+
+    def most_games(self, k=10):
+        return self._top(self._by_games, 1, k)
+
+    def best_rate(self, k=10):
+        """As most_wins, by win rate, among pairs with at least `min_games` games together."""
+        return self._top(self._by_rate, 2, k)
+
+    def partners_of(self, uid, k=10):
+        """[(partner, wins, losses, games), ...] for `uid`'s `k` most frequent teammates."""
+        out = [(int(partner), wins, losses, wins + losses)
+               for partner, (wins, losses) in self.teammates.get(str(uid), {}).items()]
+        out.sort(key=lambda p: (-p[3], -p[1], p[0]))
+        return out[:k]
+
+    def view(self, uid, side):
+        """`uid`'s `partners` (side 0) or `partners_losses` (side 1) map."""
+        return Tally(self, uid, side)
+
+
+class Tally(MutableMapping):
+    """
+    One player's {partner id (str): count} of wins (side 0) or losses
+    (side 1) together, backed by the index. Like the old dicts, partners
+    with a count of 0 on this side aren't in it.
+    """
+    __slots__ = ('index', 'uid', 'side')
+
+    def __init__(self, index, uid, side):
+        self.index, self.uid, self.side = index, str(uid), side
+
+    def _mine(self):
+        return self.index.teammates.get(self.uid, {})
+
+    def __getitem__(self, partner):
+        record = self._mine().get(str(partner))
+        if record is None or not record[self.side]:
+            raise KeyError(partner)
+        return record[self.side]
+
+    def __setitem__(self, partner, count):
+        record = list(self.index.record(self.uid, partner) or (0, 0))
+        record[self.side] = count
+        self.index.set(self.uid, partner, *record)
+
+    def __delitem__(self, partner):
+        if partner not in self:
+            raise KeyError(partner)
+        self[partner] = 0
+
+    def __iter__(self):
+        return iter([p for p, record in self._mine().items() if record[self.side]])
+
+    def __len__(self):
+        return sum(1 for record in self._mine().values() if record[self.side])
+
+    def to_dict(self):
+        return {p: record[self.side] for p, record in self._mine().items() if record[self.side]}
+
+    # copies and pickles are detached plain dicts; the index is the league's, not the player's
+    def __copy__(self):
+        return self.to_dict()
+
+    def __deepcopy__(self, memo):
+        return self.to_dict()
+
+    def __reduce__(self):
+        return dict, (self.to_dict(),)
+
+    def __repr__(self):
+        return repr(self.to_dict())
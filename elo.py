@@ -1,7 +1,16 @@
+import copy
 import json
 import math
+import os
+from collections import deque
 
+from pairs import PairTable
+from records import HeadToHead, HistoryEntry, League, PlayerRecord
+from utils import write_json_atomic
 
+
+STORAGE = os.getenv("STORAGE", "json")   # "json" or "sqlite" (see sqlite_store.py)
+LEAGUE = 'singles'
 DATA_FILE = 'data.json'
 K = 24
 ELO_FLOOR = 5
@@ -11,49 +20,194 @@ dISPARITY_MAX = 200   # maximum diff consideration
 
 
 def load_data():
-    try:
-        with open(DATA_FILE, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+    if STORAGE == 'sqlite':
+        import sqlite_store
+        raw = sqlite_store.load_data(LEAGUE)
+    else:
+        try:
+            with open(DATA_FILE, 'r') as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            raw = {}
+    return league(raw)
 
 
-def save_data(data):
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+def league(raw):
+    """
+    A League of PlayerRecords from {uid: entry} in the file schema, with
+    every head-to-head held once in its PairTable (see pairs.py).
+    """
+    data = League()
+    data.h2h = PairTable()
+    for uid, entry in raw.items():
+        data[uid] = PlayerRecord.from_dict(entry, data.h2h, uid)
+    if data.h2h.conflicts:
+        print(f"{data.h2h.conflicts} head-to-head(s) disagreed between the two players' records; "
+              f"kept the side loaded first")
+    return data
+
+
+def save_data(data, user_ids=None):
+    """
+    Persist the league. The SQLite backend only rewrites `user_ids`
+    when given; the JSON file is always rewritten whole.
+    """
+    if STORAGE == 'sqlite':
+        import sqlite_store
+        sqlite_store.save_data(LEAGUE, data, user_ids)
+        return
+    write_json_atomic(DATA_FILE, data)
 
 
 def register_user(data, user_id):
     key = str(user_id)
-    if key not in data:
-        data[key] = {
-            'elo':            100,
-            'wins':           0,
-            'losses':         0,
-            'first_5_bonus':  0,
-            'streak':         0,
-            'head_to_head':   {},
-            'medals':         [],
-            'all_time_gain':  0,
-            'all_time_loss':  0,
-            'match_history':  [],
-            'peak_elo':       100
-        }
+    entry = data.get(key)
+    pairs = getattr(data, 'h2h', None)
+    if entry is None:
+        entry = data[key] = PlayerRecord.new()
+        if pairs is not None:
+            entry.head_to_head = pairs.view(key)
+    elif type(entry) is not PlayerRecord:
+        # a plain dict; from_dict fills in what's missing
+        data[key] = PlayerRecord.from_dict(entry, pairs, key)
+
+def _h2h(data, key, opponent_key):
+    """`key`'s head-to-head against `opponent_key`, started at 0-0 if they haven't met."""
+    h2h = data[key]['head_to_head']
+    if opponent_key not in h2h:
+        h2h[opponent_key] = HeadToHead(wins=0, losses=0)
+    return h2h[opponent_key]
+
+
+def _add_win(data, wkey, lkey):
+    pairs = getattr(data, 'h2h', None)
+    if pairs is not None:
+        pairs.add_win(wkey, lkey)       # one write; both players' views read it
     else:
-        entry = data[key]
-        entry.setdefault('head_to_head', {})
-        entry.setdefault('medals',        [])
-        entry.setdefault('all_time_gain',  0)
-        entry.setdefault('all_time_loss',  0)
-        entry.setdefault('match_history', [])
+        # a plain dict league keeps both sides itself
+        _h2h(data, wkey, lkey)['wins'] += 1
+        _h2h(data, lkey, wkey)['losses'] += 1
+
+
+def head_to_head(data, user_id, opponent_id):
+    """(wins, losses) of `user_id` against `opponent_id`; (0, 0) if they haven't played."""
+    pairs = getattr(data, 'h2h', None)
+    if pairs is not None:
+        return pairs.record(user_id, opponent_id) or (0, 0)
+    rec = data.get(str(user_id), {}).get('head_to_head', {}).get(str(opponent_id))
+    return (rec['wins'], rec['losses']) if rec else (0, 0)
+
 
 def get_stats(data, user_id):
     return data.get(str(user_id), None)
 
 
 def set_stat(data, user_id, stat, value):
-    if str(user_id) in data:
-        data[str(user_id)][stat] = value
+    register_user(data, user_id)
+    data[str(user_id)][stat] = value
+
+
+def add_medal(data, user_id, medal, title):
+    register_user(data, user_id)
+    data[str(user_id)].setdefault('medals', []).append({"medal": medal, "title": title})
+
+
+def modify_stat(data, user_id, key, operation, amount):
+    """
+    Apply an admin add/subtract/set to `elo`, `all_time_gain` or
+    `all_time_loss`, clamping like /modifyelo always has.
+    Returns (old, new).
+    """
+    register_user(data, user_id)
+    entry = data[str(user_id)]
+    old = entry.get(key, 0)
+
+    if operation == 'add':
+        new = old + amount
+    elif operation == 'subtract':
+        new = old - amount
+    else:
+        new = amount
+
+    if key == 'elo':
+        new = max(ELO_FLOOR, new)
+    else:
+        new = max(0, new)
+
+    entry[key] = new
+
+    entry.setdefault('peak_elo', entry['elo'])
+    if entry['elo'] > entry['peak_elo']:
+        entry['peak_elo'] = entry['elo']
+    return old, new
+
+
+def modify_h2h(data, user_id, opponent_id, field, operation, amount):
+    """
+    Edit `user_id`'s head-to-head `field` against `opponent_id` and mirror
+    it onto the opponent's record. Returns the user's updated record.
+    """
+    register_user(data, user_id)
+    register_user(data, opponent_id)
+    k1, k2 = str(user_id), str(opponent_id)
+    h2h1 = _h2h(data, k1, k2)
+
+    old = h2h1[field]
+    if operation == 'add':
+        new = old + amount
+    elif operation == 'subtract':
+        new = old - amount
+    else:
+        new = amount
+    new = max(0, new)
+
+    h2h1[field] = new
+    if getattr(data, 'h2h', None) is None:
+        # with a pair table the opponent's side is the same record
+        _h2h(data, k2, k1)['losses' if field == 'wins' else 'wins'] = new
+    return h2h1
+
+
+def set_peak(data, user_id, peak_elo):
+    register_user(data, user_id)
+    entry = data[str(user_id)]
+    old_peak = entry.setdefault('peak_elo', entry.get('elo', 100))
+    entry['peak_elo'] = peak_elo
+    return old_peak
+
+
+def apply_decay(data, user_id, amount):
+    """Take `amount` off an inactive player's rating (see decay.py). Returns the new rating."""
+    register_user(data, user_id)
+    entry = data[str(user_id)]
+    entry['elo'] = max(ELO_FLOOR, entry['elo'] - amount)
+    entry['decayed'] = entry.get('decayed', 0) + amount
+    return entry['elo']
+
+
+def reset_season(data):
+    """
+    Start a new season: ratings and season records go back to a new
+    player's, all-time totals, medals, head-to-heads and history stay.
+    """
+    for entry in data.values():
+        entry.update(elo=100, peak_elo=100, wins=0, losses=0, streak=0, first_5_bonus=0)
+
+
+def restore_players(data, entries):
+    """
+    Replace whole player entries with {uid: entry} (a match correction, see
+    corrections.py); an entry of None removes the player.
+    """
+    pairs = getattr(data, 'h2h', None)
+    for uid, entry in entries.items():
+        uid = str(uid)
+        if entry is None:
+            data.pop(uid, None)
+            if pairs is not None:
+                pairs.drop(uid)
+        else:
+            data[uid] = PlayerRecord.from_dict(copy.deepcopy(entry), pairs, uid, replace=True)
 
 
 def expected_score(player_elo, opponent_elo):
@@ -68,22 +222,25 @@ def _append_single_history(entry, *,
                            player_elo_after: int,
                            opponent_elo_after: int):
     """
-    Append one perspective history record to `entry['match_history']`.
+    Append one perspective history record to `entry['match_history']`,
+    dropping the oldest past HISTORY_LIMIT.
     `entry` is the player dict (already registered).
     """
-    entry.setdefault('match_history', [])
-    rec = {
-        "winner_id": winner_id,
-        "opponent_id": opponent_id,
-        "result": 'W' if player_is_winner else 'L',
-        "score_w": score_w,
-        "score_l": score_l,
-        "elo_after": player_elo_after,
-        "opponent_elo_after": opponent_elo_after,
-    }
-    entry['match_history'].insert(0, rec)
-    if len(entry['match_history']) > HISTORY_LIMIT:
-        entry['match_history'] = entry['match_history'][:HISTORY_LIMIT]
+    history = entry.get('match_history')
+    if not isinstance(history, deque):
+        # loaded from JSON as a list; in memory it's a ring buffer, newest first,
+        # and the full record lives in the match archive (archive.py)
+        history = entry['match_history'] = deque((history or [])[:HISTORY_LIMIT], maxlen=HISTORY_LIMIT)
+    rec = HistoryEntry(
+        winner_id=winner_id,
+        opponent_id=opponent_id,
+        result='W' if player_is_winner else 'L',
+        score_w=score_w,
+        score_l=score_l,
+        elo_after=player_elo_after,
+        opponent_elo_after=opponent_elo_after,
+    )
+    history.appendleft(rec)
 
 
 def append_match_history(data,
@@ -99,6 +256,8 @@ def append_match_history(data,
     or from a retroactive logging command (provided elos you pass
     are already post-match).
     """
+    register_user(data, winner_id)
+    register_user(data, loser_id)
     w = data[str(winner_id)]
     l = data[str(loser_id)]
 
@@ -125,16 +284,12 @@ def append_match_history(data,
 
 
 def process_match(data, winner_id, loser_id,score_w=None,score_l=None):
+    register_user(data, winner_id)
+    register_user(data, loser_id)
     wkey, lkey = str(winner_id), str(loser_id)
     winner = data[wkey]
     loser  = data[lkey]
     
-    winner.setdefault('head_to_head', {})
-    loser .setdefault('head_to_head', {})
-
-    record_w = winner['head_to_head'].setdefault(lkey, {'wins': 0, 'losses': 0})
-    record_l = loser ['head_to_head'].setdefault(wkey, {'wins': 0, 'losses': 0})
-
     w_before = winner['elo']
     l_before = loser['elo']
 
@@ -176,8 +331,7 @@ def process_match(data, winner_id, loser_id,score_w=None,score_l=None):
     winner['streak'] += 1
     loser['losses']  += 1
     loser['streak']   = 0
-    record_w['wins']   += 1
-    record_l['losses'] += 1
+    _add_win(data, wkey, lkey)
     
     append_match_history(
         data,
@@ -208,3 +362,19 @@ def process_match(data, winner_id, loser_id,score_w=None,score_l=None):
         'winner_elo_after':  w_after,
         'loser_elo_after':   l_after
     }
+
+
+# journalled mutations, by event name (see journal.py / store.py)
+OPS = {
+    'match':       process_match,
+    'log_history': append_match_history,
+    'set_stat':    set_stat,
+    'medal':       add_medal,
+    'modify_stat': modify_stat,
+    'modify_h2h':  modify_h2h,
+    'set_peak':    set_peak,
+    'decay':       apply_decay,
+    'new_season':  reset_season,
+    'restore':     restore_players,
+    'undo_season': restore_players,    # a new_season taken back (see bot.season_end)
+}
@@ -0,0 +1,172 @@
+"""
+Long-lived event log with periodic checkpoints, for match corrections.
+
+The journal is emptied at every snapshot, so on its own it can't say how
+a player got to their current rating. A LeagueStore created with
+`event_log=True` also hands each flushed batch of journal events to an
+EventLog in `<league file>.log/`:
+
+    <seq>.ckpt     the whole league as of op `seq`, one [uid, entry] per line
+    <seq>.idx.npy  (uid, byte offset) rows sorted by uid, to read single players
+    <seq>.patch    [uid, entry] lines that override the checkpoint (corrections)
+    <seq>.events   the events after checkpoint `seq`, up to the next checkpoint
+
+A new checkpoint is written once CHECKPOINT_EVERY events have gone by and
+the oldest are dropped past KEEP_CHECKPOINTS, so a correction only has to
+replay from the checkpoint just before the match (see corrections.py).
+"""
+import json
+import os
+
+import numpy as np
+
+from utils import json_default
+
+
+CHECKPOINT_EVERY = 1000
+KEEP_CHECKPOINTS = 8
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(',', ':'), default=json_default)
+
+
+class EventLog:
+
+    def __init__(self, path):
+        self.path = path
+        self.checkpoints = []   # seqs, oldest first
+        self.last_seq = 0
+
+    def _file(self, seq, ext):
+        return os.path.join(self.path, f"{seq}.{ext}")
+
+    def load(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.checkpoints = sorted(int(name[:-5]) for name in os.listdir(self.path)
+                                  if name.endswith('.ckpt') and name[:-5].isdigit())
+        self.last_seq = self.checkpoints[-1] if self.checkpoints else 0
+        if self.checkpoints:
+            events = self._trim_torn_tail(self._file(self.checkpoints[-1], 'events'))
+            if events:
+                self.last_seq = events[-1]['seq']
+
+    def _trim_torn_tail(self, path):
+        # same rule as the journal: a partial last line never made it
+        events, good = [], 0
+        if not os.path.exists(path):
+            return events
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    break
+                good += len(line)
+        if good != os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(good)
+        return events
+
+    def append(self, events, data, seq):
+        """
+        Log the journal `events` the log doesn't have yet; `data` is the
+        league as of op `seq` (the last of them), checkpointed when due.
+        The first call only writes a checkpoint: earlier ops aren't known.
+        """
+        if not self.checkpoints:
+            self.checkpoint(data, seq)
+            return
+        events = [e for e in events if e['seq'] > self.last_seq]
+        if events:
+            with open(self._file(self.checkpoints[-1], 'events'), 'a') as f:
+                f.write(''.join(_dumps(e) + '\n' for e in events))
+                f.flush()
+                os.fsync(f.fileno())
+            self.last_seq = events[-1]['seq']
+        if self.due(seq):
+            self.checkpoint(data, seq)
+
+    def due(self, seq):
+        """Whether `append` up to `seq` will write a checkpoint (and so needs `data`)."""
+        return not self.checkpoints or seq - self.checkpoints[-1] >= CHECKPOINT_EVERY
+
+    def checkpoint(self, data, seq):
+        rows, offset = [], 0
+        with open(self._file(seq, 'ckpt.tmp'), 'w') as f:
+            for uid, entry in data.items():
+                line = _dumps([uid, entry]) + '\n'
+                f.write(line)
+                rows.append((int(uid), offset))
+                offset += len(line.encode())
+            f.flush()
+            os.fsync(f.fileno())
+        idx = np.array(sorted(rows), dtype=np.uint64).reshape(-1, 2)
+        with open(self._file(seq, 'idx.npy.tmp'), 'wb') as f:
+            np.save(f, idx)
+        open(self._file(seq, 'events'), 'a').close()
+        os.replace(self._file(seq, 'idx.npy.tmp'), self._file(seq, 'idx.npy'))
+        # the .ckpt appearing is what makes the checkpoint exist
+        os.replace(self._file(seq, 'ckpt.tmp'), self._file(seq, 'ckpt'))
+        self.checkpoints.append(seq)
+        self.last_seq = seq
+
+        while len(self.checkpoints) > KEEP_CHECKPOINTS:
+            old = self.checkpoints.pop(0)
+            for ext in ('ckpt', 'idx.npy', 'patch', 'events'):
+                if os.path.exists(self._file(old, ext)):
+                    os.remove(self._file(old, ext))
+
+    def checkpoint_before(self, seq):
+        """Latest checkpoint taken before op `seq`, or None if it's older than the log."""
+        older = [c for c in self.checkpoints if c < seq]
+        return older[-1] if older else None
+
+    def read_since(self, c):
+        """Every logged event after checkpoint `c`, oldest first."""
+        events = []
+        for k in self.checkpoints:
+            if k >= c:
+                with open(self._file(k, 'events'), 'r') as f:
+                    events.extend(json.loads(line) for line in f)
+        return events
+
+    def load_players(self, c, uids):
+        """{uid: entry} as of checkpoint `c`, for those of `uids` that existed then."""
+        out = {}
+        idx = np.load(self._file(c, 'idx.npy'), mmap_mode='r')
+        with open(self._file(c, 'ckpt'), 'rb') as f:
+            for uid in uids:
+                i = int(np.searchsorted(idx[:, 0], np.uint64(int(uid))))
+                if i < len(idx) and int(idx[i, 0]) == int(uid):
+                    f.seek(int(idx[i, 1]))
+                    key, entry = json.loads(f.readline())
+                    out[key] = entry
+        if os.path.exists(self._file(c, 'patch')):
+            wanted = {str(u) for u in uids}
+            with open(self._file(c, 'patch'), 'r') as f:
+                for line in f:
+                    key, entry = json.loads(line)
+                    if key in wanted:
+                        out[key] = entry
+        return out
+
+    def patch(self, c, entries):
+        """Override players' entries in checkpoint `c` after a correction."""
+        with open(self._file(c, 'patch'), 'a') as f:
+            f.write(''.join(_dumps([uid, entry]) + '\n' for uid, entry in entries.items()))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def rewrite(self, event):
+        """Replace the logged event with the same seq (a void or edit)."""
+        c = self.checkpoint_before(event['seq'])
+        path = self._file(c, 'events')
+        with open(path, 'r') as f:
+            events = [json.loads(line) for line in f]
+        events = [event if e['seq'] == event['seq'] else e for e in events]
+        with open(f"{path}.tmp", 'w') as f:
+            f.write(''.join(_dumps(e) + '\n' for e in events))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
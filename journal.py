@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+
+from utils import json_default
+
+
+class Journal:
+    """
+    Append-only log of league mutations, one JSON event per line:
+
+        {"seq": 42, "op": "match", "args": {"winner_id": ..., ...}}
+
+    Every append is fsync'd, so an acknowledged /match survives a crash
+    even though the full snapshot is only rewritten occasionally.
+    `op` names a function in the league module's `OPS` table.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._trim_torn_tail()
+        self._f = open(self.path, 'a')
+
+    def _trim_torn_tail(self):
+        # a crash mid-append can leave a partial last line; drop it
+        if not os.path.exists(self.path):
+            return
+        good = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    json.loads(line)
+                except ValueError:
+                    break
+                good += len(line)
+                self.count += 1
+        if good != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good)
+
+    def append(self, event):
+        self.append_many([event])
+
+    def append_many(self, events):
+        """Append and fsync `events`; if that fails, none of them stay in the file."""
+        data = ''.join(json.dumps(event, separators=(',', ':'), default=json_default) + '\n'
+                       for event in events).encode()
+        fd = self._f.fileno()
+        size = os.fstat(fd).st_size
+        try:
+            # straight to the fd, so a failed write leaves nothing buffered to land later
+            while data:
+                data = data[os.write(fd, data):]
+            os.fsync(fd)
+        except OSError:
+            os.ftruncate(fd, size)
+            raise
+        self.count += len(events)
+
+    def read(self, after_seq=0):
+        """Events with seq > after_seq, oldest first."""
+        events = []
+        with open(self.path, 'r') as f:
+            for line in f:
+                event = json.loads(line)
+                if event['seq'] > after_seq:
+                    events.append(event)
+        return events
+
+    def reset(self):
+        """Drop every event; call only once a snapshot covers them."""
+        self._f.truncate(0)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self.count = 0
+
+    def close(self):
+        self._f.close()
+
+
+def _digest(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _meta_path(path):
+    return f"{path}.meta"
+
+
+def snapshot_seq(path):
+    """
+    Journal seq already folded into the snapshot at `path`.
+
+    The `.meta` sidecar is written before the snapshot is renamed into
+    place, so it carries both the new and previous digests; whichever one
+    matches the file on disk says which seq the snapshot covers. A
+    snapshot with no meta (or edited by hand) counts as covering `seq`.
+    """
+    try:
+        with open(_meta_path(path), 'r') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return 0
+    if not os.path.exists(path):
+        return 0
+    digest = _digest(path)
+    if digest != meta['sha1'] and digest == meta.get('prev_sha1'):
+        return meta.get('prev_seq', 0)
+    return meta['seq']
+
+
+def write_snapshot(path, data, seq):
+    """
+    Atomically replace `path` with `data`, recording that it covers
+    every journal event up to and including `seq`.
+    """
+    write_snapshot_text(path, json.dumps(data, indent=2, default=json_default), seq)
+
+
+def write_snapshot_text(path, text, seq):
+    """`write_snapshot` for a league already serialised (see LeagueStore.flush_async)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+    meta = {'seq': seq, 'sha1': _digest(tmp)}
+    if os.path.exists(path):
+        meta['prev_seq'] = snapshot_seq(path)
+        meta['prev_sha1'] = _digest(path)
+
+    meta_tmp = f"{_meta_path(path)}.tmp"
+    with open(meta_tmp, 'w') as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(meta_tmp, _meta_path(path))
+    os.replace(tmp, path)
@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+import re
+
+
+MAX_ROWS = 500   # per upload; a long tournament night is well under this
+
+SINGLES_FIELDS = ('winner', 'loser')
+DOUBLES_FIELDS = ('a1', 'a2', 'b1', 'b2')
+SCORE_FIELDS   = ('score_w', 'score_l')
+
+_MENTION = re.compile(r'^<@!?(\d+)>$')
+
+
+class MatchSheetError(ValueError):
+    """An upload that can't be imported; `errors` lists every bad row."""
+
+    def __init__(self, errors):
+        super().__init__("\n".join(errors))
+        self.errors = errors
+
+
+def _user_id(value):
+    value = str(value).strip()
+    m = _MENTION.match(value)
+    if m:
+        value = m.group(1)
+    if not value.isdigit():
+        raise ValueError(f"not a user id: {value!r}")
+    return int(value)
+
+
+def _score(value):
+    if value is None or str(value).strip() == '':
+        return None
+    score = int(str(value).strip())
+    if score < 0:
+        raise ValueError(f"negative score: {score}")
+    return score
+
+
+def _rows(filename, raw):
+    """Rows of the upload as dicts, CSV (with a header line) or JSON."""
+    text = raw.decode('utf-8-sig')
+    if filename.lower().endswith('.json'):
+        rows = json.loads(text)
+        if isinstance(rows, dict):
+            rows = rows.get('matches', [])
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise MatchSheetError(["JSON must be a list of match objects"])
+        return rows
+    reader = csv.DictReader(io.StringIO(text))
+    return [{(k or '').strip().lower(): v for k, v in row.items()} for row in reader]
+
+
+def parse_matches(filename, raw, league=None):
+    """
+    Validate an uploaded match sheet and return (league, matches).
+
+    Singles rows need `winner,loser`, doubles rows `a1,a2,b1,b2` (a1/a2
+    won); `score_w,score_l` are optional. Ids may be raw ids or
+    mentions. `league` is inferred from the columns when not given.
+    Every row is checked before anything is returned, and all problems
+    are raised together as one MatchSheetError so nothing is half-applied.
+    """
+    try:
+        rows = _rows(filename, raw)
+    except (UnicodeDecodeError, json.JSONDecodeError, csv.Error) as e:
+        raise MatchSheetError([f"could not read {filename}: {e}"])
+
+    if not rows:
+        raise MatchSheetError(["no matches found"])
+    if len(rows) > MAX_ROWS:
+        raise MatchSheetError([f"{len(rows)} matches is over the {MAX_ROWS} per-upload limit"])
+
+    if league is None:
+        league = 'doubles' if all(f in rows[0] for f in DOUBLES_FIELDS) else 'singles'
+    fields = DOUBLES_FIELDS if league == 'doubles' else SINGLES_FIELDS
+
+    matches, errors = [], []
+    for n, row in enumerate(rows, start=1):
+        missing = [f for f in fields if not str(row.get(f) or '').strip()]
+        if missing:
+            errors.append(f"row {n}: missing {', '.join(missing)}")
+            continue
+        try:
+            ids = [_user_id(row[f]) for f in fields]
+            score_w, score_l = (_score(row.get(f)) for f in SCORE_FIELDS)
+        except ValueError as e:
+            errors.append(f"row {n}: {e}")
+            continue
+        if len(set(ids)) != len(ids):
+            errors.append(f"row {n}: the same player appears twice")
+            continue
+        if score_w is not None and score_l is not None and score_w < score_l:
+            errors.append(f"row {n}: winner's score {score_w} is below loser's {score_l}")
+            continue
+        match = dict(zip(fields, ids))
+        match['score_w'], match['score_l'] = score_w, score_l
+        matches.append(match)
+
+    if errors:
+        raise MatchSheetError(errors)
+    return league, matches
+
+
+def events(league, matches):
+    """The store ops (see LeagueStore.apply_many) for parsed `matches`."""
+    if league == 'doubles':
+        return [('dmatch', {'a1': m['a1'], 'a2': m['a2'], 'b1': m['b1'], 'b2': m['b2'],
+                            'score_w': m['score_w'], 'score_l': m['score_l']})
+                for m in matches]
+    return [('match', {'winner_id': m['winner'], 'loser_id': m['loser'],
+                       'score_w': m['score_w'], 'score_l': m['score_l']})
+            for m in matches]
+
+
+def pages(lines, limit=1900):
+    """Join `lines` into messages that each fit under Discord's 2000 char cap."""
+    out, cur = [], ""
+    for line in lines:
+        if cur and len(cur) + len(line) + 1 > limit:
+            out.append(cur)
+            cur = ""
+        cur = f"{cur}\n{line}" if cur else line
+    if cur:
+        out.append(cur)
+    return out
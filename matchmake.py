@@ -0,0 +1,142 @@
+"""
+Balanced pairings for /matchmake.
+
+Singles: pairing neighbours in rating order minimises the total rating
+gap, so the only choice left is who sits out when the count is odd
+(a small DP over the sorted list).
+
+Doubles: the cost of a match is the gap between the two team averages
+that process_doubles_match uses, plus an optional penalty for every game
+a team has already played together. Players are dealt into groups of
+four by rating, each group takes its best of the three team splits, and
+a local search then re-deals pairs of groups (and a group plus the
+bench) optimally while the total cost drops.
+"""
+from itertools import combinations
+
+
+PARTNER_PENALTY = 10    # ELO points of imbalance one previous game together is worth
+MAX_PASSES      = 50
+
+
+def pair_singles(ratings):
+    """
+    `ratings` is {uid: elo}. Returns (pairs, sitting_out) where pairs is
+    [(uid_a, uid_b), ...] and sitting_out is a uid or None.
+    """
+    order = sorted(ratings, key=lambda u: ratings[u], reverse=True)
+    if len(order) % 2 == 0:
+        return [tuple(order[i:i + 2]) for i in range(0, len(order), 2)], None
+
+    # best[i]: cost of pairing order[:i] with exactly one of them benched
+    gap = lambda i: ratings[order[i]] - ratings[order[i + 1]]
+    n = len(order)
+    paired = [0.0] * (n + 1)        # order[:i] fully paired (i even)
+    for i in range(2, n + 1, 2):
+        paired[i] = paired[i - 2] + gap(i - 2)
+    best, choice = [float('inf')] * (n + 1), [None] * (n + 1)
+    best[1], choice[1] = 0.0, 0
+    for i in range(3, n + 1, 2):
+        bench_last = paired[i - 1]
+        pair_last = best[i - 2] + gap(i - 2)
+        best[i], choice[i] = min((bench_last, i - 1), (pair_last, choice[i - 2]))
+    bye = choice[n]
+    rest = order[:bye] + order[bye + 1:]
+    return [tuple(rest[i:i + 2]) for i in range(0, len(rest), 2)], order[bye]
+
+
+def _splits(group):
+    a, b, c, d = group
+    return (((a, b), (c, d)), ((a, c), (b, d)), ((a, d), (b, c)))
+
+
+class _Doubles:
+    def __init__(self, ratings, together, penalty):
+        self.ratings = ratings
+        self.together = together
+        self.penalty = penalty
+
+    def team_cost(self, team):
+        return self.penalty * self.together.get(frozenset(team), 0)
+
+    def match(self, group):
+        """(cost, (team_a, team_b)) of the best split of four players."""
+        r = self.ratings
+        best = None
+        for t1, t2 in _splits(group):
+            gap = abs((r[t1[0]] + r[t1[1]]) / 2 - (r[t2[0]] + r[t2[1]]) / 2)
+            cost = gap + self.team_cost(t1) + self.team_cost(t2)
+            if best is None or cost < best[0]:
+                best = (cost, (t1, t2))
+        return best
+
+
+def make_doubles(ratings, together=None, penalty=PARTNER_PENALTY):
+    """
+    Split players into doubles matches. `ratings` is {uid: elo},
+    `together` is {frozenset({uid, uid}): games played as partners}.
+    Returns (matches, sitting_out): matches is [((a1, a2), (b1, b2)), ...].
+    """
+    model = _Doubles(ratings, together or {}, penalty if together else 0)
+    order = sorted(ratings, key=lambda u: ratings[u], reverse=True)
+    n_groups = len(order) // 4
+    bench = len(order) - 4 * n_groups
+
+    # greedy start: the bench goes to the middle of the table, where a
+    # strong or weak player would be hardest to balance
+    mid = (len(order) - bench) // 2
+    benched = order[mid:mid + bench]
+    rest = order[:mid] + order[mid + bench:]
+    groups = [rest[i:i + 4] for i in range(0, len(rest), 4)]
+    costs = [model.match(g)[0] for g in groups]
+
+    for _ in range(MAX_PASSES):
+        improved = False
+        # re-deal the eight players of two groups in the best of 35 ways
+        for i, j in combinations(range(len(groups)), 2):
+            pool = groups[i] + groups[j]
+            best = (costs[i] + costs[j] - 1e-9, None)
+            for picked in combinations(pool[1:], 3):
+                gi = [pool[0], *picked]
+                gj = [u for u in pool if u not in gi]
+                ci, cj = model.match(gi)[0], model.match(gj)[0]
+                if ci + cj < best[0]:
+                    best = (ci + cj, (gi, gj, ci, cj))
+            if best[1] is not None:
+                groups[i], groups[j], costs[i], costs[j] = best[1]
+                improved = True
+        # let benched players take a place in a group
+        for i in range(len(groups)):
+            if not benched:
+                break
+            pool = groups[i] + benched
+            best = (costs[i] - 1e-9, None)
+            for gi in combinations(pool, 4):
+                ci = model.match(gi)[0]
+                if ci < best[0]:
+                    best = (ci, list(gi))
+            if best[1] is not None:
+                groups[i], costs[i] = best[1], best[0]
+                benched = [u for u in pool if u not in best[1]]
+                improved = True
+        if not improved:
+            break
+
+    matches = [model.match(g)[1] for g in groups]
+    matches.sort(key=lambda m: -(ratings[m[0][0]] + ratings[m[0][1]] + ratings[m[1][0]] + ratings[m[1][1]]))
+    return matches, benched
+
+
+def partner_counts(doubles_data):
+    """{frozenset({uid, uid}): games together} from the doubles partner tallies."""
+    duos = getattr(doubles_data, 'duos', None)
+    if duos is not None:
+        return {frozenset(pair): wins + losses for pair, wins, losses in duos.pairs()}
+    counts = {}
+    for uid, entry in doubles_data.items():
+        for key in ('partners', 'partners_losses'):
+            for other, games in entry.get(key, {}).items():
+                if uid < other:
+                    pair = frozenset((int(uid), int(other)))
+                    counts[pair] = counts.get(pair, 0) + games
+    return counts
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from perf import stage
+
+
+CACHE_SIZE = 4096
+CACHE_TTL  = 6 * 60 * 60   # seconds before a fetched name is looked up again
+
+
+class NameResolver:
+    """
+    Display names for player ids without a REST call per row.
+
+    Lookup order: the guild member cache (the bot runs with
+    `intents.members`), the client's user cache, then an LRU+TTL cache of
+    users we already fetched. Whatever is still missing is fetched with
+    concurrent `fetch_user` calls, one batch per command.
+    """
+
+    def __init__(self, client, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.client = client
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._cache = OrderedDict()   # uid -> (expires_at, name)
+        self.counters = {'member': 0, 'user': 0, 'cache': 0, 'fetch': 0, 'failed': 0}
+
+    def _cached(self, uid):
+        hit = self._cache.get(uid)
+        if hit is None:
+            return None
+        if hit[0] < time.monotonic():
+            del self._cache[uid]
+            return None
+        self._cache.move_to_end(uid)
+        return hit[1]
+
+    def _remember(self, uid, name):
+        self._cache[uid] = (time.monotonic() + self.ttl, name)
+        self._cache.move_to_end(uid)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def _local(self, guild, uid):
+        member = guild.get_member(uid) if guild is not None else None
+        if member is not None:
+            self.counters['member'] += 1
+            return member.display_name
+        user = self.client.get_user(uid)
+        if user is not None:
+            self.counters['user'] += 1
+            return user.display_name
+        name = self._cached(uid)
+        if name is not None:
+            self.counters['cache'] += 1
+        return name
+
+    async def _fetch(self, uid):
+        try:
+            user = await self.client.fetch_user(uid)
+        except Exception:
+            self.counters['failed'] += 1
+            return f"ID:{uid}"
+        self.counters['fetch'] += 1
+        self._remember(uid, user.display_name)
+        return user.display_name
+
+    async def names(self, guild, user_ids):
+        """{uid: display name} for every id in `user_ids` (ints or id strings)."""
+        resolved = {}
+        missing = []
+        for uid in {int(u) for u in user_ids}:
+            name = self._local(guild, uid)
+            if name is None:
+                missing.append(uid)
+            else:
+                resolved[uid] = name
+        if missing:
+            with stage('resolve'):
+                fetched = await asyncio.gather(*(self._fetch(uid) for uid in missing))
+            resolved.update(zip(missing, fetched))
+        return resolved
+
+    async def name(self, guild, user_id):
+        return (await self.names(guild, [user_id]))[int(user_id)]
@@ -0,0 +1,192 @@
+"""
+Singles head-to-heads, stored once per pair.
+
+The league file keeps a head-to-head map on each player, so every pair
+is written down twice (A's wins against B are B's losses against A) and
+every write has to touch both. In memory a PairTable holds each pair
+once, as the tuple
+
+    (-games, -most_wins, low_id, high_id, low_wins)
+
+shared by both players' entries in the per-player adjacency map
+`opponents[uid][opp]` (keyed by the league's string ids, since
+str-keyed dicts are the compact kind). The same tuple is the pair's key
+in `_ranked`, which keeps every pair ordered by games played (then by
+the leader's wins), so the most-played pairings are the front of a
+sorted list.
+
+Each PlayerRecord's `head_to_head` is a PlayerPairs view onto the table
+that reads and writes like the old {opponent: {'wins', 'losses'}} dict,
+and serialises to exactly that, so the files don't change.
+"""
+from collections.abc import MutableMapping
+
+from sortedcontainers import SortedList
+
+
+class PairTable:
+
+    def __init__(self):
+        self.opponents = {}     # uid -> {opp: pair tuple}, str ids
+        self._ids = {}          # str or int id -> (str, int), one of each per player
+        self._ranked = SortedList()
+        self.version = 0        # moves with every change, for caching rendered boards
+        self.conflicts = 0      # pairs the two players' maps disagreed on when loaded
+
+    def _id(self, uid):
+        ids = self._ids.get(uid)
+        if ids is None:
+            key = str(uid)
+            ids = self._ids.get(key) or (key, int(key))
+            self._ids[key] = self._ids[ids[1]] = ids
+        return ids
+
+    def __len__(self):
+        return len(self._ranked)
+
+    def record(self, uid, opp):
+        """(wins, losses) of `uid` against `opp`, or None if they never played."""
+        me, them = self._id(uid), self._id(opp)
+        pair = self.opponents.get(me[0], {}).get(them[0])
+        if pair is None:
+            return None
+        low_wins, games = pair[4], -pair[0]
+        return (low_wins, games - low_wins) if me[1] < them[1] else (games - low_wins, low_wins)
+
+    def set(self, uid, opp, wins, losses):
+        """Make `uid`'s record against `opp` wins-losses (and so `opp`'s losses-wins)."""
+        me, them = self._id(uid), self._id(opp)
+        if me[1] > them[1]:
+            me, them, wins, losses = them, me, losses, wins
+        old = self.opponents.get(me[0], {}).get(them[0])
+        if old is not None:
+            self._ranked.remove(old)
+        pair = (-(wins + losses), -max(wins, losses), me[1], them[1], wins)
+        self.opponents.setdefault(me[0], {})[them[0]] = pair
+        self.opponents.setdefault(them[0], {})[me[0]] = pair
+        self._ranked.add(pair)
+        self.version += 1
+
+    def add_win(self, winner, loser):
+        wins, losses = self.record(winner, loser) or (0, 0)
+        self.set(winner, loser, wins + 1, losses)
+
+    def remove(self, uid, opp):
+        me, them = self._id(uid)[0], self._id(opp)[0]
+        pair = self.opponents.get(me, {}).pop(them, None)
+        if pair is not None:
+            del self.opponents[them][me]
+            self._ranked.remove(pair)
+            self.version += 1
+
+    def drop(self, uid):
+        """Forget every pair `uid` is in."""
+        for opp in list(self.opponents.get(self._id(uid)[0], ())):
+            self.remove(uid, opp)
+
+    def load(self, uid, h2h, replace=False):
+        """
+        Add `uid`'s side of the head-to-heads in a {opponent: {'wins', 'losses'}}
+        map. A pair the opponent's map already put in keeps that value unless
+        `replace`; if the two disagree it is counted in `conflicts`.
+        """
+        for opp, rec in h2h.items():
+            wins, losses = rec.get('wins', 0), rec.get('losses', 0)
+            if not replace:
+                known = self.record(uid, opp)
+                if known is not None:
+                    self.conflicts += known != (wins, losses)
+                    continue
+            self.set(uid, opp, wins, losses)
+
+    def most_played(self, k=10):
+        """[((low_id, high_id), low_wins, high_wins, games), ...] for the `k` most-played pairs."""
+        return [((a, b), low_wins, -neg_games - low_wins, -neg_games)
+                for neg_games, _, a, b, low_wins in self._ranked.islice(0, k)]
+
+    def view(self, uid):
+        return PlayerPairs(self, uid)
+
+
+class Side(MutableMapping):
+    """One player's {'wins', 'losses'} against one opponent, read from and written to the table."""
+    __slots__ = ('table', 'uid', 'opp')
+    KEYS = ('wins', 'losses')
+
+    def __init__(self, table, uid, opp):
+        self.table, self.uid, self.opp = table, uid, opp
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return (self.table.record(self.uid, self.opp) or (0, 0))[key == 'losses']
+
+    def __setitem__(self, key, value):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        wins, losses = self.table.record(self.uid, self.opp) or (0, 0)
+        if key == 'wins':
+            self.table.set(self.uid, self.opp, value, losses)
+        else:
+            self.table.set(self.uid, self.opp, wins, value)
+
+    def __delitem__(self, key):
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class PlayerPairs(MutableMapping):
+    """A player's `head_to_head`: {opponent id (str): Side}, backed by the table."""
+    __slots__ = ('table', 'uid')
+
+    def __init__(self, table, uid):
+        self.table, self.uid = table, uid
+
+    def _mine(self):
+        return self.table.opponents.get(self.table._id(self.uid)[0], {})
+
+    def __getitem__(self, opp):
+        if self.table._id(opp)[0] not in self._mine():
+            raise KeyError(opp)
+        return Side(self.table, self.uid, opp)
+
+    def __setitem__(self, opp, rec):
+        self.table.set(self.uid, opp, rec.get('wins', 0), rec.get('losses', 0))
+
+    def __delitem__(self, opp):
+        if self.table._id(opp)[0] not in self._mine():
+            raise KeyError(opp)
+        self.table.remove(self.uid, opp)
+
+    def __contains__(self, opp):
+        return self.table._id(opp)[0] in self._mine()
+
+    def __iter__(self):
+        return iter(list(self._mine()))
+
+    def __len__(self):
+        return len(self._mine())
+
+    def to_dict(self):
+        return {opp: dict(zip(Side.KEYS, self.table.record(self.uid, opp))) for opp in self}
+
+    # copies and pickles are detached plain dicts; the table is the league's, not the player's
+    def __copy__(self):
+        return self.to_dict()
+
+    def __deepcopy__(self, memo):
+        return self.to_dict()
+
+    def __reduce__(self):
+        return dict, (self.to_dict(),)
+
+    def __repr__(self):
+        return repr(self.to_dict())
@@ -0,0 +1,150 @@
+"""
+Per-command latency: where the time of each slash command goes.
+
+Every command call gets a `Call` (started from the command tree's
+interaction check, finished on completion or error). Code on the hot
+path wraps its work in `stage(name)`; the time is added to whichever
+call is running in the current task, and ignored outside a command
+(flushes, the decay job). Finished calls go into rolling windows of the
+last WINDOW samples per (command, stage), which /perf reports as
+p50/p95/p99. `ack` is the time from the handler starting to the first
+response or defer, the part Discord's 3-second window cares about.
+
+A stage over its BUDGETS entry is printed and appended to SLOW_LOG.
+"""
+import functools
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+WINDOW   = 500      # samples kept per command and stage
+SLOW_LOG = os.getenv("SLOW_LOG", "slow_calls.jsonl")
+STAGES   = ('storage', 'rating', 'resolve', 'chart', 'send', 'ack', 'total')
+
+# seconds; a call over any of these is logged as slow
+BUDGETS = {
+    'storage': 0.10,
+    'rating':  0.05,
+    'resolve': 0.75,
+    'chart':   2.00,
+    'send':    1.00,
+    'ack':     2.50,
+    'total':   8.00,
+}
+
+_current = ContextVar('perf_call', default=None)
+
+
+class Call:
+    def __init__(self, command):
+        self.command = command
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.failed = False
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+
+class Recorder:
+
+    def __init__(self, window=WINDOW, budgets=BUDGETS, slow_log=SLOW_LOG):
+        self.window = window
+        self.budgets = budgets
+        self.slow_log = slow_log
+        self.samples = {}       # command -> {stage: deque of seconds}
+        self.calls = {}         # command -> calls since start
+        self.failures = {}
+        self.slow = deque(maxlen=20)
+
+    def begin(self, command):
+        call = Call(command)
+        _current.set(call)
+        return call
+
+    def end(self, call, failed=False):
+        call.add('total', time.perf_counter() - call.start)
+        call.failed = failed
+        windows = self.samples.setdefault(call.command, {})
+        for name, seconds in call.stages.items():
+            windows.setdefault(name, deque(maxlen=self.window)).append(seconds)
+        self.calls[call.command] = self.calls.get(call.command, 0) + 1
+        if failed:
+            self.failures[call.command] = self.failures.get(call.command, 0) + 1
+
+        over = {k: v for k, v in call.stages.items() if v > self.budgets.get(k, float('inf'))}
+        if over:
+            self._log_slow(call, over)
+
+    def _log_slow(self, call, over):
+        entry = {
+            'at':      datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'command': call.command,
+            'over':    sorted(over),
+            'stages':  {k: round(v, 4) for k, v in call.stages.items()},
+            'failed':  call.failed,
+        }
+        self.slow.append(entry)
+        print(f"Slow /{call.command}: " + ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in over.items()))
+        try:
+            with open(self.slow_log, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        except OSError as e:
+            print(f"Could not write {self.slow_log}: {e}")
+
+    def percentiles(self, command):
+        """{stage: (p50, p95, p99, samples)} for one command, in STAGES order."""
+        out = {}
+        windows = self.samples.get(command, {})
+        for name in STAGES:
+            if windows.get(name):
+                p50, p95, p99 = np.percentile(np.fromiter(windows[name], dtype=float), (50, 95, 99))
+                out[name] = (float(p50), float(p95), float(p99), len(windows[name]))
+        return out
+
+    def commands(self):
+        """Commands seen so far, slowest p95 total first."""
+        return sorted(self.samples, key=lambda c: -self.percentiles(c).get('total', (0, 0))[1])
+
+
+recorder = Recorder()
+
+
+@contextmanager
+def stage(name):
+    """Add the time spent in the block to `name` of the running command, if any."""
+    call = _current.get()
+    if call is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        call.add(name, time.perf_counter() - start)
+
+
+def timed(cls, method, name, ack=False):
+    """
+    Wrap the coroutine method `cls.method` in `stage(name)`. With `ack`,
+    the first such call in a command also sets its 'ack' time.
+    """
+    original = getattr(cls, method)
+
+    @functools.wraps(original)
+    async def wrapper(*args, **kwargs):
+        with stage(name):
+            result = await original(*args, **kwargs)
+        call = _current.get()
+        if ack and call is not None and 'ack' not in call.stages:
+            call.add('ack', time.perf_counter() - call.start)
+        return result
+
+    setattr(cls, method, wrapper)
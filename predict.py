@@ -0,0 +1,222 @@
+"""
+Monte Carlo tournament predictor for /predict.
+
+Each chunk of trials is simulated as numpy arrays shaped (trials, players):
+every round plays all of its matches in every trial at once, and ratings
+are updated between rounds with the same formula as `elo.process_match`
+(expected_score, disparity scaling, floor and the first-5-wins bonus).
+Chunks run in a process pool and are collected until the time budget
+runs out, so a 64-player bracket still answers inside one followup.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import elo
+
+
+POOL_WORKERS = 2
+TRIALS       = 20000
+CHUNK        = 2500     # trials per pool task
+TIME_BUDGET  = 6.0      # seconds; whatever finished by then is reported
+MAX_PLAYERS  = 128
+
+FORMATS = ('bracket', 'roundrobin')
+
+
+def _deltas(w_elo, l_elo, w_wins, p):
+    # process_match, vectorised: returns (winner gain incl. bonus, loser loss);
+    # `p` is expected_score(w_elo, l_elo), already computed to pick the winner
+    base = np.ceil(elo.K * (1 - p))
+    capped = np.clip(np.abs(w_elo - l_elo), elo.dISPARITY_MIN, elo.dISPARITY_MAX)
+    factor = (capped - elo.dISPARITY_MIN) / (elo.dISPARITY_MAX - elo.dISPARITY_MIN)
+    win_scale = np.where(w_elo < l_elo, 1 + factor, 1)
+    loss_scale = np.where(l_elo < w_elo, 1 - factor, 1)
+    gain = np.ceil(base * win_scale) + np.where(w_wins < 5, 5, 0)
+    return gain, np.ceil(base * loss_scale)
+
+
+def _play(rng, ratings, wins, a, b):
+    """
+    Play a[t, j] vs b[t, j] for every trial t and match j (-1 is a bye,
+    which the other side wins). Updates ratings/wins in place and returns
+    (winner, loser) arrays shaped like `a`.
+    """
+    # flat (trial * players + player) indexes into contiguous views
+    flat_r, flat_w = ratings.reshape(-1), wins.reshape(-1)
+    base = (np.arange(a.shape[0]) * ratings.shape[1])[:, None]
+    ia, ib = base + np.maximum(a, 0), base + np.maximum(b, 0)
+    ea, eb = flat_r[ia], flat_r[ib]
+
+    p = elo.expected_score(ea, eb)
+    a_wins = rng.random(a.shape) < p
+    played = (a >= 0) & (b >= 0)
+    if not played.all():
+        a_wins = np.where(b < 0, True, np.where(a < 0, False, a_wins))
+    winner = np.where(a_wins, a, b)
+    loser = np.where(a_wins, b, a)
+
+    iw, il = np.where(a_wins, ia, ib), np.where(a_wins, ib, ia)
+    w_elo, l_elo = np.where(a_wins, ea, eb), np.where(a_wins, eb, ea)
+    pw = np.where(a_wins, p, 1 - p)
+    if not played.all():
+        iw, il, w_elo, l_elo, pw = iw[played], il[played], w_elo[played], l_elo[played], pw[played]
+    gain, loss = _deltas(w_elo, l_elo, flat_w[iw], pw)
+    flat_r[iw] = np.maximum(elo.ELO_FLOOR, w_elo + gain)
+    flat_r[il] = np.maximum(elo.ELO_FLOOR, l_elo - loss)
+    flat_w[iw] += 1
+    return winner, loser
+
+
+def _bracket_slots(n):
+    # standard seeding: 1 v 16, 8 v 9, ... so top seeds meet as late as possible
+    order = [0]
+    while len(order) < n:
+        size = len(order) * 2
+        order = [x for s in order for x in (s, size - 1 - s)]
+    return np.array([s if s < n else -1 for s in order])
+
+
+def _count(players, n):
+    players = players[players >= 0]
+    return np.bincount(players, minlength=n)
+
+
+def simulate_bracket(ratings, wins, trials, seed):
+    """
+    Single elimination with a third-place match. Returns counts:
+    `reach[r, i]` (player i won r matches) and `place[i, k]` (finished k+1).
+    """
+    n = len(ratings)
+    rng = np.random.default_rng(seed)
+    r = np.tile(np.asarray(ratings, dtype=float), (trials, 1))
+    w = np.tile(np.asarray(wins), (trials, 1))
+    slots = np.tile(_bracket_slots(n), (trials, 1))
+
+    reach = [np.full(n, trials)]
+    semi_losers = None
+    while slots.shape[1] > 1:
+        winner, loser = _play(rng, r, w, slots[:, 0::2], slots[:, 1::2])
+        if slots.shape[1] == 4:
+            semi_losers = loser
+        slots = winner
+        reach.append(_count(winner, n))
+
+    place = np.zeros((n, 3), dtype=np.int64)
+    place[:, 0] = _count(slots[:, 0], n)
+    place[:, 1] = _count(loser[:, 0], n)
+    if semi_losers is not None:
+        third, _ = _play(rng, r, w, semi_losers[:, :1], semi_losers[:, 1:])
+        place[:, 2] = _count(third[:, 0], n)
+    return {'trials': trials, 'reach': np.array(reach), 'place': place}
+
+
+def _round_robin_rounds(n):
+    # circle method: n-1 rounds (n if odd), nobody plays twice in a round
+    ids = list(range(n)) + ([-1] if n % 2 else [])
+    m = len(ids)
+    rounds = []
+    for _ in range(m - 1):
+        pairs = [(ids[i], ids[m - 1 - i]) for i in range(m // 2)]
+        pairs = [p for p in pairs if p[0] >= 0 and p[1] >= 0]
+        rounds.append((np.array([p[0] for p in pairs]), np.array([p[1] for p in pairs])))
+        ids = [ids[0]] + [ids[-1]] + ids[1:-1]
+    return rounds
+
+
+def simulate_round_robin(ratings, wins, trials, seed):
+    """
+    Everyone plays everyone once; standings by matches won, ties broken
+    by rating at the end. Returns `place[i, k]` counts for every place.
+    """
+    n = len(ratings)
+    rng = np.random.default_rng(seed)
+    r = np.tile(np.asarray(ratings, dtype=float), (trials, 1))
+    w = np.tile(np.asarray(wins), (trials, 1))
+    points = np.zeros((trials, n), dtype=np.int64)
+
+    for a, b in _round_robin_rounds(n):
+        winner, _ = _play(rng, r, w, np.tile(a, (trials, 1)), np.tile(b, (trials, 1)))
+        points.reshape(-1)[(np.arange(trials) * n)[:, None] + winner] += 1
+
+    order = np.lexsort((-r, -points))            # (trials, n): player at each place
+    places = np.broadcast_to(np.arange(n), order.shape)
+    place = np.bincount((order * n + places).ravel(), minlength=n * n).reshape(n, n)
+    return {'trials': trials, 'place': place}
+
+
+SIMULATORS = {'bracket': simulate_bracket, 'roundrobin': simulate_round_robin}
+
+
+def simulate(fmt, ratings, wins, trials, seed):
+    return SIMULATORS[fmt](ratings, wins, trials, seed)
+
+
+def _merge(total, part):
+    if total is None:
+        return part
+    return {key: total[key] + part[key] for key in total}
+
+
+def _warm():
+    from startup import rss_mb
+    return os.getpid(), rss_mb()
+
+
+class Predictor:
+    """
+    Runs `simulate` chunks in a spawn-context process pool (see
+    charts.ChartRenderer for why spawn) and merges whatever finished
+    within the time budget.
+    """
+
+    def __init__(self, workers=POOL_WORKERS, chunk=CHUNK, budget=TIME_BUDGET):
+        self.workers = workers
+        self.chunk = chunk
+        self.budget = budget
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def prewarm(self):
+        pool = self._executor()
+        return [pool.submit(_warm) for _ in range(self.workers)]
+
+    async def run(self, fmt, ratings, wins, trials=TRIALS, seed=None):
+        """Merged counts (plus 'elapsed'); 'trials' may be short of the request if the budget ran out."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        seeds = np.random.SeedSequence(seed).spawn(-(-trials // self.chunk))
+        sizes = [min(self.chunk, trials - i * self.chunk) for i in range(len(seeds))]
+        pending = {
+            loop.run_in_executor(self._executor(), simulate, fmt, list(ratings), list(wins), size, s)
+            for size, s in zip(sizes, seeds)
+        }
+
+        total = None
+        deadline = start + self.budget
+        while pending:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0 and total is not None:
+                break
+            done, pending = await asyncio.wait(pending, timeout=max(timeout, 0) or None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                total = _merge(total, fut.result())
+        for fut in pending:
+            fut.cancel()
+
+        total['elapsed'] = time.perf_counter() - start
+        return total
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,166 @@
+from itertools import count
+
+from sortedcontainers import SortedList
+
+
+class RankIndex:
+    """
+    Players ordered by one numeric stat (highest first), kept up to date
+    incrementally so rank lookups do not sort the league.
+
+    Ties keep registration order, which is what `sorted(data.items(), ...)`
+    over the league dict always gave. Player ids are the league's string
+    keys. Every lookup is O(log n).
+    """
+
+    def __init__(self, field='elo'):
+        self.field = field
+        self._sorted = SortedList()
+        self._keys = {}        # uid -> (-value, ordinal, uid)
+        self._ordinal = count()
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def __contains__(self, uid):
+        return uid in self._keys
+
+    def build(self, data):
+        self._ordinal = count()
+        self._keys = {
+            uid: (-entry.get(self.field, 0), next(self._ordinal), uid)
+            for uid, entry in data.items()
+        }
+        self._sorted = SortedList(self._keys.values())
+
+    def update(self, uid, entry):
+        old = self._keys.get(uid)
+        value = entry.get(self.field, 0)
+        if old is not None:
+            if old[0] == -value:
+                return
+            self._sorted.remove(old)
+            key = (-value, old[1], uid)
+        else:
+            key = (-value, next(self._ordinal), uid)
+        self._keys[uid] = key
+        self._sorted.add(key)
+
+    def remove(self, uid):
+        key = self._keys.pop(uid, None)
+        if key is not None:
+            self._sorted.remove(key)
+
+    def rank(self, uid):
+        """1-based rank of a registered player."""
+        return self._sorted.index(self._keys[uid]) + 1
+
+    def at(self, rank):
+        """Player id at 1-based `rank`."""
+        return self._sorted[rank - 1][2]
+
+    def place(self, uid, value):
+        """
+        (rank, above_uid, below_uid) for `uid`; neighbours are None at the
+        ends. A player not in the index is placed where they would land if
+        registered now with `value`, behind everyone already on it.
+        """
+        if uid in self._keys:
+            pos = self._sorted.index(self._keys[uid])
+            below = pos + 1
+        else:
+            pos = self._sorted.bisect_left((-value, float('inf')))
+            below = pos
+        above_uid = self._sorted[pos - 1][2] if pos > 0 else None
+        below_uid = self._sorted[below][2] if below < len(self._sorted) else None
+        return pos + 1, above_uid, below_uid
+
+
+class TopBoard(RankIndex):
+    """
+    A RankIndex that also serves a top-`k` board.
+
+    `version` only moves when an update can change what the board shows
+    (a player entering, leaving or moving within the top `k`), so a
+    rendered board message can be cached against it (per guild, since
+    names are guild display names):
+
+        version = board.version
+        msg = board.cached(guild_id)
+        if msg is None:
+            msg = ...render board.top()...
+            board.remember(version, msg, guild_id)
+    """
+
+    def __init__(self, field='elo', k=10):
+        super().__init__(field)
+        self.k = k
+        self.version = 0
+        self._rendered = {}     # key -> (version, message)
+
+    def build(self, data):
+        super().build(data)
+        self.version += 1
+
+    def _in_top(self, key):
+        return key is not None and self._sorted.bisect_left(key) < self.k
+
+    def update(self, uid, entry):
+        old = self._keys.get(uid)
+        if old is not None and old[0] == -entry.get(self.field, 0):
+            return
+        was_top = self._in_top(old)
+        super().update(uid, entry)
+        if was_top or self._in_top(self._keys[uid]):
+            self.version += 1
+
+    def remove(self, uid):
+        if self._in_top(self._keys.get(uid)):
+            self.version += 1
+        super().remove(uid)
+
+    def top(self):
+        """The board as [(uid, value), ...], best first. O(k)."""
+        return [(uid, -neg) for neg, _, uid in self._sorted.islice(0, self.k)]
+
+    def cached(self, key=None):
+        hit = self._rendered.get(key)
+        if hit is not None and hit[0] == self.version:
+            return hit[1]
+        return None
+
+    def remember(self, version, message, key=None):
+        """Cache `message` as the render of `version` (ignored if already stale)."""
+        if version == self.version:
+            self._rendered[key] = (version, message)
+
+
+def rivalries(data, k=10):
+    """
+    The `k` most-played singles pairings from the head-to-head tallies,
+    as [((uid_a, uid_b), wins_a, wins_b, games), ...] with uid_a < uid_b.
+
+    A loaded league keeps its pairs ranked as they change (pairs.py), so
+    this is the front of that list; a plain dict league is scanned.
+    """
+    pairs = getattr(data, 'h2h', None)
+    if pairs is not None:
+        return pairs.most_played(k)
+
+    seen = set()
+    records = []
+
+    for uid, entry in data.items():
+        for opp_id, rec in entry.get('head_to_head', {}).items():
+            a, b = sorted((int(uid), int(opp_id)))
+            if (a, b) in seen:
+                continue
+            seen.add((a, b))
+
+            wins_a = data[str(a)]['head_to_head'].get(str(b), {}).get('wins', 0)
+            wins_b = data[str(b)]['head_to_head'].get(str(a), {}).get('wins', 0)
+            total  = wins_a + wins_b
+
+            records.append(((a, b), wins_a, wins_b, total))
+
+    return sorted(records, key=lambda x: (x[3], max(x[1], x[2])), reverse=True)[:k]
@@ -0,0 +1,219 @@
+"""
+Slotted player records for the resident leagues.
+
+The JSON files hold one dict per player, with a dict per head-to-head
+and per history entry. Parsed as-is that is a full dict object (with
+its own hash table) for every one of them. Here each is a small object
+with `__slots__` for the schema's fields instead, and anything outside
+the schema (e.g. `decayed`) goes into a per-record overflow dict that
+most players never allocate.
+
+Records are mutable mappings, so `entry['elo']`, `.get()`,
+`.setdefault()`, `.update()`, `in` and `dict(entry)` behave as they did
+on the dicts. `from_dict` fills in, once, the fields register_user used
+to setdefault on every call; other missing fields stay missing.
+`to_dict()` (and utils.json_default) turns a record back into the JSON
+schema it came from, key for key.
+"""
+import copy
+from collections import deque
+from collections.abc import MutableMapping
+
+
+class Record(MutableMapping):
+    __slots__ = ('_extra',)     # keys outside FIELDS, or None
+
+    FIELDS = ()
+    DEFAULTS = {}   # filled in by from_dict when missing: field -> factory(record)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELDS = tuple(cls.__slots__)
+        cls._fields = frozenset(cls.FIELDS)
+
+    def __init__(self, **fields):
+        self._extra = None
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, d):
+        rec = cls()
+        for key, value in d.items():
+            rec[key] = value
+        for key, factory in cls.DEFAULTS.items():
+            if key not in rec:
+                rec[key] = factory(rec)
+        return rec
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._fields:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        try:
+            if key in self._fields:
+                delattr(self, key)
+            else:
+                del self._extra[key]
+        except (AttributeError, KeyError, TypeError):
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __copy__(self):
+        new = type(self)()
+        for key, value in self.items():
+            new[key] = value
+        return new
+
+    def __deepcopy__(self, memo):
+        new = type(self)()
+        for key, value in self.items():
+            new[key] = copy.deepcopy(value, memo)
+        return new
+
+    def __reduce__(self):
+        return type(self).from_dict, (self.to_dict(),)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class HeadToHead(Record):
+    """One side of a singles head-to-head."""
+    __slots__ = ('wins', 'losses')
+
+
+class HistoryEntry(Record):
+    """One match in a player's short `match_history`, from their side."""
+    __slots__ = ('winner_id', 'opponent_id', 'result', 'score_w', 'score_l', 'elo_after', 'opponent_elo_after')
+
+
+class League(dict):
+    """{uid: PlayerRecord} for a singles league, with its PairTable as `h2h`."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.h2h = None
+
+
+class DoublesLeague(dict):
+    """{uid: DoublesRecord} for a doubles league, with its DuoIndex as `duos`."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.duos = None
+
+
+class PlayerRecord(Record):
+    """A singles player (elo.py)."""
+    __slots__ = ('elo', 'wins', 'losses', 'first_5_bonus', 'streak', 'head_to_head', 'medals',
+                 'all_time_gain', 'all_time_loss', 'match_history', 'peak_elo')
+
+    # what elo.register_user used to setdefault on every call for an existing player
+    DEFAULTS = {
+        'head_to_head':  lambda rec: {},
+        'medals':        lambda rec: [],
+        'all_time_gain': lambda rec: 0,
+        'all_time_loss': lambda rec: 0,
+        'match_history': lambda rec: [],
+    }
+
+    @classmethod
+    def new(cls):
+        return cls(elo=100, wins=0, losses=0, first_5_bonus=0, streak=0, head_to_head={}, medals=[],
+                   all_time_gain=0, all_time_loss=0, match_history=[], peak_elo=100)
+
+    @classmethod
+    def from_dict(cls, d, pairs=None, uid=None, replace=False):
+        """
+        With a league's PairTable (see pairs.py), the head-to-heads go into
+        it and `head_to_head` becomes this player's view of it; `replace`
+        overwrites pairs the table already has (a restore) rather than
+        keeping them (a load, where the opponent got there first).
+        """
+        rec = super().from_dict(d)
+        if pairs is not None:
+            if replace:
+                pairs.drop(uid)
+            pairs.load(uid, rec.head_to_head, replace)
+            rec.head_to_head = pairs.view(uid)
+        else:
+            rec.head_to_head = {opp: r if isinstance(r, HeadToHead) else HeadToHead.from_dict(r)
+                                for opp, r in rec.head_to_head.items()}
+        history = [h if isinstance(h, HistoryEntry) else HistoryEntry.from_dict(h) for h in rec.match_history]
+        if isinstance(rec.match_history, deque):
+            history = deque(history, maxlen=rec.match_history.maxlen)
+        rec.match_history = history
+        return rec
+
+
+class DoublesRecord(Record):
+    """A doubles player (doubles_elo.py)."""
+    __slots__ = ('elo', 'wins', 'losses', 'streak', 'medals', 'all_time_gain', 'all_time_loss',
+                 'peak_elo', 'partners', 'partners_losses')
+
+    # what doubles_elo.register_user used to setdefault on every call
+    DEFAULTS = {
+        'elo':             lambda rec: 100,
+        'wins':            lambda rec: 0,
+        'losses':          lambda rec: 0,
+        'streak':          lambda rec: 0,
+        'medals':          lambda rec: [],
+        'all_time_gain':   lambda rec: 0,
+        'all_time_loss':   lambda rec: 0,
+        'peak_elo':        lambda rec: rec['elo'],
+        'partners':        lambda rec: {},
+        'partners_losses': lambda rec: {},
+    }
+
+    @classmethod
+    def new(cls):
+        return cls.from_dict({})
+
+    @classmethod
+    def from_dict(cls, d, duos=None, uid=None, replace=False):
+        """
+        With a league's DuoIndex (see duos.py), the partner tallies go into
+        it and `partners` / `partners_losses` become this player's views of
+        it; `replace` as in PlayerRecord.from_dict.
+        """
+        rec = super().from_dict(d)
+        if duos is not None:
+            if replace:
+                duos.drop(uid)
+            duos.load(uid, rec.partners, rec.partners_losses, replace)
+            rec.partners, rec.partners_losses = duos.view(uid, 0), duos.view(uid, 1)
+        return rec
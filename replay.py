@@ -0,0 +1,424 @@
+"""
+Recompute ratings from scratch from an ordered match log.
+
+    result = replay_singles(matches, k=32)
+    data = result.to_data(keep=elo.load_data())   # keeps medals etc.
+
+`matches` is a sequence of (winner_id, loser_id[, score_w, score_l])
+tuples or of `process_match` keyword dicts (the journal's 'match' args);
+doubles take (a1, a2, b1, b2) or `process_doubles_match` dicts. The
+output reproduces process_match / process_doubles_match exactly,
+including the ceil rounding, disparity scaling, first-5 bonus and
+ELO_FLOOR, for leagues that start from an empty file.
+
+The log is split into layers in which no player appears twice; each
+layer is applied with NumPy array operations over dense player indexes.
+Because ratings are integers, every possible rating gap maps to a fixed
+(gain, loss) pair. Those pairs come from a lookup table computed with
+the same Python float expressions process_match uses, so the results
+match bit for bit.
+
+    python replay.py singles matches.json out.json [--k 32] [--disparity-max 300]
+"""
+import argparse
+import json
+import math
+
+import numpy as np
+
+import elo
+import doubles_elo as dE
+
+
+SMALL_LAYER = 16   # average layer size below which a plain loop beats array ops
+
+
+def _layers(players):
+    """
+    Layer number per match so matches in one layer share no player and
+    each player's matches keep their order. `players` is (n, width).
+    """
+    last = [-1] * (int(players.max()) + 1)
+    out = []
+    for row in players.tolist():
+        layer = max(map(last.__getitem__, row)) + 1
+        for p in row:
+            last[p] = layer
+        out.append(layer)
+    return np.array(out, dtype=np.int64)
+
+
+class _DeltaTable:
+    """
+    (gain, loss) per rating gap, computed with process_match's own float
+    expressions. Gaps are measured in 1/`scale` ELO so the half-point team
+    averages used by doubles stay exact integers.
+    """
+
+    def __init__(self, k, disparity_min, disparity_max, scale=1, span=4096):
+        self.k, self.dmin, self.dmax, self.scale = k, disparity_min, disparity_max, scale
+        self._build(span)
+
+    def _entry(self, units):
+        w = units / self.scale if self.scale != 1 else units
+        l = 0
+        p = elo.expected_score(w, l)
+        base = math.ceil(self.k * (1 - p))
+        disparity = abs(w - l)
+        capped = max(self.dmin, min(disparity, self.dmax))
+        factor = (capped - self.dmin) / (self.dmax - self.dmin)
+        win_scale  = 1 + factor if w < l else 1
+        loss_scale = 1 - factor if l < w else 1
+        return math.ceil(base * win_scale), math.ceil(base * loss_scale)
+
+    def _build(self, span):
+        self.span = span
+        self.entries = [self._entry(u) for u in range(-span, span + 1)]
+        self.gain = np.array([g for g, _ in self.entries], dtype=np.int64)
+        self.loss = np.array([l for _, l in self.entries], dtype=np.int64)
+
+    def lookup(self, units):
+        """`units` = scale * (winner side - loser side) as an int array."""
+        reach = int(np.max(np.abs(units)))
+        if reach > self.span:
+            self._build(max(reach, 2 * self.span))
+        idx = units + self.span
+        return self.gain[idx], self.loss[idx]
+
+    def pair(self, units):
+        """Scalar `lookup` for the plain-loop path."""
+        if abs(units) > self.span:
+            self._build(max(abs(units), 2 * self.span))
+        return self.entries[units + self.span]
+
+
+def _dense(columns):
+    """Dense index per id (first appearance order) plus the id per index."""
+    flat = columns.reshape(-1)
+    ids, first, inverse = np.unique(flat, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[inverse].reshape(columns.shape), ids[order]
+
+
+def _as_array(matches, keys):
+    """(n, len(keys)) int64 array; missing values (no score given) become 0."""
+    if len(matches) and not isinstance(matches[0], dict):
+        try:
+            arr = np.array(matches, dtype=np.int64).reshape(len(matches), -1)
+        except (TypeError, ValueError):
+            pass   # ragged or None scores: take the slow path
+        else:
+            if arr.shape[1] == len(keys):
+                return arr
+            return np.hstack([arr, np.zeros((len(arr), len(keys) - arr.shape[1]), dtype=np.int64)])
+    rows = []
+    for m in matches:
+        if isinstance(m, dict):
+            row = [m.get(k) for k in keys]
+        else:
+            row = list(m) + [None] * (len(keys) - len(m))
+        rows.append([v or 0 for v in row])
+    return np.array(rows, dtype=np.int64).reshape(-1, len(keys))
+
+
+class SinglesReplay:
+    def __init__(self, ids, players, scores, state, w_after, l_after, h2h, history_limit):
+        self.ids = ids                # dense index -> discord id
+        self.players = players        # (n, 2) dense winner/loser per match
+        self.scores = scores          # (n, 2) score_w, score_l
+        self.state = state            # dict of per-player arrays
+        self.w_after = w_after
+        self.l_after = l_after
+        self.h2h = h2h                # (winner idx, loser idx, wins) rows
+        self.history_limit = history_limit
+
+    def _histories(self):
+        n = len(self.players)
+        who = np.concatenate([self.players[:, 0], self.players[:, 1]])
+        match = np.concatenate([np.arange(n), np.arange(n)])
+        order = np.lexsort((match, who))
+        who, match = who[order], match[order]
+        ends = np.flatnonzero(np.r_[who[1:] != who[:-1], True])
+        starts = np.r_[0, ends[:-1] + 1]
+        ids = self.ids.tolist()
+        out = {}
+        for s, e in zip(starts.tolist(), ends.tolist()):
+            p = int(who[s])
+            recs = []
+            for i in match[max(s, e + 1 - self.history_limit):e + 1][::-1].tolist():
+                w, l = self.players[i].tolist()
+                score_w, score_l = self.scores[i].tolist()
+                w_after, l_after = int(self.w_after[i]), int(self.l_after[i])
+                won = (w == p)
+                recs.append({
+                    "winner_id": ids[w],
+                    "opponent_id": ids[l] if won else ids[w],
+                    "result": 'W' if won else 'L',
+                    "score_w": score_w,
+                    "score_l": score_l,
+                    "elo_after": w_after if won else l_after,
+                    "opponent_elo_after": l_after if won else w_after,
+                })
+            out[p] = recs
+        return out
+
+    def to_data(self, keep=None):
+        """
+        League dict in the data.json schema. Fields a replay cannot derive
+        (medals, unknown keys) are copied from `keep` when given.
+        """
+        s = {key: col.tolist() for key, col in self.state.items()}
+        keys = [str(uid) for uid in self.ids.tolist()]
+        data = {}
+        for i, uid in enumerate(keys):
+            data[uid] = {
+                'elo':           int(s['elo'][i]),
+                'wins':          int(s['wins'][i]),
+                'losses':        int(s['losses'][i]),
+                'first_5_bonus': int(s['first_5_bonus'][i]),
+                'streak':        int(s['streak'][i]),
+                'head_to_head':  {},
+                'medals':        [],
+                'all_time_gain': int(s['all_time_gain'][i]),
+                'all_time_loss': int(s['all_time_loss'][i]),
+                'match_history': [],
+                'peak_elo':      int(s['peak_elo'][i]),
+            }
+        for w, l, count in self.h2h.tolist():
+            wk, lk = keys[w], keys[l]
+            data[wk]['head_to_head'].setdefault(lk, {'wins': 0, 'losses': 0})['wins'] += count
+            data[lk]['head_to_head'].setdefault(wk, {'wins': 0, 'losses': 0})['losses'] += count
+        for p, recs in self._histories().items():
+            data[keys[p]]['match_history'] = recs
+        _keep(data, keep)
+        return data
+
+
+def _keep(data, keep):
+    for uid, old in (keep or {}).items():
+        if uid not in data:
+            continue
+        data[uid]['medals'] = old.get('medals', [])
+        for key, value in old.items():
+            data[uid].setdefault(key, value)
+
+
+def replay_singles(matches, k=elo.K, disparity_min=elo.dISPARITY_MIN, disparity_max=elo.dISPARITY_MAX,
+                   elo_floor=elo.ELO_FLOOR, history_limit=elo.HISTORY_LIMIT, start_elo=100):
+    rows = _as_array(matches, ('winner_id', 'loser_id', 'score_w', 'score_l'))
+    players, ids = _dense(rows[:, :2])
+    scores = rows[:, 2:]
+    n, m = len(ids), len(players)
+
+    st = {
+        'elo':           np.full(n, start_elo, dtype=np.int64),
+        'wins':          np.zeros(n, dtype=np.int64),
+        'losses':        np.zeros(n, dtype=np.int64),
+        'first_5_bonus': np.zeros(n, dtype=np.int64),
+        'streak':        np.zeros(n, dtype=np.int64),
+        'all_time_gain': np.zeros(n, dtype=np.int64),
+        'all_time_loss': np.zeros(n, dtype=np.int64),
+        'peak_elo':      np.full(n, start_elo, dtype=np.int64),
+    }
+    w_after = np.empty(m, dtype=np.int64)
+    l_after = np.empty(m, dtype=np.int64)
+    table = _DeltaTable(k, disparity_min, disparity_max)
+
+    def vector(idx):
+        W, L = players[idx, 0], players[idx, 1]
+        wb, lb = st['elo'][W], st['elo'][L]
+        gain, loss = table.lookup(wb - lb)
+        bonus = np.where(st['wins'][W] < 5, 5, 0)
+        total = gain + bonus
+        wa = np.maximum(elo_floor, wb + total)
+        la = np.maximum(elo_floor, lb - loss)
+        st['elo'][W] = wa
+        st['elo'][L] = la
+        st['all_time_gain'][W] += total
+        st['all_time_loss'][L] += loss
+        st['wins'][W] += 1
+        st['first_5_bonus'][W] += (bonus > 0)
+        st['streak'][W] += 1
+        st['losses'][L] += 1
+        st['streak'][L] = 0
+        st['peak_elo'][W] = np.maximum(st['peak_elo'][W], wa)
+        w_after[idx] = wa
+        l_after[idx] = la
+
+    def scalar(s):
+        elo_, wins, streak, peak = s['elo'], s['wins'], s['streak'], s['peak_elo']
+        wa_out, la_out = [], []
+        for w, l in players.tolist():
+            wb, lb = elo_[w], elo_[l]
+            gain, loss = table.pair(wb - lb)
+            bonus = 5 if wins[w] < 5 else 0
+            total = gain + bonus
+            elo_[w] = wa = max(elo_floor, wb + total)
+            elo_[l] = la = max(elo_floor, lb - loss)
+            s['all_time_gain'][w] += total
+            s['all_time_loss'][l] += loss
+            wins[w] += 1
+            if bonus:
+                s['first_5_bonus'][w] += 1
+            streak[w] += 1
+            s['losses'][l] += 1
+            streak[l] = 0
+            if wa > peak[w]:
+                peak[w] = wa
+            wa_out.append(wa)
+            la_out.append(la)
+        w_after[:] = wa_out
+        l_after[:] = la_out
+
+    _run(players, st, vector, scalar)
+
+    pair = players[:, 0] * n + players[:, 1]
+    codes, counts = np.unique(pair, return_counts=True)
+    h2h = np.stack([codes // n, codes % n, counts], axis=1) if m else np.empty((0, 3), dtype=np.int64)
+    return SinglesReplay(ids, players, scores, st, w_after, l_after, h2h, history_limit)
+
+
+def _run(players, state, vector, scalar):
+    """
+    Apply every match: layer by layer through `vector(match_indexes)`, or,
+    when layers are too small for array ops to pay off (a handful of
+    players playing each other constantly), through `scalar(state_lists)`
+    in log order on plain lists.
+    """
+    if not len(players):
+        return
+    layer = _layers(players)
+    if len(players) < SMALL_LAYER * (int(layer.max()) + 1):
+        lists = {key: col.tolist() for key, col in state.items()}
+        scalar(lists)
+        for key, col in lists.items():
+            state[key][:] = col
+        return
+    order = np.argsort(layer, kind='stable')
+    bounds = np.flatnonzero(np.diff(layer[order])) + 1
+    for group in np.split(order, bounds):
+        vector(group)
+
+
+class DoublesReplay:
+    def __init__(self, ids, players, state, partners_w, partners_l):
+        self.ids = ids
+        self.players = players
+        self.state = state
+        self.partners_w = partners_w   # (player idx, partner idx, count)
+        self.partners_l = partners_l
+
+    def to_data(self, keep=None):
+        s = {key: col.tolist() for key, col in self.state.items()}
+        keys = [str(uid) for uid in self.ids.tolist()]
+        data = {}
+        for i, uid in enumerate(keys):
+            data[uid] = {
+                'elo':             int(s['elo'][i]),
+                'wins':            int(s['wins'][i]),
+                'losses':          int(s['losses'][i]),
+                'streak':          int(s['streak'][i]),
+                'medals':          [],
+                'all_time_gain':   int(s['all_time_gain'][i]),
+                'all_time_loss':   int(s['all_time_loss'][i]),
+                'peak_elo':        int(s['peak_elo'][i]),
+                'partners':        {},
+                'partners_losses': {},
+            }
+        for key, rows in (('partners', self.partners_w), ('partners_losses', self.partners_l)):
+            for p, q, count in rows.tolist():
+                data[keys[p]][key][keys[q]] = count
+        _keep(data, keep)
+        return data
+
+
+def replay_doubles(matches, k=dE.K, disparity_min=dE.dISPARITY_MIN, disparity_max=dE.dISPARITY_MAX,
+                   elo_floor=dE.ELO_FLOOR, start_elo=100):
+    players, ids = _dense(_as_array(matches, ('a1', 'a2', 'b1', 'b2')))
+    n = len(ids)
+
+    st = {
+        'elo':           np.full(n, start_elo, dtype=np.int64),
+        'wins':          np.zeros(n, dtype=np.int64),
+        'losses':        np.zeros(n, dtype=np.int64),
+        'streak':        np.zeros(n, dtype=np.int64),
+        'all_time_gain': np.zeros(n, dtype=np.int64),
+        'all_time_loss': np.zeros(n, dtype=np.int64),
+        'peak_elo':      np.full(n, start_elo, dtype=np.int64),
+    }
+    table = _DeltaTable(k, disparity_min, disparity_max, scale=2)
+
+    def vector(idx):
+        A = players[idx, :2]
+        B = players[idx, 2:]
+        # team averages are (a1+a2)/2, so the gap in half-points is an exact int
+        gap = st['elo'][A].sum(axis=1) - st['elo'][B].sum(axis=1)
+        delta_win, delta_loss = table.lookup(gap)
+        for col in (0, 1):
+            a, b = A[:, col], B[:, col]
+            st['elo'][a] = np.maximum(elo_floor, st['elo'][a] + delta_win)
+            st['wins'][a] += 1
+            st['streak'][a] += 1
+            st['all_time_gain'][a] += delta_win
+            st['peak_elo'][a] = np.maximum(st['peak_elo'][a], st['elo'][a])
+            st['elo'][b] = np.maximum(elo_floor, st['elo'][b] - delta_loss)
+            st['losses'][b] += 1
+            st['streak'][b] = 0
+            st['all_time_loss'][b] += delta_loss
+
+    def scalar(s):
+        elo_ = s['elo']
+        for a1, a2, b1, b2 in players.tolist():
+            delta_win, delta_loss = table.pair(elo_[a1] + elo_[a2] - elo_[b1] - elo_[b2])
+            for p in (a1, a2):
+                elo_[p] = max(elo_floor, elo_[p] + delta_win)
+                s['wins'][p] += 1
+                s['streak'][p] += 1
+                s['all_time_gain'][p] += delta_win
+                s['peak_elo'][p] = max(s['peak_elo'][p], elo_[p])
+            for p in (b1, b2):
+                elo_[p] = max(elo_floor, elo_[p] - delta_loss)
+                s['losses'][p] += 1
+                s['streak'][p] = 0
+                s['all_time_loss'][p] += delta_loss
+
+    _run(players, st, vector, scalar)
+
+    def tally(team):
+        pairs = np.concatenate([team, team[:, ::-1]])
+        if not len(pairs):
+            return np.empty((0, 3), dtype=np.int64)
+        codes, counts = np.unique(pairs[:, 0] * n + pairs[:, 1], return_counts=True)
+        return np.stack([codes // n, codes % n, counts], axis=1)
+
+    return DoublesReplay(ids, players, st, tally(players[:, :2]), tally(players[:, 2:]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Recompute a league from an ordered match log")
+    parser.add_argument('league', choices=('singles', 'doubles'))
+    parser.add_argument('matches', help="JSON list of matches, oldest first")
+    parser.add_argument('out', help="where to write the recomputed league JSON")
+    parser.add_argument('--k', type=int)
+    parser.add_argument('--disparity-min', type=int)
+    parser.add_argument('--disparity-max', type=int)
+    parser.add_argument('--keep', help="existing league file to copy medals and other non-match fields from")
+    args = parser.parse_args()
+
+    with open(args.matches) as f:
+        matches = json.load(f)
+    options = {name: value for name, value in (
+        ('k', args.k), ('disparity_min', args.disparity_min), ('disparity_max', args.disparity_max)
+    ) if value is not None}
+    keep = None
+    if args.keep:
+        with open(args.keep) as f:
+            keep = json.load(f)
+
+    replay = replay_singles if args.league == 'singles' else replay_doubles
+    data = replay(matches, **options).to_data(keep=keep)
+    with open(args.out, 'w') as f:
+        json.dump(data, f, indent=2)
+    print(f"Replayed {len(matches)} matches for {len(data)} players into {args.out}")
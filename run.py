@@ -0,0 +1,15 @@
+"""
+Start the bot: python run.py (python bot.py hands over to this).
+
+The chart and /predict pools spawn their workers, and a spawned process
+first re-runs its parent's main script. This one does nothing at the top
+level, so the workers don't import discord or build a second client,
+stores and decay job; bot.py is only imported below, in the bot process.
+"""
+if __name__ == "__main__":
+    # startup timing first, so the report sees every import bot.py makes
+    import startup
+    startup.track_imports()
+
+    import bot
+    bot.main()
@@ -0,0 +1,153 @@
+"""
+Frozen end-of-season standings.
+
+`/season end` writes each league's final table into
+seasons/<n>/<league>.<column>.npy, one plain numpy column per stat with
+rows in final rank order, plus a sorted uid column for lookups. Past
+seasons are opened with `np.load(mmap_mode='r')` on first use, so they
+cost nothing at startup and only the pages a query touches are read:
+a top 10 is the first rows, a player's line is a binary search.
+"""
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from perf import stage
+from utils import json_default
+
+
+SEASONS_DIR = 'seasons'
+COLUMNS = ('elo', 'wins', 'losses', 'streak', 'peak_elo', 'all_time_gain', 'all_time_loss')
+RESET_FIELDS = ('elo', 'peak_elo', 'wins', 'losses', 'streak', 'first_5_bonus')   # what new_season resets
+
+
+def _dir(n):
+    return os.path.join(SEASONS_DIR, str(n))
+
+
+def list_seasons():
+    """Numbers of the archived (finished) seasons, oldest first."""
+    if not os.path.isdir(SEASONS_DIR):
+        return []
+    return sorted(int(d) for d in os.listdir(SEASONS_DIR)
+                  if d.isdigit() and os.path.exists(os.path.join(_dir(d), 'meta.json')))
+
+
+def current_season():
+    """Number of the live season."""
+    seasons = list_seasons()
+    return seasons[-1] + 1 if seasons else 1
+
+
+def meta(n):
+    with open(os.path.join(_dir(n), 'meta.json'), 'r') as f:
+        return json.load(f)
+
+
+def standings(data):
+    """The COLUMNS of every player in `data`, copied; what `freeze` needs of a league."""
+    return {uid: {c: e.get(c, 0) for c in COLUMNS} for uid, e in data.items()}
+
+
+def freeze(n, leagues, title=None):
+    """
+    Write season `n` from {league: data}. The files go to a temp directory
+    that is renamed into place last, so a season is either fully archived
+    or not there at all.
+    """
+    tmp = _dir(n) + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    counts = {}
+    for league, data in leagues.items():
+        uids = np.array([int(u) for u in data], dtype=np.uint64)
+        cols = {c: np.array([e.get(c, 0) for e in data.values()], dtype=np.int32) for c in COLUMNS}
+        # same order as the live rank index: elo desc, ties by registration
+        order = np.argsort(-cols['elo'], kind='stable')
+        np.save(os.path.join(tmp, f"{league}.uid.npy"), uids[order])
+        for c, col in cols.items():
+            np.save(os.path.join(tmp, f"{league}.{c}.npy"), col[order])
+        by_uid = np.argsort(uids[order], kind='stable')
+        np.save(os.path.join(tmp, f"{league}.uid_sorted.npy"), uids[order][by_uid])
+        np.save(os.path.join(tmp, f"{league}.uid_row.npy"), by_uid.astype(np.int32))
+        counts[league] = len(uids)
+
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({'season': n, 'title': title, 'ended_at': int(time.time()), 'players': counts}, f)
+    os.replace(tmp, _dir(n))
+
+
+def unfreeze(n):
+    """Remove season `n` again, for a season end whose reset didn't go through."""
+    for key in [k for k in _open if k[0] == n]:
+        del _open[key]
+    shutil.rmtree(_dir(n), ignore_errors=True)
+
+
+def reset_fields(data):
+    """Every player's RESET_FIELDS, copied ahead of a new_season so `unreset` can undo it."""
+    return {uid: {k: e[k] for k in RESET_FIELDS if k in e} for uid, e in data.items()}
+
+
+def unreset(data, saved):
+    """'undo_season' entries that put the `reset_fields` in `saved` back on the players in `data`."""
+    return {uid: dict(json.loads(json.dumps(data[uid], default=json_default)), **fields)
+            for uid, fields in saved.items() if uid in data}
+
+
+class SeasonTable:
+    """One league of one finished season, memory-mapped and read-only."""
+
+    def __init__(self, n, league):
+        base = os.path.join(_dir(n), league)
+        self.season = n
+        self.cols = {c: np.load(f"{base}.{c}.npy", mmap_mode='r') for c in ('uid',) + COLUMNS}
+        self._uid_sorted = np.load(f"{base}.uid_sorted.npy", mmap_mode='r')
+        self._uid_row = np.load(f"{base}.uid_row.npy", mmap_mode='r')
+
+    def __len__(self):
+        return len(self.cols['uid'])
+
+    def top(self, k=10):
+        """[(uid str, elo), ...] best first."""
+        return [(str(u), int(e)) for u, e in zip(self.cols['uid'][:k], self.cols['elo'][:k])]
+
+    def row(self, user_id):
+        i = int(np.searchsorted(self._uid_sorted, np.uint64(int(user_id))))
+        if i < len(self._uid_sorted) and int(self._uid_sorted[i]) == int(user_id):
+            return int(self._uid_row[i])
+        return None
+
+    def stats(self, user_id):
+        """The player's final line ({column: value, 'rank': n}) or None if they didn't play."""
+        r = self.row(user_id)
+        if r is None:
+            return None
+        out = {c: int(self.cols[c][r]) for c in COLUMNS}
+        out['rank'] = r + 1
+        return out
+
+    def neighbours(self, user_id):
+        """(above, below) as (uid str, elo) or None at the ends."""
+        r = self.row(user_id)
+        above = (str(self.cols['uid'][r - 1]), int(self.cols['elo'][r - 1])) if r else None
+        below = (str(self.cols['uid'][r + 1]), int(self.cols['elo'][r + 1])) if r + 1 < len(self) else None
+        return above, below
+
+
+_open = {}
+
+
+def table(n, league):
+    """SeasonTable for season `n`, opened once and kept; None if there is no such season."""
+    key = (n, league)
+    if key not in _open:
+        if n not in list_seasons():
+            return None
+        with stage('storage'):
+            _open[key] = SeasonTable(n, league)
+    return _open[key]
@@ -0,0 +1,229 @@
+"""
+SQLite storage for the singles and doubles leagues.
+
+Selected with STORAGE=sqlite; elo.py and doubles_elo.py then route
+`load_data`/`save_data` here instead of their JSON files. Players,
+head-to-head pairs, recent match history, medals and doubles partners
+live in indexed tables, so a save only touches the rows of the players
+that changed. Reads are served from the store's resident copy of the
+league (store.LeagueStore), so the database is only read whole, at
+start-up.
+
+One-shot import of the existing JSON files:
+
+    python sqlite_store.py import [data.json] [doubles_data.json]
+"""
+import json
+import sqlite3
+import sys
+
+
+DB_FILE = 'league.db'
+
+# scalar player fields stored as columns; anything else goes into `extra`
+PLAYER_COLUMNS = (
+    'elo', 'wins', 'losses', 'streak', 'first_5_bonus',
+    'all_time_gain', 'all_time_loss', 'peak_elo',
+)
+NESTED_KEYS = ('head_to_head', 'medals', 'match_history', 'partners', 'partners_losses')
+HISTORY_COLUMNS = (
+    'winner_id', 'opponent_id', 'result', 'score_w', 'score_l',
+    'elo_after', 'opponent_elo_after',
+)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS players (
+    league   TEXT    NOT NULL,
+    user_id  INTEGER NOT NULL,
+    {', '.join(f'{c} INTEGER' for c in PLAYER_COLUMNS)},
+    extra    TEXT,
+    PRIMARY KEY (league, user_id)
+);
+CREATE INDEX IF NOT EXISTS players_by_elo ON players (league, elo DESC);
+
+-- singles head-to-head, one row per unordered pair (a < b)
+CREATE TABLE IF NOT EXISTS head_to_head (
+    a       INTEGER NOT NULL,
+    b       INTEGER NOT NULL,
+    a_wins  INTEGER NOT NULL,
+    b_wins  INTEGER NOT NULL,
+    PRIMARY KEY (a, b)
+);
+CREATE INDEX IF NOT EXISTS head_to_head_by_b ON head_to_head (b);
+
+-- the hot per-player history buffer, pos 0 = newest
+CREATE TABLE IF NOT EXISTS match_history (
+    user_id INTEGER NOT NULL,
+    pos     INTEGER NOT NULL,
+    {', '.join(f'{c}' for c in HISTORY_COLUMNS)},
+    PRIMARY KEY (user_id, pos)
+);
+
+CREATE TABLE IF NOT EXISTS medals (
+    league  TEXT    NOT NULL,
+    user_id INTEGER NOT NULL,
+    pos     INTEGER NOT NULL,
+    medal   TEXT,
+    title   TEXT,
+    PRIMARY KEY (league, user_id, pos)
+);
+
+-- doubles partner tallies, from user_id's side
+CREATE TABLE IF NOT EXISTS partners (
+    user_id    INTEGER NOT NULL,
+    partner_id INTEGER NOT NULL,
+    wins       INTEGER,
+    losses     INTEGER,
+    PRIMARY KEY (user_id, partner_id)
+);
+"""
+
+_conn = None
+
+
+def connect(path=None):
+    """
+    Shared connection to the league database (WAL mode, schema ensured).
+    The bot's stores only touch it from their one I/O thread (see
+    LeagueStore.load/flush), whichever thread happened to open it.
+    """
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(path or DB_FILE, check_same_thread=False)
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(SCHEMA)
+    return _conn
+
+
+def _player_from_row(row):
+    entry = {c: row[c] for c in PLAYER_COLUMNS if row[c] is not None}
+    if row['extra']:
+        entry.update(json.loads(row['extra']))
+    return entry
+
+
+def _attach_nested(conn, league, entries):
+    """
+    Fill head_to_head / medals / history / partners for `entries` {uid: dict},
+    scanning each table once for the whole league.
+    """
+    for entry in entries.values():
+        entry['medals'] = []
+        if league == 'singles':
+            entry['head_to_head'] = {}
+            entry['match_history'] = []
+        else:
+            entry['partners'] = {}
+            entry['partners_losses'] = {}
+
+    for row in conn.execute("SELECT * FROM medals ORDER BY rowid"):
+        if row['league'] == league and row['user_id'] in entries:
+            entries[row['user_id']]['medals'].append({'medal': row['medal'], 'title': row['title']})
+
+    if league == 'singles':
+        for row in conn.execute("SELECT * FROM head_to_head ORDER BY rowid"):
+            a, b = row['a'], row['b']
+            if a in entries:
+                entries[a]['head_to_head'][str(b)] = {'wins': row['a_wins'], 'losses': row['b_wins']}
+            if b in entries:
+                entries[b]['head_to_head'][str(a)] = {'wins': row['b_wins'], 'losses': row['a_wins']}
+
+        for row in conn.execute("SELECT * FROM match_history ORDER BY rowid"):
+            if row['user_id'] in entries:
+                entries[row['user_id']]['match_history'].append({c: row[c] for c in HISTORY_COLUMNS})
+    else:
+        for row in conn.execute("SELECT * FROM partners ORDER BY rowid"):
+            entry = entries.get(row['user_id'])
+            if entry is None:
+                continue
+            if row['wins'] is not None:
+                entry['partners'][str(row['partner_id'])] = row['wins']
+            if row['losses'] is not None:
+                entry['partners_losses'][str(row['partner_id'])] = row['losses']
+
+
+def load_data(league):
+    """The whole league in the JSON schema, for the resident store."""
+    conn = connect()
+    entries = {}
+    for row in conn.execute("SELECT * FROM players WHERE league=?", (league,)):
+        entries[row['user_id']] = _player_from_row(row)
+    _attach_nested(conn, league, entries)
+    return {str(uid): entry for uid, entry in entries.items()}
+
+
+def _write_player(conn, league, uid, entry):
+    extra = {k: v for k, v in entry.items() if k not in PLAYER_COLUMNS and k not in NESTED_KEYS}
+    conn.execute(
+        f"INSERT OR REPLACE INTO players (league, user_id, {', '.join(PLAYER_COLUMNS)}, extra) "
+        f"VALUES (?, ?, {', '.join('?' * len(PLAYER_COLUMNS))}, ?)",
+        [league, uid, *(entry.get(c) for c in PLAYER_COLUMNS), json.dumps(extra) if extra else None])
+
+    conn.execute("DELETE FROM medals WHERE league=? AND user_id=?", (league, uid))
+    conn.executemany(
+        "INSERT INTO medals VALUES (?, ?, ?, ?, ?)",
+        [(league, uid, pos, m.get('medal'), m.get('title')) for pos, m in enumerate(entry.get('medals', []))])
+
+    if league == 'singles':
+        for opp, rec in entry.get('head_to_head', {}).items():
+            a, b = sorted((uid, int(opp)))
+            a_wins, b_wins = (rec['wins'], rec['losses']) if a == uid else (rec['losses'], rec['wins'])
+            conn.execute("INSERT OR REPLACE INTO head_to_head VALUES (?, ?, ?, ?)", (a, b, a_wins, b_wins))
+
+        conn.execute("DELETE FROM match_history WHERE user_id=?", (uid,))
+        conn.executemany(
+            f"INSERT INTO match_history VALUES (?, ?, {', '.join('?' * len(HISTORY_COLUMNS))})",
+            [(uid, pos, *(h.get(c) for c in HISTORY_COLUMNS))
+             for pos, h in enumerate(entry.get('match_history', []))])
+    else:
+        wins = entry.get('partners', {})
+        losses = entry.get('partners_losses', {})
+        conn.execute("DELETE FROM partners WHERE user_id=?", (uid,))
+        conn.executemany(
+            "INSERT INTO partners VALUES (?, ?, ?, ?)",
+            [(uid, int(p), wins.get(p), losses.get(p)) for p in set(wins) | set(losses)])
+
+
+def save_data(league, data, user_ids=None):
+    """
+    Upsert the given players (every player if `user_ids` is None) in one
+    transaction. Rows of players missing from `data` are left alone.
+    """
+    conn = connect()
+    keys = data.keys() if user_ids is None else [str(u) for u in user_ids]
+    with conn:
+        for key in keys:
+            if key in data:
+                _write_player(conn, league, int(key), data[key])
+
+
+def import_json(singles_path='data.json', doubles_path='doubles_data.json'):
+    """Copy the JSON league files into the database, replacing what is there."""
+    conn = connect()
+    counts = {}
+    for league, path in (('singles', singles_path), ('doubles', doubles_path)):
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        with conn:
+            conn.execute("DELETE FROM players WHERE league=?", (league,))
+            conn.execute("DELETE FROM medals WHERE league=?", (league,))
+            if league == 'singles':
+                conn.execute("DELETE FROM head_to_head")
+                conn.execute("DELETE FROM match_history")
+            else:
+                conn.execute("DELETE FROM partners")
+        save_data(league, data)
+        counts[league] = len(data)
+    return counts
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'import':
+        sys.exit(__doc__)
+    counts = import_json(*sys.argv[2:4])
+    print(f"Imported {counts['singles']} singles and {counts['doubles']} doubles players into {DB_FILE}")
@@ -0,0 +1,94 @@
+import builtins
+import json
+import os
+import resource
+import sys
+import time
+from datetime import datetime, timezone
+
+
+REPORT_FILE = os.getenv("STARTUP_REPORT", "startup_reports.jsonl")
+
+_t0 = time.perf_counter()
+_original_import = builtins.__import__
+_depth = 0
+
+import_times = {}   # top-level module -> seconds, nested imports included
+phases = {}         # phase name -> seconds since this module was imported
+workers = {}        # pool name -> {pid: RSS in MB}, filled in by bot._prewarm
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    global _depth
+    top = name.partition('.')[0]
+    if _depth or level or top in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _depth -= 1
+        import_times[top] = import_times.get(top, 0.0) + time.perf_counter() - start
+
+
+def track_imports():
+    """Time every new top-level import until `stop_tracking()`."""
+    builtins.__import__ = _timed_import
+
+
+def stop_tracking():
+    builtins.__import__ = _original_import
+
+
+def mark(phase):
+    phases.setdefault(phase, time.perf_counter() - _t0)
+
+
+def _process_age():
+    # seconds since exec, so interpreter start-up before this module counts too
+    try:
+        with open('/proc/self/stat') as f:
+            started = int(f.read().rpartition(')')[2].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - started / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # peak rather than current, but the best we have off Linux (KB there, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def report():
+    """Current numbers as a dict; also appended to REPORT_FILE by `write_report()`."""
+    slowest = sorted(import_times.items(), key=lambda kv: kv[1], reverse=True)
+    return {
+        'at':         datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python':     sys.version.split()[0],
+        'process_s':  _process_age(),
+        'phases_s':   {k: round(v, 4) for k, v in phases.items()},
+        'imports_s':  {k: round(v, 4) for k, v in slowest},
+        'rss_mb':     round(rss_mb(), 1),
+        'workers_rss_mb': {name: [round(rss, 1) for rss in pool.values()] for name, pool in workers.items()},
+    }
+
+
+def write_report():
+    rep = report()
+    with open(REPORT_FILE, 'a') as f:
+        f.write(json.dumps(rep) + '\n')
+    top = ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in list(rep['imports_s'].items())[:5])
+    pools = "".join(f" + {name} {sum(rss):.0f} MB" for name, rss in rep['workers_rss_mb'].items())
+    print(f"Startup: ready in {rep['phases_s'].get('ready', 0):.2f}s, RSS {rep['rss_mb']} MB{pools}; imports: {top}")
+    return rep
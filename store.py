@@ -0,0 +1,512 @@
+import asyncio
+import copy
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from eventlog import EventLog
+from journal import Journal, snapshot_seq, write_snapshot_text
+from perf import stage
+from utils import json_default
+
+
+FLUSH_DELAY     = 2.0    # seconds of quiet before dirty state is written
+MAX_FLUSH_DELAY = 15.0   # never hold dirty state longer than this
+
+# with a journal every event is already durable, so the full snapshot
+# is only compaction and can wait much longer
+COMPACT_DELAY     = 60.0
+MAX_COMPACT_DELAY = 600.0
+COMPACT_EVENTS    = 500  # journal length that forces a snapshot
+
+# op argument names that carry player ids
+PLAYER_ARGS = ('user_id', 'opponent_id', 'winner_id', 'loser_id', 'a1', 'a2', 'b1', 'b2')
+
+
+def op_players(args):
+    """The player ids an op's args name (none means it may touch anyone)."""
+    return [str(args[k]) for k in PLAYER_ARGS if k in args] + [str(u) for u in args.get('entries', ())]
+
+
+class PlayerLocks:
+    """
+    One asyncio lock per player id, created on first use and dropped when
+    nobody holds or waits for it. `hold(ids)` takes them in sorted order,
+    so two tasks can never each hold a lock the other wants, and skips the
+    ones the current task already holds, so a task inside a transaction
+    can commit to its own players.
+
+    `hold_all(ids)` is `hold` plus every lock in use, and while it lasts a
+    task that holds no lock yet waits before taking one, so nobody (e.g.
+    a player registering) joins the league under it.
+    """
+
+    def __init__(self):
+        self._locks = {}    # uid -> [Lock, tasks holding or waiting]
+        self._owners = {}   # uid -> task holding it
+        self._gate = None   # (task, Event) while a task holds the whole league
+
+    def held(self):
+        return len(self._owners)
+
+    @asynccontextmanager
+    async def hold(self, user_ids):
+        task = asyncio.current_task()
+        # tasks already holding a lock go on: hold_all may be waiting for them to finish
+        while self._gate is not None and self._gate[0] is not task and task not in self._owners.values():
+            await self._gate[1].wait()
+        wanted = sorted({str(u) for u in user_ids if self._owners.get(str(u)) is not task})
+        taken = []
+        try:
+            for uid in wanted:
+                slot = self._locks.setdefault(uid, [asyncio.Lock(), 0])
+                slot[1] += 1
+                try:
+                    await slot[0].acquire()
+                except BaseException:
+                    self._release(uid, slot, locked=False)
+                    raise
+                self._owners[uid] = task
+                taken.append(uid)
+            yield
+        finally:
+            for uid in reversed(taken):
+                del self._owners[uid]
+                self._release(uid, self._locks[uid])
+
+    @asynccontextmanager
+    async def hold_all(self, user_ids):
+        task = asyncio.current_task()
+        if self._gate is not None and self._gate[0] is task:
+            async with self.hold(user_ids):
+                yield
+            return
+        while self._gate is not None:
+            await self._gate[1].wait()
+        self._gate = (task, asyncio.Event())
+        try:
+            async with self.hold(list(user_ids) + list(self._locks)):
+                yield
+        finally:
+            gate, self._gate = self._gate, None
+            gate[1].set()
+
+    def _release(self, uid, slot, locked=True):
+        if locked:
+            slot[0].release()
+        slot[1] -= 1
+        if not slot[1]:
+            del self._locks[uid]
+
+
+class LeagueStore:
+    """
+    Process-resident copy of one league file (singles or doubles).
+
+    The file is parsed once by `load()` and commands read `store.data`
+    directly. Mutations go through `apply(op, **args)`, which runs the
+    named function from the league module's `OPS` table, appends the
+    event to an fsync'd journal and marks the store dirty. The full
+    snapshot is rewritten on a debounced schedule (and on shutdown), at
+    which point the journal is emptied. On startup the journal tail the
+    snapshot does not cover yet is replayed.
+    `backend` is the rating module that owns the storage format
+    (`elo` or `doubles_elo`). With STORAGE=sqlite there is no journal:
+    each flush is one transaction that upserts only the players touched
+    since the last flush.
+
+    Archives registered with `add_archive()` (see archive.py) keep every
+    match beyond the league file's short per-player history.
+
+    With `event_log=True` (JSON storage only) every flushed journal
+    event is also kept in an EventLog with periodic checkpoints, which is
+    what lets corrections.py void or edit a past match.
+
+    Inside the bot, commands use the async side: `await commit(op, **args)`
+    applies the op in memory right away (so reads, which are served from
+    `data`, see it at once) and waits while the journal and archive writes
+    run on the store's I/O thread. That is a one-worker executor, so disk
+    work happens strictly in the order the ops were applied, and the
+    debounced snapshot goes through the same queue. With a journal the
+    I/O thread keeps its own copy of the league (`shadow`), replaying each
+    event into it as it is journaled, and the snapshot is serialised from
+    that copy there; the event loop never serialises the league. The sync
+    `apply` and `flush` are for scripts, start-up and shutdown, or for
+    callers that have awaited `drain()` first.
+
+    `commit` takes the locks of the players its op names (all players for
+    an op that names none) and holds them until the op is journaled, so
+    matches between different players commit side by side while two on
+    the same player queue up. A command that reads a player, awaits, and
+    then writes or reads again wraps that in `async with
+    store.transaction(*ids)`, and nothing else commits to those players in
+    between. `store.exclusive()` does that for the whole league and keeps
+    new players out until it ends. A batch is all-or-nothing: if any op in it raises, or the
+    journal write fails, every player it touched is put back as it was
+    and nothing is journaled.
+
+    Indexes registered with `add_index()` (anything with `build(data)`
+    and `update(uid, entry)`, e.g. ranking.RankIndex) are rebuilt on load
+    and updated for just the players each op touched.
+    """
+
+    def __init__(self, backend, journal=None, flush_delay=None, max_flush_delay=None,
+                 compact_events=COMPACT_EVENTS, event_log=False, io=None):
+        if journal is None:
+            journal = backend.STORAGE == 'json'
+        self.backend         = backend
+        self.use_journal     = journal
+        self.flush_delay     = flush_delay or (COMPACT_DELAY if journal else FLUSH_DELAY)
+        self.max_flush_delay = max_flush_delay or (MAX_COMPACT_DELAY if journal else MAX_FLUSH_DELAY)
+        self.compact_events  = compact_events
+        self.data            = {}
+        self.shadow          = None     # the I/O thread's copy, with a journal
+        self.shadow_seq      = 0        # the last op replayed into it
+        self.seq             = 0
+        self.journal         = None
+        self.event_log       = event_log and journal
+        self.log             = None
+        self.indexes         = []
+        self.archives        = []
+        self.dirty           = False
+        self.dirty_ids       = set()
+        self.flushes         = 0
+        self._dirty_since    = None
+        self._flush_handle   = None
+        self.io              = io or ThreadPoolExecutor(1, thread_name_prefix='league-io')
+        self.locks           = PlayerLocks()
+
+    @property
+    def path(self):
+        return self.backend.DATA_FILE
+
+    def load(self):
+        self.data = self._on_io(self.backend.load_data)
+        for archive in self.archives:
+            archive.load()
+        self.dirty = False
+        self._dirty_since = None
+
+        if self.use_journal:
+            if self.journal is not None:
+                self.journal.close()
+            self.seq = snapshot_seq(self.path)
+            self.journal = Journal(f"{self.path}.journal")
+            if self.event_log:
+                self.log = EventLog(f"{self.path}.log")
+                self.log.load()
+            # parsed twice rather than copied: records and pair tables don't deep-copy as themselves
+            self.shadow = self._on_io(self.backend.load_data)
+            for event in self.journal.read(after_seq=self.seq):
+                result = self.backend.OPS[event['op']](self.data, **event['args'])
+                self.backend.OPS[event['op']](self.shadow, **event['args'])
+                self.seq = event['seq']
+                for archive in self.archives:
+                    archive.record(self.seq, event['op'], event['args'], result, replay=True)
+            self.shadow_seq = self.seq
+            if self.journal.count:
+                # fold the replayed tail into a fresh snapshot right away
+                self.dirty = True
+                self.flush()
+        else:
+            # no journal to carry seq across restarts; keep archive seqs increasing
+            self.seq = max([self.seq] + [a.last_seq for a in self.archives])
+
+        for index in self.indexes:
+            index.build(self.data)
+        return self.data
+
+    def add_index(self, index):
+        self.indexes.append(index)
+        index.build(self.data)
+        return index
+
+    def add_archive(self, archive):
+        """
+        Register an archive (see archive.py); it is loaded with the store
+        and offered every op after the op is journaled.
+        """
+        self.archives.append(archive)
+        return archive
+
+    def get_player(self, user_id):
+        """
+        Stats for `user_id` without registering them. Unknown players get
+        a fresh default entry that is NOT inserted into the league, so
+        read-only commands never create players.
+        """
+        stats = self.backend.get_stats(self.data, user_id)
+        if stats is None:
+            scratch = {}
+            self.backend.register_user(scratch, user_id)
+            stats = scratch[str(user_id)]
+        return stats
+
+    def apply(self, op, **args):
+        """
+        Run `backend.OPS[op](data, **args)`, journal it and return its result.
+        `args` must be JSON-serialisable so the event can be replayed.
+        """
+        return self.apply_many([(op, args)])[0]
+
+    def apply_many(self, ops):
+        """
+        Apply a batch of (op, args) pairs in order and return their results.
+
+        The whole batch is one journal write (a single fsync) and one
+        dirty mark, and each index is updated once per touched player
+        rather than once per op.
+        """
+        results, events, saved = self._apply(ops)
+        if events:
+            with stage('storage'):
+                try:
+                    self._on_io(self._write, events, results)
+                except Exception:
+                    self._rollback(saved, events)
+                    raise
+            self._written()
+        return results
+
+    async def commit(self, op, **args):
+        """`apply` for the event loop: the disk writes run on the I/O thread."""
+        return (await self.commit_many([(op, args)]))[0]
+
+    async def commit_many(self, ops):
+        """`apply_many` for the event loop; returns once the batch is journaled."""
+        ids = [op_players(args) for _, args in ops]
+        async with self.locks.hold(self.data if not all(ids) else (u for i in ids for u in i)):
+            results, events, saved = self._apply(ops)
+            if events:
+                with stage('storage'):
+                    try:
+                        await asyncio.get_running_loop().run_in_executor(self.io, self._write, events, results)
+                    except Exception:
+                        self._rollback(saved, events)     # still under the batch's locks
+                        raise
+                self._written()
+        return results
+
+    def transaction(self, *user_ids):
+        """Hold these players' locks for an `async with` block (see the class docstring)."""
+        return self.locks.hold(user_ids)
+
+    def exclusive(self):
+        """
+        `transaction` for the whole league: every player's lock, and no
+        commit for anyone else (a new player) starts until the block ends.
+        """
+        return self.locks.hold_all(self.data)
+
+    async def run_io(self, fn, *args):
+        """Run a disk read on the I/O thread, after every write queued before it."""
+        return await asyncio.get_running_loop().run_in_executor(self.io, fn, *args)
+
+    def _on_io(self, fn, *args):
+        # the sync side's storage calls run on the I/O thread too (the SQLite connection
+        # is only ever used there); once that has been shut down, on this one
+        try:
+            future = self.io.submit(fn, *args)
+        except RuntimeError:
+            return fn(*args)
+        return future.result()
+
+    async def drain(self):
+        """Wait until every queued write has reached the disk."""
+        await self.run_io(lambda: None)
+
+    def _apply(self, ops):
+        # the in-memory half: run the ops, update indexes, build the events
+        results, events, touched = [], [], set()
+        everyone = False
+        saved, seq = {}, self.seq
+        with stage('rating'):
+            try:
+                for op, args in ops:
+                    ids = op_players(args)
+                    # an op that names no player (e.g. a season reset) may touch anyone
+                    everyone = everyone or not ids
+                    # league-wide ops only reassign top-level fields, so a shallow copy will do
+                    for uid in (ids or self.data):
+                        if uid not in saved:
+                            entry = self.data.get(uid)
+                            saved[uid] = None if entry is None else copy.copy(entry) if not ids else copy.deepcopy(entry)
+                    results.append(self.backend.OPS[op](self.data, **args))
+                    touched.update(ids)
+                    self.seq += 1
+                    events.append({'seq': self.seq, 'op': op, 'args': args})
+            except Exception:
+                self._undo(saved)
+                self.seq = seq
+                raise
+        if not events:
+            return results, events, saved
+
+        if everyone:
+            self.dirty_ids.update(self.data)
+            for index in self.indexes:
+                index.build(self.data)
+        else:
+            self.dirty_ids.update(str(uid) for uid in touched)
+            for uid in touched:
+                entry = self.data[str(uid)]
+                for index in self.indexes:
+                    index.update(str(uid), entry)
+        return results, events, saved
+
+    def _undo(self, saved):
+        # put back the entries a failed batch had saved; None means it registered them.
+        # The backend does it, so anything it keeps beside the entries (pairs.py) follows.
+        self.backend.restore_players(self.data, saved)
+
+    def _rollback(self, saved, events):
+        # a batch that was applied but never journaled; its seqs stay used (other commits
+        # may have taken later ones meanwhile), which only leaves a gap in the journal
+        print(f"Journal write of {len(events)} op(s) to {self.path} failed; rolled them back")
+        self._undo(saved)
+        if any(not op_players(e['args']) for e in events):
+            for index in self.indexes:
+                index.build(self.data)
+            return
+        for uid in saved:
+            entry = self.data.get(uid)
+            for index in self.indexes:
+                if entry is None:
+                    index.remove(uid)
+                else:
+                    index.update(uid, entry)
+
+    def _write(self, events, results):
+        # the disk half, on the I/O thread. Once the journal has the events they are
+        # committed, so an archive failure after that is reported, not raised
+        if self.journal is not None:
+            self.journal.append_many(events)
+            for event in events:
+                self.backend.OPS[event['op']](self.shadow, **event['args'])
+            self.shadow_seq = events[-1]['seq']
+        try:
+            for archive in self.archives:
+                for event, result in zip(events, results):
+                    archive.record(event['seq'], event['op'], event['args'], result)
+        except Exception as e:
+            print(f"Archiving ops {events[0]['seq']}-{events[-1]['seq']} of {self.path} failed: {e}")
+
+    def _written(self):
+        self.mark_dirty()
+        if self.journal is not None and self.journal.count >= self.compact_events:
+            self._flush_now()
+
+    def sync_log(self):
+        """
+        Hand the journal's events to the event log now rather than at the
+        next flush. Runs on the I/O thread (`run_io`), so a checkpoint it
+        takes is of `shadow`.
+        """
+        if self.log is not None:
+            self.log.append(self.journal.read(), self.shadow, self.shadow_seq)
+
+    def mark_dirty(self):
+        if not self.dirty:
+            self.dirty = True
+            self._dirty_since = time.monotonic()
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return   # no loop (scripts, shutdown) - caller flushes explicitly
+
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+
+        waited = time.monotonic() - self._dirty_since
+        delay = max(0.0, min(self.flush_delay, self.max_flush_delay - waited))
+        self._flush_handle = loop.call_later(delay, self._flush_now)
+
+    def _flush_now(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+        else:
+            asyncio.ensure_future(self.flush_async())
+
+    def _flush_job(self):
+        """
+        Capture what this flush writes (on the caller's thread, so it is
+        consistent with `seq`) and return the function that writes it.
+        With a journal that is just `seq`: the job runs on the I/O thread
+        after every event up to `seq` was replayed into `shadow`, and
+        before any later one.
+        """
+        archives, seq = list(self.archives), self.seq
+        if self.journal is not None:
+            log, journal, shadow = self.log, self.journal, self.shadow
+
+            def job():
+                text = json.dumps(shadow, indent=2, default=json_default)
+                for archive in archives:
+                    archive.sync()
+                if log is not None:
+                    log.append(journal.read(), shadow if log.due(seq) else None, seq)
+                write_snapshot_text(self.path, text, seq)
+                journal.reset()
+        else:
+            if self.backend.STORAGE == 'sqlite':
+                rows = {uid: copy.deepcopy(self.data[uid]) for uid in self.dirty_ids if uid in self.data}
+                args = (rows, list(rows))
+            else:
+                args = (copy.deepcopy(self.data),)
+
+            def job():
+                for archive in archives:
+                    archive.sync()
+                self.backend.save_data(*args)
+        return job
+
+    def _flushing(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self.dirty:
+            return None
+        job, ids = self._flush_job(), self.dirty_ids
+        self.dirty = False
+        self.dirty_ids = set()
+        self._dirty_since = None
+        return job, ids
+
+    def _flush_failed(self, ids):
+        self.dirty_ids |= ids
+        self.mark_dirty()
+
+    def flush(self):
+        """Write everything now, on this thread (start-up, shutdown, scripts)."""
+        pending = self._flushing()
+        if pending is None:
+            return False
+        job, ids = pending
+        try:
+            self._on_io(job)
+        except Exception:
+            self._flush_failed(ids)
+            raise
+        self.flushes += 1
+        return True
+
+    async def flush_async(self):
+        """`flush` for the event loop: the snapshot is written on the I/O thread."""
+        pending = self._flushing()
+        if pending is None:
+            return False
+        job, ids = pending
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.io, job)
+        except Exception as e:
+            print(f"Flush of {self.path} failed: {e}")
+            self._flush_failed(ids)
+            return False
+        self.flushes += 1
+        return True
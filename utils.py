@@ -1,3 +1,9 @@
+import json
+import os
+from collections import deque
+from collections.abc import Mapping
+
+
 def is_admin(member):
     return member.guild_permissions.administrator
 
@@ -12,3 +18,25 @@ def format_stats(user, stats):
 
 def has_role(member, role_ids):
     return any(role.id in role_ids for role in member.roles)
+
+def json_default(obj):
+    # match_history is a bounded deque in memory (see elo._append_single_history)
+    if isinstance(obj, deque):
+        return list(obj)
+    # players, head-to-heads and history entries are slotted records (see records.py),
+    # and a player's head_to_head is a view of the league's pair table (pairs.py)
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+def write_json_atomic(path, data, indent=2):
+    """
+    Write `data` to a temp file next to `path`, fsync it and rename it
+    over `path`, so a crash mid-write never leaves a half-written file.
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=indent, default=json_default)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)